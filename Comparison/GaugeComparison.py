@@ -0,0 +1,249 @@
+'''
+Comparison of collocated Parsivels (APUs) and Iowa dual-bucket gauges
+
+For each (apu, gauge) pair of a pairing table and a date range:
+1) the Parsivel DSD is computed day by day (ParsivelBatch.iter_dsd, the
+APU files are read from the Parsivel cache) and its rain accumulation
+is summed onto a common grid of interval minutes (TimeIndex.grid_index)
+2) the tips of gauge buckets A and B are read from the daily text files
+written by IowaGaugeRaw.save_iowa_gauge and binned onto the same grid
+(IowaGaugeRaw.align_to)
+3) bias, RMSE, correlation and accumulation ratio of the Parsivel against
+each bucket are computed over the whole period and for each rain event
+(RainEvents, events of the mean rain rate of both buckets)
+
+Grid intervals where the Parsivel has less than min_coverage of valid data,
+or days without a gauge file, are NaN and left out of the statistics.
+The pairs are independent and are run in a pool of worker processes
+(ParsivelBatch.run_tasks).
+
+Pairing table (read_pairs): one pair per line, '#' starts a comment
+apu06 NASA0043 Prairie Creek
+
+Example:
+import GaugeComparison as gc
+pairs = gc.read_pairs('pairs.txt')
+results,errors = gc.compare_network(pairs,'20151101','20160131',gauge_dir='/home/user/gauges/',
+                                    interval=60)
+gc.print_summary(results)
+results[('apu06','NASA0043')].stats['a']['accum_ratio']
+'''
+import os
+import sys
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','Gauge'))
+import TimeIndex as ti
+import RainEvents as rev
+import ParsivelBatch as pb
+import IowaGaugeRaw as igr
+
+buckets = ['a','b']
+
+
+def read_pairs(filename):
+    #list of (apu, gauge) pairs from a pairing table (see module documentation)
+    pairs = []
+    with open(filename) as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if len(fields) >= 2:
+                pairs.append((fields[0],fields[1]))
+    return pairs
+
+
+class PairSeries(ti.TimeIndexed):
+
+    '''
+    Parsivel and gauge data of one pair on the common grid
+    time: start of each interval (datetime64[s]), interval: length (minutes)
+    accum_parsivel, accum_a, accum_b: rain in each interval (mm, NaN = missing)
+    rate_parsivel, rate_a, rate_b: rain rates (mm/h)
+    coverage: fraction of each interval with valid Parsivel data
+    '''
+
+    _aligned = ['accum_parsivel','accum_a','accum_b','rate_parsivel','rate_a','rate_b',
+                'coverage']
+
+    def __init__(self,time,interval,accum_parsivel,accum_a,accum_b,coverage):
+        self.time = time
+        self.interval = interval
+        self.accum_parsivel = accum_parsivel
+        self.accum_a = accum_a
+        self.accum_b = accum_b
+        self.rate_parsivel = accum_parsivel * 60. / interval
+        self.rate_a = accum_a * 60. / interval
+        self.rate_b = accum_b * 60. / interval
+        self.coverage = coverage
+
+
+class PairComparison(object):
+
+    '''
+    Result of compare_pair
+    series: PairSeries
+    stats: {'a': ..., 'b': ...} statistics of the Parsivel against each
+    bucket over the whole period (see pair_stats)
+    events: RainEvents of the mean gauge rain rate
+    event_stats: {'a': ..., 'b': ...} the same statistics for each event (arrays)
+    '''
+
+    def __init__(self,apu,gauge,series,stats,events,event_stats):
+        self.apu = apu
+        self.gauge = gauge
+        self.series = series
+        self.stats = stats
+        self.events = events
+        self.event_stats = event_stats
+
+
+def pair_stats(parsivel,gauge,interval,first,last):
+    '''
+    Statistics of the Parsivel rain rate against a gauge rain rate (mm/h)
+    at interval minutes over the rows first[i]..last[i] of each group i
+    (e.g. events), only intervals where both are valid are used
+    Returns a dict of arrays:
+    n: intervals used, bias: mean(parsivel - gauge) (mm/h), rmse (mm/h),
+    correlation: Pearson correlation of the rates,
+    accum_parsivel, accum_gauge: rain (mm), accum_ratio: parsivel/gauge accumulation
+    '''
+    both = np.isfinite(parsivel) & np.isfinite(gauge)
+    p = np.where(both,parsivel,0.)
+    g = np.where(both,gauge,0.)
+    def group_sum(values):
+        return rev.event_sum(values,first,last)
+    n = group_sum(both.astype(float))
+    sum_p,sum_g = group_sum(p),group_sum(g)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        mean_p,mean_g = sum_p/n,sum_g/n
+        cov = group_sum(p*g)/n - mean_p*mean_g
+        var_p = group_sum(p*p)/n - mean_p**2
+        var_g = group_sum(g*g)/n - mean_g**2
+        stats = {'n':n.astype(int),
+                 'bias':mean_p - mean_g,
+                 'rmse':np.sqrt(group_sum((p - g)**2)/n),
+                 'correlation':cov/np.sqrt(var_p*var_g),
+                 'accum_parsivel':sum_p*interval/60.,
+                 'accum_gauge':sum_g*interval/60.,
+                 'accum_ratio':sum_p/sum_g}
+    return stats
+
+
+def compare_pair(apu,gauge,start_date,end_date,gauge_dir,interval=60,time_interval=1,
+                 min_coverage=1.,threshold=0.1,max_gap=60,min_duration=0,use_cache=True,
+                 archive=None,config=None,qc=None,catalog=None):
+    '''
+    Compares one APU with one gauge from start_date to end_date (yyyymmdd, inclusive)
+    gauge_dir: directory of the daily gauge files (outdir of save_iowa_gauge)
+    interval: common grid interval (minutes), a multiple of time_interval
+    time_interval: Parsivel averaging interval (minutes)
+    min_coverage: smallest fraction of valid Parsivel data in a grid interval
+    threshold, max_gap, min_duration: rain events (see RainEvents.find_events)
+    use_cache, archive, config, qc: see ParsivelDSD.calc_dsd
+    catalog: ArchiveCatalog with the APU and gauge files (see ArchiveCatalog)
+    Returns a PairComparison object
+    '''
+    step = int(round(interval*60))
+    if step % int(round(time_interval*60)) != 0:
+        raise ValueError('interval must be a multiple of time_interval')
+    dates = pb.date_range(start_date,end_date)
+    first_day = np.datetime64(dates[0][0:4]+'-'+dates[0][4:6]+'-'+dates[0][6:8],'s')
+    ndays = len(dates)
+    grid = first_day + np.arange(ndays*86400 // step).astype(np.int64)*np.timedelta64(step,'s')
+    ngrid = len(grid)
+
+    #Parsivel: sum the rain of the valid intervals of each grid interval
+    accum = np.zeros(ngrid)
+    valid_minutes = np.zeros(ngrid)
+    for dsd in pb.iter_dsd(apu,start_date,end_date,time_interval=time_interval,chunk='day',
+                           use_cache=use_cache,archive=archive,config=config,qc=qc,
+                           catalog=catalog):
+        cell = dsd.grid_index(grid,interval)
+        use = (cell >= 0) & np.asarray(dsd.proc_p2.valid)
+        rain = np.asarray(dsd.rainaccum[0])[use]
+        accum += np.bincount(cell[use],weights=np.where(np.isfinite(rain),rain,0.),minlength=ngrid)
+        valid_minutes += np.bincount(cell[use],minlength=ngrid) * dsd.proc_p2.time_interval
+    if not valid_minutes.any():
+        raise IOError('No Parsivel data for '+apu+' from '+start_date+' to '+end_date)
+    coverage = valid_minutes / interval
+    accum[coverage < min_coverage - 1.e-9] = float('nan')
+
+    #gauges: tips of each bucket on the grid, NaN for days without a file
+    rawgauge = igr.read_iowa_gauge(gauge,dates,gauge_dir,catalog=catalog)
+    rates = rawgauge.align_to(grid,interval)
+    day = ((grid - first_day).astype(np.int64) // 86400).astype(int)
+    gauge_accum = {}
+    for bucket in buckets:
+        if catalog is not None:
+            have = np.array([catalog.gauge_file(gauge,date,bucket) is not None for date in dates])
+        else:
+            have = np.array([os.path.exists(igr.gauge_filename(gauge,date,bucket.upper(),gauge_dir))
+                             for date in dates])
+        gauge_accum[bucket] = np.where(have[day],getattr(rates,'accum_'+bucket),float('nan'))
+
+    series = PairSeries(grid,interval,accum,gauge_accum['a'],gauge_accum['b'],coverage)
+    everything = (np.array([0]),np.array([ngrid-1]))
+    stats = {}
+    event_stats = {}
+    with np.errstate(invalid='ignore'):
+        reference = (series.rate_a + series.rate_b) / 2.
+    events = rev.find_events(grid,reference,interval,threshold=threshold,max_gap=max_gap,
+                             min_duration=min_duration)
+    for bucket in buckets:
+        rate = getattr(series,'rate_'+bucket)
+        whole = pair_stats(series.rate_parsivel,rate,interval,*everything)
+        stats[bucket] = dict([(name,value[0]) for name,value in whole.items()])
+        event_stats[bucket] = pair_stats(series.rate_parsivel,rate,interval,events.first,events.last)
+    return PairComparison(apu,gauge,series,stats,events,event_stats)
+
+
+def compare_network(pairs,start_date,end_date,gauge_dir,processes=None,**kwargs):
+    '''
+    compare_pair for every (apu, gauge) pair, in a pool of worker processes
+    processes: number of workers (default: number of CPUs), 1 runs in this process
+    kwargs: passed to compare_pair
+    Returns two dicts keyed by (apu, gauge):
+    results: PairComparison of each pair that worked
+    errors: traceback string of each pair that failed
+    '''
+    tasks = [(apu,gauge,start_date,end_date,gauge_dir,_pair_kwargs(kwargs,apu,gauge,start_date,end_date))
+             for apu,gauge in pairs]
+    results = {}
+    errors = {}
+    keys = [task[0:2] for task in tasks]
+    for key,ok,result,seconds in pb.run_tasks(_run_pair,tasks,keys,processes):
+        if ok:
+            results[key] = result
+        else:
+            errors[key] = result
+    return results,errors
+
+
+def _pair_kwargs(kwargs,apu,gauge,start_date,end_date):
+    #each task only gets the catalog entries of its pair
+    catalog = kwargs.get('catalog')
+    if catalog is None:
+        return kwargs
+    kwargs = dict(kwargs)
+    kwargs['catalog'] = catalog.subset([apu,gauge],pb.date_range(start_date,end_date))
+    return kwargs
+
+
+def _run_pair(task):
+    #one pair of compare_network
+    apu,gauge,start_date,end_date,gauge_dir,kwargs = task
+    return compare_pair(apu,gauge,start_date,end_date,gauge_dir,**kwargs)
+
+
+def print_summary(results):
+    #one line per pair and bucket: intervals, bias, rmse, correlation, accumulation ratio
+    print '%-8s %-10s %s %6s %8s %8s %6s %7s %6s' % ('apu','gauge','b','n','bias','rmse',
+                                                    'corr','ratio','events')
+    for apu,gauge in sorted(results):
+        result = results[(apu,gauge)]
+        for bucket in buckets:
+            s = result.stats[bucket]
+            print '%-8s %-10s %s %6d %8.3f %8.3f %6.3f %7.3f %6d' % (apu,gauge,bucket,s['n'],
+                s['bias'],s['rmse'],s['correlation'],s['accum_ratio'],len(result.events))
@@ -0,0 +1,204 @@
+'''
+Concurrent download of Iowa gauge packets
+
+The Iowa server keeps one directory per gauge and day
+(server/NASAxxxx/yyyy/mm/dd/) with one small NASA* file per packet.
+PacketFetcher lists the directory and downloads the packets on a pool of
+threads that is kept for the life of the fetcher. Each thread keeps its
+own HTTP connection, so packets are pulled over a few keep-alive
+connections instead of one connection per file. close() (or a with
+block) stops the threads and closes the connections.
+
+Every request has a timeout and is retried with exponential backoff on
+network errors and 5xx responses.
+
+fetch downloads into a local mirror of the server tree
+(localdir/NASAxxxx/yyyymmdd/), packets that already exist there with the
+size reported by the server are not downloaded again. A gauge-day and the
+next day (nextdate) share the packets of the next day.
+
+Packets can also be kept in memory (fetch_bodies) and parsed directly
+by IowaGaugeRaw.read_packet_bodies, without touching the disk.
+
+The server url can be changed, e.g. to test against a local web server
+that serves a copy of the sensors directory tree (see tests/test_iowa_fetch.py).
+
+Example:
+with IowaFetch.PacketFetcher() as fetcher:
+    for gauge in gaugelist:
+        igr.save_iowa_gauge(yyyymmdd,gauge,outdir,outdir_meta,nextdate=yyyymmdd2,fetcher=fetcher)
+'''
+import os
+import time
+import socket
+import httplib
+import urlparse
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+iowa_server = 'http://s-iihr61.iihr.uiowa.edu/sensors/'
+
+
+class PacketFetcher(object):
+
+    '''
+    server: url of the sensors directory
+    max_workers: number of download threads (= open connections)
+    timeout: timeout of each request in seconds
+    retries: number of retries after a failed request
+    backoff: wait before the first retry in seconds, doubled on each retry
+    '''
+
+    def __init__(self,server=iowa_server,max_workers=8,timeout=30,retries=3,backoff=1.0):
+        self.server = server
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._local = threading.local()
+        self._pool = None
+        self._conns = [] #connections of all threads, closed by close()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def close(self):
+        #stops the download threads and closes their connections
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        with self._lock:
+            conns,self._conns = self._conns,[]
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+    def day_url(self,gauge,date):
+        #directory of one gauge-day (date: yyyymmdd)
+        return self.server+gauge+'/'+date[0:4]+'/'+date[4:6]+'/'+date[6:8]+'/'
+
+    def list_packets(self,gauge,date):
+        #returns the names of the packets (NASA*) of one gauge-day
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(self.get(self.day_url(gauge,date)),'html.parser')
+        packets = []
+        for tag in soup.findAll('a'):
+            filename = tag.get('href')
+            if filename is not None and filename[0:4] == "NASA":
+                packets.append(filename)
+        return packets
+
+    def fetch(self,gauge,dates,localdir):
+        '''
+        Downloads all packets of gauge for each date in dates to
+        localdir/gauge/yyyymmdd/packet.txt and returns the sorted list of
+        local files. Packets already there with the right size are kept
+        Raises IOError if a listing or packet can't be downloaded
+        '''
+        tasks = []
+        for d in dates:
+            path = self.day_url(gauge,d)
+            daydir = os.path.join(localdir,gauge,d)
+            if not os.path.isdir(daydir):
+                try:
+                    os.makedirs(daydir)
+                except OSError: #created by another job
+                    pass
+            for filename in self.list_packets(gauge,d):
+                tasks.append((path+filename,os.path.join(daydir,filename+'.txt')))
+        self._map(self._fetch_file,tasks)
+        return sorted([task[1] for task in tasks])
+
+    def fetch_bodies(self,gauge,dates):
+        '''
+        Downloads all packets of gauge for each date in dates into memory
+        Returns a list of (packet name, packet text) sorted by name
+        Raises IOError if a listing or packet can't be downloaded
+        '''
+        tasks = []
+        for d in dates:
+            path = self.day_url(gauge,d)
+            for filename in self.list_packets(gauge,d):
+                tasks.append((filename,path+filename))
+        bodies = self._map(self._fetch_body,tasks)
+        return sorted(zip([task[0] for task in tasks],bodies))
+
+    def get(self,url):
+        #body of url (GET)
+        return self._request('GET',url)[1]
+
+    def _map(self,function,tasks):
+        if len(tasks) == 0:
+            return []
+        if self._pool is None:
+            self._pool = ThreadPool(self.max_workers)
+        return self._pool.map(function,tasks)
+
+    def _fetch_body(self,task):
+        return self.get(task[1])
+
+    def _fetch_file(self,task):
+        url,filename = task
+        if os.path.exists(filename):
+            headers = self._request('HEAD',url)[0]
+            size = headers.get('content-length')
+            if size is not None and int(size) == os.path.getsize(filename):
+                return filename
+        body = self.get(url)
+        #unique partial file, other jobs may download the same packet
+        fd,tmpname = tempfile.mkstemp(dir=os.path.dirname(filename),suffix='.part')
+        try:
+            with os.fdopen(fd,'wb') as f:
+                f.write(body)
+            os.rename(tmpname,filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+        return filename
+
+    def _connection(self,scheme,host):
+        #one keep-alive connection per thread and host
+        key = (scheme,host)
+        conns = getattr(self._local,'conns',None)
+        if conns is None:
+            conns = self._local.conns = {}
+        if key not in conns:
+            if scheme == 'https':
+                conns[key] = httplib.HTTPSConnection(host,timeout=self.timeout)
+            else:
+                conns[key] = httplib.HTTPConnection(host,timeout=self.timeout)
+            with self._lock:
+                self._conns.append(conns[key])
+        return conns[key]
+
+    def _request(self,method,url):
+        #returns (headers, body), retrying with backoff on errors
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?'+parts.query
+        wait = self.backoff
+        for attempt in range(self.retries+1):
+            conn = self._connection(parts.scheme,parts.netloc)
+            try:
+                conn.request(method,path)
+                response = conn.getresponse()
+                body = response.read()
+                if response.status == 200:
+                    return dict(response.getheaders()),body
+                error = IOError(str(response.status)+' '+response.reason+': '+url)
+                if response.status < 500:
+                    raise error
+            except (socket.error,httplib.HTTPException) as e:
+                conn.close()
+                error = IOError(str(e)+': '+url)
+            if attempt < self.retries:
+                time.sleep(wait)
+                wait *= 2
+        raise error
@@ -19,33 +19,163 @@ user can input the next day (yyyymmdd string). The extra tips from days that are
 not 'date' are removed, as well as duplicates. 
 '''
 import os
+import sys
 import pdb
+import copy
+import time
+import glob
+import fractions
 import numpy as np
 import datetime
 
-def save_iowa_gauge(date,gauge,outdir,outdir_meta,nextdate = None):
-    
-    tmpdir = '/home/disk/funnel/olympex/archive2/wxdata/Gauge/tmpdir/'
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Parsivel'))
+import TimeIndex as ti
+
+tip_depth = 0.254 #mm of rain per tip
+
+def save_iowa_gauge(date,gauge,outdir,outdir_meta,nextdate = None,tmpdir = None,
+                    fetcher = None,stats = None):
+    '''
+    Downloads, cleans and writes the tips of one gauge-day
+
+    tmpdir = None
+    None: packets are kept in memory and parsed directly
+    directory: packets are downloaded to tmpdir/gauge/yyyymmdd/ and kept, a
+    rerun only downloads the packets that are new or changed (see IowaFetch)
+    Either way several gauges can be processed at the same time
+
+    fetcher: IowaFetch.PacketFetcher used for the downloads (optional)
+    stats: PipelineStats object (Parsivel/PipelineStats.py) to fill in (optional)
+    '''
 
     rawgauge = IowaGaugeRaw(gauge,date)
 
+    files = None
+    t0 = time.time()
     try:
-        rawgauge.import_packets(tmpdir,gauge,nextdate=nextdate)
+        if tmpdir is None:
+            bodies = rawgauge.fetch_packets(gauge,nextdate=nextdate,fetcher=fetcher)
+        else:
+            files = rawgauge.import_packets(tmpdir,gauge,nextdate=nextdate,fetcher=fetcher)
     except:
         print 'No packets found for '+rawgauge.gauge+' '+rawgauge.date
         return
+    t1 = time.time()
 
-    rawgauge.read_packets(tmpdir)
-
-    #delete all packets
-    rawgauge.delete_packets(tmpdir)
+    if files is None:
+        rawgauge.read_packet_bodies(bodies)
+    else:
+        rawgauge.read_packet_files(files)
+    t2 = time.time()
 
     #clean data
     rawgauge.clean_data()
+    t3 = time.time()
 
     #write text files
     rawgauge.write_text_files(outdir,outdir_meta)
 
+    if stats is not None:
+        stats.add_time('gauge_fetch',t1-t0)
+        stats.add_time('gauge_parse',t2-t1)
+        stats.add_time('gauge_clean',t3-t2)
+        stats.add_time('gauge_write',time.time()-t3)
+        stats.count('packets_read',rawgauge.packets_read)
+        stats.count('tips_read',rawgauge.bucket_tips)
+        stats.count('duplicate_tips',rawgauge.duplicate_tips)
+        stats.count('other_day_tips',rawgauge.other_day_tips)
+
+
+def gauge_filename(gauge,date,bucket,indir):
+    #daily tip file of bucket 'A' or 'B' written by write_text_files
+    return indir+date[0:6]+'/'+date+'/'+gauge+'_'+bucket+'_'+\
+           date[0:4]+'-'+date[4:6]+'-'+date[6:8]+'.txt'
+
+
+def read_iowa_gauge(gauge,dates,indir,catalog=None):
+    '''
+    Reads the daily A/B tip files written by write_text_files for a list of
+    dates (yyyymmdd) and returns one IowaGaugeRaw object holding the tips of
+    all days (e.g. for rain_rates over several days)
+    indir: same as outdir in save_iowa_gauge
+    catalog: ArchiveCatalog (Parsivel/ArchiveCatalog.py) to take the files
+    from instead of checking indir for each day
+    Days without files are skipped
+    '''
+    rawgauge = IowaGaugeRaw(gauge,dates[0])
+    times = {'A':[],'B':[]}
+    for date in dates:
+        for bucket in ['A','B']:
+            if catalog is not None:
+                filename = catalog.gauge_file(gauge,date,bucket)
+            else:
+                filename = gauge_filename(gauge,date,bucket,indir)
+            if filename is None or (catalog is None and not os.path.exists(filename)):
+                continue
+            with open(filename) as f:
+                lines = f.read().splitlines()
+            header = lines[0].split()
+            rawgauge.lat = float(header[1])
+            rawgauge.lon = float(header[2])
+            times[bucket].extend([line for line in lines[1:] if line.strip()])
+    rawgauge.time_a = np.array(times['A'],dtype='datetime64[s]')
+    rawgauge.time_b = np.array(times['B'],dtype='datetime64[s]')
+    rawgauge.rain_a = np.zeros(len(rawgauge.time_a)) + tip_depth
+    rawgauge.rain_b = np.zeros(len(rawgauge.time_b)) + tip_depth
+    return rawgauge
+
+
+def _makedirs(path):
+    #mkdir -p that tolerates other jobs creating the same directory
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def _time_strings(times):
+    #datetime64 array to list of 'yyyy-mm-dd hh:mm:ss' strings
+    times = np.asarray(times,dtype='datetime64[s]')
+    return [t.replace('T',' ') for t in np.datetime_as_string(times)]
+
+
+def _time_selection(times,start,end):
+    #rows of times in [start, end) (see TimeIndex.time_range): a slice if times
+    #is sorted, else the rows in their original order (packet order before clean_data)
+    times = ti.to_datetime64(times)
+    if len(times) > 1 and np.any(times[1:] < times[:-1]):
+        order = np.argsort(times,kind='mergesort')
+        first,last = ti.time_range(times[order],start,end)
+        return np.sort(order[first:last])
+    first,last = ti.time_range(times,start,end)
+    return slice(first,last)
+
+
+class GaugeRainRate(object):
+
+    '''
+    Rain accumulation and rain rate of both buckets of an Iowa gauge
+    at one time interval
+
+    time: start of each interval (datetime64[s])
+    interval: length of the intervals (minutes)
+    accum_a, accum_b: rain in each interval (mm)
+    rate_a, rate_b: rain rate in each interval (mm/h)
+    agree: True where both buckets agree to within 1 tip or agree_tol
+    (fraction of the larger accumulation)
+    '''
+
+    def __init__(self,time,interval,accum_a,accum_b,agree_tol=0.2):
+        self.time = time
+        self.interval = interval
+        self.accum_a = accum_a
+        self.accum_b = accum_b
+        self.rate_a = accum_a * 60. / interval
+        self.rate_b = accum_b * 60. / interval
+        tolerance = np.maximum(tip_depth,agree_tol*np.maximum(accum_a,accum_b))
+        self.agree = np.abs(accum_a - accum_b) <= tolerance + 1.e-9
+
 
 class IowaGaugeRaw(object):
     '''
@@ -67,117 +197,235 @@ class IowaGaugeRaw(object):
         self.rssi = []
         self.rain_a = []
         self.rain_b = []
+        self.tip_time = [] #time of all tips in the packets (datetime64[s])
+        self.tip_channel = [] #bucket of all tips (81 = a, 82 = b)
+        self.bucket_tips = 0 #tips of buckets a and b in the packets (before clean_data)
+        self.packets_read = 0
+        self.duplicate_tips = 0 #removed by clean_data
+        self.other_day_tips = 0 #tips not from date, removed by clean_data
         
     
-    def import_packets(self,tmpdir,gauge,nextdate=None):
-        #import packets to a temporary directory 
-        from bs4 import BeautifulSoup
-        import urllib2
-        import urllib
+    def import_packets(self,tmpdir,gauge,nextdate=None,fetcher=None):
+        #import packets to tmpdir/gauge/yyyymmdd/, returns the list of packet files
+        #packets are downloaded concurrently (see IowaFetch.PacketFetcher)
+        import IowaFetch
+
+        if fetcher is None:
+            fetcher = IowaFetch.PacketFetcher()
 
         if nextdate == None:
             dates = [self.date]
         else:
             dates = [self.date,nextdate]
 
-        for d in dates:
-            path = 'http://s-iihr61.iihr.uiowa.edu/sensors/'+gauge+'/'+d[0:4]+'/'+d[4:6]+'/'+d[6:8]+'/'
-            page1 = urllib2.urlopen(path)
-            soup = BeautifulSoup(page1)
+        return fetcher.fetch(gauge,dates,tmpdir)
 
-            for tag in soup.findAll('a'):
-                filename = tag.get('href')
-                if filename[0:4] == "NASA":
-                    urllib.urlretrieve(path+filename, \
-                       filename = tmpdir+filename+'.txt')
+                             
+    def fetch_packets(self,gauge,nextdate=None,fetcher=None):
+        #download packets into memory, returns [(packet name, packet text)]
+        import IowaFetch
 
-                    #print 'Got '+filename
+        if fetcher is None:
+            fetcher = IowaFetch.PacketFetcher()
+
+        if nextdate == None:
+            dates = [self.date]
+        else:
+            dates = [self.date,nextdate]
+
+        return fetcher.fetch_bodies(gauge,dates)
 
-                             
     def read_packets(self,tmpdir):
-        import glob
         searchfor= tmpdir+'NASA*'
+        self.read_packet_files(sorted(glob.glob(searchfor)))
+
+    def read_packet_files(self,files):
         #read each text file, append variables
-        for infile in sorted(glob.glob(searchfor)):
+        for infile in files:
             with open(infile, 'r') as f:
-                for i,line in enumerate(f):
-                    if i == 1: #only grab metatime for current day
-                        year = int(line.split()[0].split('-')[0])
-                        mon = int(line.split()[0].split('-')[1])
-                        day = int(line.split()[0].split('-')[2])
-                        hr = int(line.split()[1].split(':')[0])
-                        minute = int(line.split()[1].split(':')[1])
-                        sec = int(line.split()[1].split(':')[2])
-                        if day == int(self.date[6:8]):
-                            self.metatime.append(datetime.datetime(year,mon,day,hr,minute,sec))
-                    elif i == 2:
-                        self.lat = float(line.split(',')[0]) #should stay the same
-                        self.lon = float(line.split(',')[1]) 
-                    elif i == 3 and day == int(self.date[6:8]): #only grab for current day
-                        metadata = line.split(',')
-                        try:
-                            self.voltage.append(float(metadata[0]))
-                            self.temperature.append(float(metadata[1]))
-                            self.wetness.append(float(metadata[2]))
-                            self.solar.append(float(metadata[3]))
-                            self.rssi.append(float(metadata[4])) #has to be converted?
-                        except: #sometimes bad data...
-                            self.voltage.append(-99)
-                            self.temperature.append(-99)
-                            self.wetness.append(-99)
-                            self.solar.append(-99)
-                            self.rssi.append(-99)
-                    elif i > 4:
-                        td = line.split(',')[0]
-                        year = int(td.split()[0].split('-')[0])
-                        mon = int(td.split()[0].split('-')[1])
-                        day = int(td.split()[0].split('-')[2])
-                        hr = int(td.split()[1].split(':')[0])
-                        minute = int(td.split()[1].split(':')[1])
-                        sec = int(td.split()[1].split(':')[2])
-                        if int(line.split(',')[1]) == 81: #gauge a
-                            self.time_a.append(datetime.datetime(year,mon,day,hr,minute,sec))
-                            self.rain_a.append(0.254)
-                        if int(line.split(',')[1]) == 82: #gauge b
-                            self.time_b.append(datetime.datetime(year,mon,day,hr,minute,sec))
-                            self.rain_b.append(0.254)
-                    else:
-                        continue
+                self.parse_packet(f)
+        self.convert_tips()
+
+    def read_packet_bodies(self,bodies):
+        #parse packets held in memory: list of (packet name, packet text)
+        for name,body in sorted(bodies):
+            self.parse_packet(body.splitlines())
+        self.convert_tips()
+
+    def parse_packet(self,lines):
+        #parse the lines of one packet, append variables
+        #tip lines are only split here, convert_tips() converts them in bulk
+        self.packets_read += 1
+        day = None
+        for i,line in enumerate(lines):
+            if i == 1: #only grab metatime for current day
+                year = int(line.split()[0].split('-')[0])
+                mon = int(line.split()[0].split('-')[1])
+                day = int(line.split()[0].split('-')[2])
+                hr = int(line.split()[1].split(':')[0])
+                minute = int(line.split()[1].split(':')[1])
+                sec = int(line.split()[1].split(':')[2])
+                if day == int(self.date[6:8]):
+                    self.metatime.append(datetime.datetime(year,mon,day,hr,minute,sec))
+            elif i == 2:
+                self.lat = float(line.split(',')[0]) #should stay the same
+                self.lon = float(line.split(',')[1]) 
+            elif i == 3 and day == int(self.date[6:8]): #only grab for current day
+                metadata = line.split(',')
+                try:
+                    self.voltage.append(float(metadata[0]))
+                    self.temperature.append(float(metadata[1]))
+                    self.wetness.append(float(metadata[2]))
+                    self.solar.append(float(metadata[3]))
+                    self.rssi.append(float(metadata[4])) #has to be converted?
+                except: #sometimes bad data...
+                    self.voltage.append(-99)
+                    self.temperature.append(-99)
+                    self.wetness.append(-99)
+                    self.solar.append(-99)
+                    self.rssi.append(-99)
+            elif i > 4:
+                tip = line.split(',')
+                self.tip_time.append(tip[0].strip())
+                self.tip_channel.append(tip[1].strip())
+            else:
+                continue
+
+    def convert_tips(self):
+        #converts the tip lines of all packets to arrays, splits them by bucket
+        self.tip_time = np.array(self.tip_time,dtype='datetime64[s]')
+        self.tip_channel = np.array(self.tip_channel,dtype=np.str_).astype(int)
+        self.time_a = self.tip_time[self.tip_channel == 81] #gauge a
+        self.time_b = self.tip_time[self.tip_channel == 82] #gauge b
+        self.bucket_tips = len(self.time_a) + len(self.time_b)
+        self.rain_a = np.zeros(len(self.time_a)) + tip_depth
+        self.rain_b = np.zeros(len(self.time_b)) + tip_depth
 
     def clean_data(self):
-        #remove duplicates
-        self.time_a = sorted(list(set(self.time_a)))
-        self.rain_a = np.array(self.rain_a[0:len(self.time_a)])
-        self.time_b = sorted(list(set(self.time_b)))
-        self.rain_b = np.array(self.rain_b[0:len(self.time_b)])
-
-        #extract the day in order to filter the arrays
-        day_a = []
-        day_b = []
-        for tt in self.time_a:
-            day_a.append(tt.day)
-        for tt in self.time_b:
-            day_b.append(tt.day)
-
-        self.time_a = np.array(self.time_a)
-        self.time_b = np.array(self.time_b)
-        day_a = np.array(day_a)
-        day_b = np.array(day_b)
+        #remove duplicates (np.unique also sorts the tips)
+        ntips = len(self.time_a) + len(self.time_b)
+        self.time_a = np.unique(np.asarray(self.time_a,dtype='datetime64[s]'))
+        self.time_b = np.unique(np.asarray(self.time_b,dtype='datetime64[s]'))
+        nunique = len(self.time_a) + len(self.time_b)
+        self.duplicate_tips += ntips - nunique
 
         #remove data from wrong day
-        good_a = np.where((day_a == int(self.date[6:8])))[0]
-        good_b = np.where((day_b == int(self.date[6:8])))[0]
-
-        self.time_a = self.time_a[good_a]
-        self.time_b = self.time_b[good_b]
-        self.rain_a = self.rain_a[good_a]
-        self.rain_b = self.rain_b[good_b]
+        day_start = np.datetime64(self.date[0:4]+'-'+self.date[4:6]+'-'+self.date[6:8],'s')
+        day_end = day_start + np.timedelta64(1,'D')
+        self.time_a = self.time_a[(self.time_a >= day_start) & (self.time_a < day_end)]
+        self.time_b = self.time_b[(self.time_b >= day_start) & (self.time_b < day_end)]
+        self.other_day_tips += nunique - len(self.time_a) - len(self.time_b)
+        self.rain_a = np.zeros(len(self.time_a)) + tip_depth
+        self.rain_b = np.zeros(len(self.time_b)) + tip_depth
 
         #print 'cleaned data'
 
+    def rain_rates(self,intervals,start=None,end=None,agree_tol=0.2):
+        '''
+        Bins the tips of both buckets (tip_depth mm per tip) into rain
+        accumulations and rates at one or more time intervals
+
+        intervals: interval length in minutes, or a list of them
+        (e.g. [30,60,1440]); every interval must be a whole number of seconds
+        start, end: datetime64 range to bin (default: midnight before the
+        first tip or self.date to midnight after the last tip)
+        Intervals are counted from start, the last one may be partial
+
+        The tips are histogrammed once at the greatest common divisor of
+        the intervals, the coarser intervals are sums of that histogram
+
+        Returns a GaugeRainRate object, or a dict {interval: GaugeRainRate}
+        if intervals is a list
+        '''
+        single = np.ndim(intervals) == 0
+        intervals = np.atleast_1d(intervals)
+        seconds = np.round(intervals*60.).astype(np.int64)
+        if np.any(seconds <= 0) or np.any(np.abs(seconds - intervals*60.) > 1.e-6):
+            raise ValueError('intervals must be a positive whole number of seconds')
+        time_a = np.asarray(self.time_a,dtype='datetime64[s]')
+        time_b = np.asarray(self.time_b,dtype='datetime64[s]')
+        day = np.timedelta64(1,'D')
+        if start is None or end is None:
+            alltips = np.concatenate((time_a,time_b))
+            first = np.datetime64(self.date[0:4]+'-'+self.date[4:6]+'-'+self.date[6:8],'s')
+            last = first
+            if len(alltips) > 0:
+                first = min(first,alltips.min())
+                last = max(last,alltips.max())
+            if start is None:
+                start = first.astype('datetime64[D]').astype('datetime64[s]')
+            if end is None:
+                end = last.astype('datetime64[D]').astype('datetime64[s]') + day
+        start = np.datetime64(start,'s')
+        end = np.datetime64(end,'s')
+        span = int((end - start).astype(np.int64))
+
+        base = int(reduce(fractions.gcd,seconds))
+        nbase = -(-span // base)
+        counts = []
+        for tips in [time_a,time_b]:
+            offset = (tips - start).astype(np.int64)
+            offset = offset[(offset >= 0) & (offset < span)]
+            counts.append(np.bincount(offset // base,minlength=nbase))
+
+        rates = {}
+        for interval,sec in zip(intervals.tolist(),seconds):
+            factor = int(sec // base)
+            nbins = -(-nbase // factor)
+            accum = []
+            for count in counts:
+                padded = np.zeros(nbins*factor,dtype=count.dtype)
+                padded[0:nbase] = count
+                accum.append(padded.reshape((nbins,factor)).sum(axis=1) * tip_depth)
+            time = start + np.arange(nbins).astype(np.int64) * np.timedelta64(int(sec),'s')
+            rates[interval] = GaugeRainRate(time,interval,accum[0],accum[1],agree_tol=agree_tol)
+        if single:
+            return rates[intervals[0]]
+        return rates
+
+    def time_slice(self,start=None,end=None):
+        '''
+        Copy with the tips and metadata in [start, end)
+        start, end: datetime, datetime64 or string (None = open)
+        Sorted times (after clean_data) are cut with TimeIndex.time_range and
+        the new arrays are views of the original ones
+        '''
+        new = copy.copy(self)
+        groups = [('time_a',['rain_a']),('time_b',['rain_b']),('tip_time',['tip_channel']),
+                  ('metatime',['voltage','temperature','wetness','solar','rssi'])]
+        for name,aligned in groups:
+            selection = _time_selection(getattr(self,name),start,end)
+            for attr in [name] + aligned:
+                setattr(new,attr,ti.take(getattr(self,attr),selection))
+        return new
+
+    def nearest_tip(self,times,bucket='a',tolerance=None):
+        '''
+        Index in time_a (bucket = 'a') or time_b ('b') of the tip closest to
+        each of times (an int for one time), the tips must be sorted (clean_data)
+        tolerance: maximum distance (seconds), farther times get -1
+        '''
+        return ti.nearest(ti.to_datetime64(getattr(self,'time_'+bucket)),times,tolerance)
+
+    def align_to(self,grid_time,interval,agree_tol=0.2):
+        '''
+        Rain accumulation and rate of both buckets on another series' grid
+        (e.g. ProcessParsivel.time and time_interval), returns a GaugeRainRate
+        grid_time: sorted start times of the intervals (datetime64 or datetime)
+        interval: length of the intervals (minutes), the grid may have gaps
+        Tips outside every interval are not counted
+        '''
+        grid_time = ti.to_datetime64(grid_time)
+        accum = []
+        for tips in [self.time_a,self.time_b]:
+            cell = ti.grid_index(tips,grid_time,interval)
+            accum.append(np.bincount(cell[cell >= 0],minlength=len(grid_time)) * tip_depth)
+        return GaugeRainRate(grid_time,interval,accum[0],accum[1],agree_tol=agree_tol)
+
     def delete_packets(self,tmpdir):
         #empties the temporary directory
-        os.system('rm -rf '+tmpdir+'NASA*')
+        for packet in glob.glob(tmpdir+'NASA*'):
+            os.remove(packet)
         #print 'deleted all tmp packets'
 
     def write_text_files(self,outdir,outdir_meta):
@@ -187,10 +435,8 @@ class IowaGaugeRaw(object):
         time_a_out.append(self.gauge+' '+str(self.lat)+' '+str(self.lon))
         time_b_out = []
         time_b_out.append(self.gauge+' '+str(self.lat)+' '+str(self.lon))
-        for t in self.time_a:
-            time_a_out.append(t.strftime("%Y-%m-%d %H:%M:%S"))
-        for t in self.time_b:
-            time_b_out.append(t.strftime("%Y-%m-%d %H:%M:%S"))
+        time_a_out.extend(_time_strings(self.time_a))
+        time_b_out.extend(_time_strings(self.time_b))
 
         time_a_out = np.array(map(str,time_a_out))
         time_b_out = np.array(map(str,time_b_out))
@@ -198,11 +444,8 @@ class IowaGaugeRaw(object):
         title_b = self.gauge+'_B_'+self.date[0:4]+'-'+self.date[4:6]+'-'+self.date[6:8]+'.txt'
 
         #save gauge files
-        os.chdir(outdir)
-        os.system('mkdir -p ' + self.date[0:6])
         outdir2 = outdir+self.date[0:6]+'/'
-        os.chdir(outdir2)
-        os.system('mkdir -p ' + self.date)
+        _makedirs(outdir2+self.date)
         np.savetxt(outdir2+self.date+'/'+title_a,time_a_out,delimiter=' ',fmt="%s")
         np.savetxt(outdir2+self.date+'/'+title_b,time_b_out,delimiter=' ',fmt="%s")
         print 'saved '+title_a
@@ -217,11 +460,8 @@ class IowaGaugeRaw(object):
                            str(self.temperature[i])+','+str(self.wetness[i])+','+str(self.solar[i])+','+str(self.rssi[i]))
         metastr_out = np.array(map(str,metastr))
 
-        os.chdir(outdir_meta)
-        os.system('mkdir -p ' + self.date[0:6])
         outdir_meta2 = outdir_meta+self.date[0:6]+'/'
-        os.chdir(outdir_meta2)
-        os.system('mkdir -p ' + self.date)     
+        _makedirs(outdir_meta2+self.date)
         np.savetxt(outdir_meta2+self.date+'/'+title_meta,metastr_out,delimiter=' ',fmt="%s")
         print 'saved '+title_meta
 
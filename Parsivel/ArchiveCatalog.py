@@ -0,0 +1,264 @@
+'''
+Catalog of the Parsivel (APU) and Iowa gauge archives
+
+The archives are scanned once and every file is recorded in a JSON file
+with its instrument, date, hour, size, mtime and number of telegrams (APU
+files) or tips (gauge files). Availability and completeness queries and the
+file lists of the loaders (calc_dsd, calc_dsd_levels, batch_calc_dsd,
+iter_dsd, read_iowa_gauge) come from the catalog without listing
+directories.
+
+Scans are incremental: a directory whose mtime did not change since the
+last scan is not listed again (no files were added or removed), only its
+APU files with less than a full hour of telegrams are checked with
+os.stat, since an hourly file may still be growing. Files are only reread
+(to count telegrams) when their size or mtime changed. full=True lists and
+checks everything.
+
+Archive layout:
+Parsivel: archive/apuxx/Parsivel/yyyymm/apuxx_yyyymmddhh.dat
+Gauges: gauge_dir/yyyymm/yyyymmdd/NASAxxxx_A_yyyy-mm-dd.txt (save_iowa_gauge)
+
+The catalog file is $PYOLYMPEX_CATALOG or ~/.cache/pyolympex/catalog.json
+
+Example:
+import ArchiveCatalog as ac
+catalog = ac.ArchiveCatalog()
+catalog.scan_parsivel('/home/disk/funnel/olympex/archive2/')
+catalog.scan_gauges('/home/user/gauges/')
+catalog.save()
+catalog.dates('apu06','20151101','20151130'), catalog.completeness('apu06','20151208')
+dsd = pdsd.calc_dsd('apu06','apu06','20151208',catalog=catalog)
+'''
+import os
+import json
+import tempfile
+
+CATALOG_FILE = os.environ.get('PYOLYMPEX_CATALOG',
+    os.path.join(os.path.expanduser('~'),'.cache','pyolympex','catalog.json'))
+
+catalog_version = 1
+
+telegrams_per_hour = 360 #10 s telegrams
+telegrams_per_day = 24*telegrams_per_hour
+
+
+def count_telegrams(filename):
+    #lines of an APU file that start with a yyyymmddhhmmss; time stamp
+    with open(filename) as f:
+        return sum([1 for line in f if line[14:15] == ';'])
+
+
+def count_tips(filename):
+    #tips in a daily gauge file (the first line is the header)
+    with open(filename) as f:
+        return max(sum([1 for line in f if line.strip()]) - 1,0)
+
+
+def _parsivel_name(name):
+    #(instrument, date, hour) of apuxx_yyyymmddhh.dat, None for other files
+    if not name.endswith('.dat') or '_' not in name:
+        return None
+    instrument,stamp = name[0:-4].rsplit('_',1)
+    if len(stamp) != 10 or not stamp.isdigit():
+        return None
+    return instrument,stamp[0:8],stamp[8:10]
+
+
+def _gauge_name(name):
+    #(instrument, date, bucket) of NASAxxxx_A_yyyy-mm-dd.txt, None for other files
+    parts = name[0:-4].split('_') if name.endswith('.txt') else []
+    if len(parts) != 3 or parts[1] not in ('A','B'):
+        return None
+    date = parts[2].replace('-','')
+    if len(date) != 8 or not date.isdigit():
+        return None
+    return parts[0],date,parts[1]
+
+
+class ArchiveCatalog(object):
+
+    '''
+    files: {path: entry}, entry = {'kind': 'parsivel' or 'gauge',
+    'instrument', 'date' (yyyymmdd), 'hour' (hh, parsivel) or 'bucket'
+    ('A'/'B', gauge), 'size', 'mtime', 'telegrams' (tips for gauges)}
+    dirs: {directory: mtime at the last scan}
+    '''
+
+    def __init__(self,filename=None,load=True):
+        #load = False starts an empty catalog (the file is only used by save)
+        self.filename = filename or CATALOG_FILE
+        self.files = {}
+        self.dirs = {}
+        self._index = None
+        self._by_dir = {}
+        if load and os.path.exists(self.filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename) as f:
+            catalog = json.load(f)
+        if catalog.get('version') != catalog_version:
+            return
+        self.files = catalog['files']
+        self.dirs = catalog['dirs']
+        self._index = None
+
+    def save(self):
+        #written to a temporary file and moved into place
+        parent = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        fd,tmpname = tempfile.mkstemp(dir=parent,prefix='.tmp_')
+        try:
+            with os.fdopen(fd,'w') as f:
+                json.dump({'version':catalog_version,'files':self.files,'dirs':self.dirs},f)
+            os.rename(tmpname,self.filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    def scan_parsivel(self,archive,apus=None,full=False):
+        '''
+        Adds the APU files of archive (all APUs or a list) to the catalog
+        Returns the number of files that were added or updated
+        '''
+        archive = os.path.abspath(archive)
+        if apus is None:
+            apus = sorted(os.listdir(archive))
+        self._build_index()
+        changed = 0
+        for apu in apus:
+            apudir = os.path.join(archive,apu,'Parsivel')
+            if not os.path.isdir(apudir):
+                continue
+            for month in sorted(os.listdir(apudir)):
+                if len(month) == 6 and month.isdigit():
+                    changed += self._scan_dir(os.path.join(apudir,month),'parsivel',full)
+        self._index = None
+        return changed
+
+    def scan_gauges(self,gauge_dir,full=False):
+        '''
+        Adds the daily gauge files of gauge_dir (outdir of save_iowa_gauge)
+        Returns the number of files that were added or updated
+        '''
+        gauge_dir = os.path.abspath(gauge_dir)
+        self._build_index()
+        changed = 0
+        for month in sorted(os.listdir(gauge_dir)):
+            monthdir = os.path.join(gauge_dir,month)
+            if len(month) != 6 or not month.isdigit() or not os.path.isdir(monthdir):
+                continue
+            for day in sorted(os.listdir(monthdir)):
+                if len(day) == 8 and day.isdigit():
+                    changed += self._scan_dir(os.path.join(monthdir,day),'gauge',full)
+        self._index = None
+        return changed
+
+    def _scan_dir(self,directory,kind,full):
+        #the index is built by scan_parsivel/scan_gauges before the directories are scanned
+        mtime = os.stat(directory).st_mtime
+        known = self._by_dir.get(directory,[])
+        changed = 0
+        if not full and self.dirs.get(directory) == mtime:
+            #no files added or removed, only growing APU files are checked
+            check = [path for path in known if self.files[path]['kind'] == 'parsivel' and
+                     self.files[path]['telegrams'] < telegrams_per_hour]
+        else:
+            check = [os.path.join(directory,name) for name in sorted(os.listdir(directory))]
+            for path in set(known) - set(check):
+                del self.files[path]
+                changed += 1
+        parse = _parsivel_name if kind == 'parsivel' else _gauge_name
+        for path in check:
+            fields = parse(os.path.basename(path))
+            if fields is None:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError: #removed since the directory was listed
+                self.files.pop(path,None)
+                continue
+            entry = self.files.get(path)
+            if entry is not None and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                continue
+            entry = {'kind':kind,'instrument':fields[0],'date':fields[1],
+                     'size':st.st_size,'mtime':st.st_mtime}
+            if kind == 'parsivel':
+                entry['hour'] = fields[2]
+                entry['telegrams'] = count_telegrams(path)
+            else:
+                entry['bucket'] = fields[2]
+                entry['telegrams'] = count_tips(path)
+            self.files[path] = entry
+            changed += 1
+        self.dirs[directory] = mtime
+        return changed
+
+    def subset(self,instruments,dates):
+        #catalog of the files of some instruments and dates only (e.g. to send to a worker)
+        subset = ArchiveCatalog(self.filename,load=False)
+        for kind in ('parsivel','gauge'):
+            for instrument in instruments:
+                for date in dates:
+                    for path in self._paths(kind,instrument,date):
+                        subset.files[path] = self.files[path]
+        return subset
+
+    def _build_index(self):
+        #(kind, instrument, date) -> sorted paths, directory -> paths
+        index = {}
+        by_dir = {}
+        for path,entry in self.files.items():
+            index.setdefault((entry['kind'],entry['instrument'],entry['date']),[]).append(path)
+            by_dir.setdefault(os.path.dirname(path),[]).append(path)
+        for paths in index.values():
+            paths.sort()
+        self._index = index
+        self._by_dir = by_dir
+
+    def _paths(self,kind,instrument,date):
+        if self._index is None:
+            self._build_index()
+        return self._index.get((kind,instrument,date),[])
+
+    def parsivel_files(self,apu,date):
+        #sorted hourly files of an APU-day (yyyymmdd), [] if there are none
+        return list(self._paths('parsivel',apu,date))
+
+    def gauge_file(self,gauge,date,bucket):
+        #daily file of gauge bucket 'A' or 'B', None if there is none
+        for path in self._paths('gauge',gauge,date):
+            if self.files[path]['bucket'] == bucket.upper():
+                return path
+        return None
+
+    def instruments(self,kind='parsivel'):
+        return sorted(set([entry['instrument'] for entry in self.files.values()
+                           if entry['kind'] == kind]))
+
+    def dates(self,instrument,start_date=None,end_date=None,kind='parsivel'):
+        #sorted dates (yyyymmdd) with files, optionally from start_date to end_date
+        if self._index is None:
+            self._build_index()
+        dates = [key[2] for key in self._index if key[0] == kind and key[1] == instrument]
+        return sorted([d for d in dates if (start_date is None or d >= start_date) and
+                       (end_date is None or d <= end_date)])
+
+    def telegrams(self,instrument,date,kind='parsivel'):
+        #telegrams (or gauge tips) recorded for one day
+        return sum([self.files[path]['telegrams'] for path in self._paths(kind,instrument,date)])
+
+    def hours(self,apu,date):
+        #hours (hh) of an APU-day with files
+        return [self.files[path]['hour'] for path in self._paths('parsivel',apu,date)]
+
+    def completeness(self,apu,date):
+        #fraction of the 8640 telegrams of a day that are in the files
+        return self.telegrams(apu,date) / float(telegrams_per_day)
+
+    def availability(self,apu,start_date,end_date):
+        #{date: completeness} of an APU for every date that has files
+        return dict([(date,self.completeness(apu,date))
+                     for date in self.dates(apu,start_date,end_date)])
@@ -0,0 +1,239 @@
+'''
+Compressed archive of the raw 10 s Parsivel telegrams
+
+Each APU-day is one zip file with a compressed chunk per hourly APU file.
+A chunk holds the RawParsivel arrays of that file (ParsivelCache.cached_arrays)
+as .npy members, so the dtypes and values come back exactly as they were
+read from the .dat text. index.json lists the chunks with their first and
+last telegram time, so a time range query only decompresses the chunks it
+needs.
+
+Layout: outdir/apuxx/yyyymm/apuxx_yyyymmdd.zip
+index.json: version, apu, sources ([path, size, mtime] of the .dat files)
+and chunks: [{'name': yyyymmddhh, 'first', 'last' (seconds since 1970, None
+for a chunk without telegrams), 'telegrams', 'bad_lines', 'apu'}]
+hh/<array>.npy: arrays of the chunk
+
+read_day returns the same RawParsivel arrays as read_parsivel of the .dat
+files of the day, read_archive the telegrams of [start, end) over any number
+of days. convert_archive converts the .dat archive in bulk, days whose
+.dat files are unchanged since they were converted are skipped.
+
+Example:
+import ParsivelArchive as pa
+results,errors = pa.convert_archive('/home/disk/funnel/olympex/archive2/','/home/user/telegrams/',
+                                    apus=['apu06'],start_date='20151101',end_date='20160131')
+raw = pa.read_archive('apu06','2015-12-08T03:00','2015-12-08T05:00','/home/user/telegrams/')
+dsd = pdsd.ParsivelDSD(pp.process_parsivel(raw))
+'''
+import io
+import os
+import glob
+import json
+import zipfile
+import tempfile
+import numpy as np
+import RawParsivel as rp
+import ParsivelCache as pc
+import ParsivelBatch as pb
+import TimeIndex as ti
+
+archive_version = 1
+
+
+def archive_path(apu,date,outdir):
+    #zip file of an APU-day (yyyymmdd)
+    return os.path.join(outdir,apu,date[0:6],apu+'_'+date+'.zip')
+
+
+def read_index(filename):
+    #index.json of a day file
+    with zipfile.ZipFile(filename) as zf:
+        return json.loads(zf.read('index.json'))
+
+
+def is_current(filename,infiles):
+    #True if filename was converted from infiles and they are unchanged
+    try:
+        index = read_index(filename)
+    except (IOError,OSError,ValueError,KeyError,zipfile.BadZipfile):
+        return False
+    return index['version'] == archive_version and index['sources'] == pc.source_stamp(infiles)
+
+
+def _seconds(times):
+    return times.astype('datetime64[s]').astype(np.int64)
+
+
+def write_day(apu,date,infiles,outdir,config=None):
+    '''
+    Converts the hourly .dat files of an APU-day (sorted) to its zip file
+    The file is written to a temporary file and moved into place
+    Returns the name of the zip file
+    '''
+    filename = archive_path(apu,date,outdir)
+    parent = os.path.dirname(filename)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError: #created by another worker
+            pass
+    chunks = []
+    fd,tmpname = tempfile.mkstemp(dir=parent,prefix='.tmp_')
+    try:
+        with os.fdopen(fd,'wb') as f:
+            with zipfile.ZipFile(f,'w',zipfile.ZIP_DEFLATED) as zf:
+                for infile in infiles:
+                    raw = rp.read_parsivel([infile],use_cache=False,config=config)
+                    name = os.path.basename(infile)[-14:-4]
+                    chunk = {'name':name,'first':None,'last':None,'telegrams':len(raw.time),
+                             'bad_lines':raw.bad_lines,'apu':raw.apu}
+                    if len(raw.time) > 0:
+                        seconds = _seconds(raw.time)
+                        chunk['first'] = int(seconds.min())
+                        chunk['last'] = int(seconds.max())
+                    for array in pc.cached_arrays:
+                        data = io.BytesIO()
+                        np.save(data,np.ascontiguousarray(getattr(raw,array)))
+                        zf.writestr(name[8:10]+'/'+array+'.npy',data.getvalue())
+                    chunks.append(chunk)
+                index = {'version':archive_version,'apu':apu,
+                         'sources':pc.source_stamp(infiles),'chunks':chunks}
+                zf.writestr('index.json',json.dumps(index))
+        os.rename(tmpname,filename)
+    finally:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+    return filename
+
+
+def _read_chunks(filename,raw,arrays,start=None,end=None):
+    '''
+    Adds the arrays of the chunks of a day file that have telegrams in
+    [start, end) (seconds, None = open) to arrays (dict of lists)
+    Returns the chunks that were read
+    '''
+    chunks = []
+    with zipfile.ZipFile(filename) as zf:
+        index = json.loads(zf.read('index.json'))
+        for chunk in index['chunks']:
+            if chunk['telegrams'] > 0 and \
+               ((start is not None and chunk['last'] < start) or
+                (end is not None and chunk['first'] >= end)):
+                continue
+            for array in pc.cached_arrays:
+                data = io.BytesIO(zf.read(chunk['name'][8:10]+'/'+array+'.npy'))
+                arrays[array].append(np.lib.format.read_array(data))
+            if chunk['telegrams'] > 0:
+                raw.apu = chunk['apu']
+            raw.bad_lines += chunk['bad_lines']
+            chunks.append(chunk)
+    return chunks
+
+
+def _raw_parsivel(raw,arrays):
+    #fills raw with the concatenated arrays of the chunks
+    for array in pc.cached_arrays:
+        if len(arrays[array]) > 0:
+            setattr(raw,array,np.concatenate(arrays[array]))
+    return raw
+
+
+def read_day(apu,date,indir,config=None):
+    '''
+    RawParsivel object of an APU-day (yyyymmdd) from its zip file, the same
+    arrays as read_parsivel of the .dat files the day was converted from
+    Raises IOError if the day is not in the archive
+    '''
+    filename = archive_path(apu,date,indir)
+    if not os.path.exists(filename):
+        raise IOError('No archived telegrams for '+apu+' '+date+' in '+indir)
+    raw = rp.RawParsivel(config=config)
+    arrays = dict([(array,[]) for array in pc.cached_arrays])
+    _read_chunks(filename,raw,arrays)
+    return _raw_parsivel(raw,arrays)
+
+
+def read_archive(apu,start,end,indir,config=None):
+    '''
+    RawParsivel object with the telegrams of an APU in [start, end)
+    start, end: datetime, datetime64 or string
+    Only the chunks with telegrams in [start, end) are decompressed,
+    bad_lines are the bad lines of those chunks
+    Raises IOError if no day of the range is in the archive
+    '''
+    start,end = ti.to_datetime64(start),ti.to_datetime64(end)
+    first_day = start.astype('datetime64[D]')
+    last_day = (end - np.timedelta64(1,'s')).astype('datetime64[D]')
+    raw = rp.RawParsivel(config=config)
+    arrays = dict([(array,[]) for array in pc.cached_arrays])
+    found = False
+    for day in np.arange(first_day,last_day + np.timedelta64(1,'D')):
+        filename = archive_path(apu,str(day).replace('-',''),indir)
+        if os.path.exists(filename):
+            _read_chunks(filename,raw,arrays,_seconds(start),_seconds(end))
+            found = True
+    if not found:
+        raise IOError('No archived telegrams for '+apu+' from '+str(start)+' to '+str(end))
+    raw = _raw_parsivel(raw,arrays)
+    #telegrams of the chunks that are outside [start, end)
+    inside = (raw.time >= start) & (raw.time < end)
+    if not inside.all():
+        raw = raw._take(np.flatnonzero(inside))
+    return raw
+
+
+def convert_archive(archive,outdir,apus=None,start_date=None,end_date=None,overwrite=False,
+                    processes=None,config=None,catalog=None):
+    '''
+    Converts the .dat files of archive (archive/apuxx/Parsivel/yyyymm/) to
+    zip files in outdir, one task per APU-day in a pool of worker processes
+    apus: list of APUs (default: all in the archive or catalog)
+    start_date, end_date: yyyymmdd (inclusive, None = open)
+    overwrite: False skips the days that are already converted and unchanged
+    processes: number of workers (default: number of CPUs), 1 runs in this process
+    catalog: ArchiveCatalog to take the APU-days and files from (see ArchiveCatalog)
+    Returns two dicts keyed by (apu, date):
+    results: zip filename of each day that was converted
+    errors: traceback string of each day that failed
+    '''
+    days = _archive_days(archive,apus,start_date,end_date,catalog)
+    tasks = [(apu,date,infiles,outdir,config) for (apu,date),infiles in sorted(days.items())
+             if overwrite or not is_current(archive_path(apu,date,outdir),infiles)]
+    print str(len(days))+' APU-days, '+str(len(days)-len(tasks))+' already converted'
+    results = {}
+    errors = {}
+    keys = [task[0:2] for task in tasks]
+    for key,ok,result,seconds in pb.run_tasks(_run_day,tasks,keys,processes):
+        if ok:
+            results[key] = result
+        else:
+            errors[key] = result
+    return results,errors
+
+
+def _archive_days(archive,apus,start_date,end_date,catalog):
+    #{(apu, date): sorted .dat files} of the APU-days to convert
+    if apus is None:
+        if catalog is not None:
+            apus = catalog.instruments()
+        else:
+            apus = sorted([apu for apu in os.listdir(archive)
+                           if os.path.isdir(os.path.join(archive,apu,'Parsivel'))])
+    days = {}
+    for apu in apus:
+        if catalog is not None:
+            for date in catalog.dates(apu,start_date,end_date):
+                days[(apu,date)] = catalog.parsivel_files(apu,date)
+            continue
+        for infile in sorted(glob.glob(os.path.join(archive,apu,'Parsivel','*',apu+'_*.dat'))):
+            date = os.path.basename(infile)[len(apu)+1:len(apu)+9]
+            if (start_date is None or date >= start_date) and (end_date is None or date <= end_date):
+                days.setdefault((apu,date),[]).append(infile)
+    return days
+
+
+def _run_day(task):
+    #one APU-day of convert_archive
+    apu,date,infiles,outdir,config = task
+    return write_day(apu,date,infiles,outdir,config=config)
@@ -0,0 +1,299 @@
+'''
+Batch processing of many APU-days
+
+batch_calc_dsd runs the read -> process -> DSD chain (ParsivelDSD.calc_dsd)
+for every (apu, date) in a list of APUs and a date range. The days are
+independent, so they are spread over a pool of worker processes.
+
+Each task is run inside its own try/except: a missing or corrupt day is
+reported in the error list and the rest of the run continues. run_tasks is
+the pool and progress runner, also used by ParsivelArchive.convert_archive
+and GaugeComparison.compare_network.
+
+iter_dsd goes through a long date range of one APU in day (or hour)
+chunks and yields the DSD of each chunk as soon as it is done. Only one
+chunk is held in memory at a time; the telegrams of an interval that
+crosses a chunk boundary (e.g. 7-min intervals at midnight) are carried
+over to the next chunk, so the intervals are the same as when the whole
+range is averaged at once.
+
+Example:
+import ParsivelBatch as pb
+results,errors = pb.batch_calc_dsd(['apu01','apu06'],'20151101','20160131',
+                                   time_interval=5,outdir='/home/user/dsd/')
+for dsd in pb.iter_dsd('apu06','20151101','20160131',time_interval=7):
+    print dsd.time[0], np.nansum(dsd.rainrate[0])
+'''
+import os
+import time
+import datetime
+import traceback
+import multiprocessing
+import numpy as np
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelDSD as pdsd
+import PipelineStats as ps
+import ParsivelConfig as pcfg
+
+
+def date_range(start_date,end_date):
+    #list of yyyymmdd strings from start_date to end_date (inclusive)
+    start = datetime.datetime.strptime(start_date,'%Y%m%d')
+    end = datetime.datetime.strptime(end_date,'%Y%m%d')
+    ndays = (end - start).days + 1
+    return [(start + datetime.timedelta(days=i)).strftime('%Y%m%d') for i in range(ndays)]
+
+
+def batch_calc_dsd(apus,start_date,end_date,time_interval=1,outdir=None,
+                   processes=None,use_cache=True,archive=None,stats=None,config=None,qc=None,
+                   catalog=None):
+    '''
+    Computes the DSD for every APU and every day from start_date to end_date
+    (yyyymmdd strings, inclusive)
+
+    outdir = None
+    None: the ParsivelDSD objects are returned (without the 10 s data)
+    directory: each day is saved to outdir/apuxx/apuxx_yyyymmdd_dsd.npz
+    (see ParsivelDSD.save_dsd) and the filename is returned instead
+
+    processes: number of worker processes (default: number of CPUs)
+    1 runs all tasks in this process
+
+    stats: PipelineStats object, the stats of every day that worked are added to it
+    config: ParsivelConfig or name (see ParsivelConfig)
+    qc: ParsivelQC object (see ParsivelQC)
+    catalog: ArchiveCatalog to take the APU-days and files from (see ArchiveCatalog)
+
+    Returns two dicts keyed by (apu, date):
+    results: ParsivelDSD object or .npz filename for each day that worked
+    errors: traceback string for each day that failed
+    '''
+    #each task only gets the catalog entries of its APU-day
+    tasks = [(apu,date,time_interval,outdir,use_cache,archive,stats is not None,config,qc,
+              catalog if catalog is None else catalog.subset([apu],[date]))
+             for apu in apus for date in date_range(start_date,end_date)]
+    results = {}
+    errors = {}
+    task_time = 0.0
+    t0 = time.time()
+    keys = [task[0:2] for task in tasks]
+    for key,ok,result,seconds in run_tasks(_run_task,tasks,keys,processes):
+        task_time += seconds
+        if ok:
+            results[key],task_stats = result
+            if stats is not None:
+                stats.merge(task_stats)
+        else:
+            errors[key] = result
+
+    wall = time.time() - t0
+    print 'Batch summary: '+str(len(results))+' ok, '+str(len(errors))+' failed, '+\
+          str(len(tasks))+' tasks'
+    print 'Wall time %.1f s, task time %.1f s, mean %.2f s per task' % \
+          (wall,task_time,task_time/max(len(tasks),1))
+    for key in sorted(errors):
+        print 'failed: '+key[0]+' '+key[1]
+    return results,errors
+
+
+def run_tasks(function,tasks,keys,processes=None):
+    '''
+    Runs function(task) for every task in a pool of worker processes and
+    yields (key, ok, result, seconds) as the tasks finish (in any order)
+    function: module-level function (it is pickled by name for the workers)
+    keys: key of each task (tuple of strings), printed in the progress lines
+    processes: number of workers (default: number of CPUs), 1 runs in this process
+    ok is False if function raised, result is then the traceback string
+    '''
+    jobs = [(function,i,task) for i,task in enumerate(tasks)]
+    if processes == 1:
+        outputs = (_run_job(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        outputs = pool.imap_unordered(_run_job,jobs)
+    try:
+        for n,(i,ok,result,seconds) in enumerate(outputs):
+            name = ' '.join(keys[i])
+            if not ok:
+                print 'failed '+name+': '+result.strip().split('\n')[-1]
+            print '['+str(n+1)+'/'+str(len(tasks))+'] '+name+' %.1f s' % seconds
+            yield keys[i],ok,result,seconds
+    finally:
+        if processes != 1:
+            pool.close()
+            pool.join()
+
+
+def _run_job(job):
+    #worker: one task; never raises so one bad task can't stop the pool
+    function,i,task = job
+    t0 = time.time()
+    try:
+        return i,True,function(task),time.time()-t0
+    except Exception:
+        return i,False,traceback.format_exc(),time.time()-t0
+
+
+def _run_task(task):
+    #one (apu, date) of batch_calc_dsd, returns the DSD (or .npz filename) and the stats
+    apu,date,time_interval,outdir,use_cache,archive,with_stats,config,qc,catalog = task
+    stats = ps.PipelineStats() if with_stats else None
+    dsd = pdsd.calc_dsd(apu,apu,date,time_interval=time_interval,
+                        use_cache=use_cache,archive=archive,stats=stats,config=config,
+                        qc=qc,catalog=catalog)
+    if outdir is not None:
+        apudir = os.path.join(outdir,apu)
+        if not os.path.isdir(apudir):
+            try:
+                os.makedirs(apudir)
+            except OSError: #created by another worker
+                pass
+        result = os.path.join(apudir,apu+'_'+date+'_dsd.npz')
+        pdsd.save_dsd(dsd,result)
+    else:
+        #drop the 10 s data so that only the averaged data is sent back
+        dsd.proc_p2.raw_parsivel = None
+        dsd.proc_p2.processed_matrix = None
+        dsd.proc_p2.qc_mask = None
+        result = dsd
+    return result,stats
+
+
+def iter_dsd(apu,start_date,end_date,time_interval=1,chunk='day',remove_bins=None,
+             remove_missing=True,use_cache=True,archive=None,stats=None,config=None,qc=None,
+             catalog=None):
+    '''
+    Generator of ParsivelDSD objects for one APU from start_date to end_date
+    (yyyymmdd strings, inclusive), one object per chunk of files
+
+    chunk: 'day' or 'hour' (one hourly APU file at a time)
+    remove_bins, remove_missing: see ProcessParsivel
+    use_cache, archive, stats, config, qc, catalog: see ParsivelDSD.calc_dsd
+    (the QC hysteresis is applied to each chunk of files separately)
+
+    The intervals are those of all telegrams, including the ones flagged bad
+    by the QC, as in ProcessParsivel.time_averaging: an interval with only
+    bad telegrams is NaN-filled
+
+    Chunks without files are skipped. Missing intervals between chunks are
+    NaN-filled (remove_missing = True) and yielded in pieces of at most one
+    chunk, so memory does not depend on the length of the range or of gaps
+    '''
+    if chunk not in ('day','hour'):
+        raise ValueError("chunk must be 'day' or 'hour'")
+    if archive is None:
+        archive = pdsd.archive_dir
+    interval_seconds = int(round(time_interval*60))
+    if interval_seconds <= 0 or interval_seconds % 10 != 0:
+        raise ValueError('time interval must be a positive multiple of 10 s')
+    chunk_bins = max((86400 if chunk == 'day' else 3600) // interval_seconds,1)
+
+    carry = None #telegrams of the interval still open at the end of the last chunk
+    next_bin = None #first interval not yielded yet
+    config = pcfg.get_config(config)
+    args = (chunk_bins,interval_seconds,time_interval,remove_missing,stats,config)
+    for files,chunk_start,chunk_end in _chunk_files(apu,start_date,end_date,chunk,archive,catalog):
+        start_bin = pp.interval_index(np.array([chunk_start]),interval_seconds)[0]
+        if carry is not None and pp.interval_index(carry[0],interval_seconds).max() < start_bin:
+            #files missing after the last chunk, the carried interval is finished
+            for dsd in _yield_records(carry,next_bin,*args):
+                yield dsd
+            next_bin = pp.interval_index(carry[0],interval_seconds).max() + 1
+            carry = None
+        records = _read_records(files,remove_bins,use_cache,stats,config,qc)
+        if carry is not None:
+            records = [np.concatenate((c,r)) for c,r in zip(carry,records)]
+            carry = None
+        bins = pp.interval_index(records[0],interval_seconds)
+        if next_bin is not None and (bins < next_bin).any():
+            #telegrams of intervals that were already yielded
+            late = bins < next_bin
+            records = [r[~late] for r in records]
+            bins = bins[~late]
+        if len(bins) == 0:
+            continue
+        cut_bin = pp.interval_index(np.array([chunk_end]),interval_seconds)[0]
+        done = bins < cut_bin #intervals that can't get more telegrams from later chunks
+        if not done.all():
+            carry = [r[~done] for r in records]
+        if done.any():
+            for dsd in _yield_records([r[done] for r in records],next_bin,*args):
+                yield dsd
+            next_bin = bins[done].max() + 1
+
+    if carry is not None:
+        for dsd in _yield_records(carry,next_bin,*args):
+            yield dsd
+
+
+def _yield_records(records,next_bin,chunk_bins,interval_seconds,time_interval,
+                   remove_missing,stats,config):
+    #NaN-filled intervals from next_bin up to the records (in pieces of
+    #chunk_bins), then the intervals of the records
+    bins = pp.interval_index(records[0],interval_seconds)
+    first_bin,last_bin = bins.min(),bins.max()
+    if next_bin is not None and remove_missing:
+        empty = [np.array([],dtype='datetime64[s]'),np.zeros((0,1024),dtype=np.uint16),
+                 np.zeros(0,dtype=int),np.zeros(0),np.zeros(0,dtype=int),np.zeros(0,dtype=bool)]
+        for start in range(int(next_bin),int(first_bin),chunk_bins):
+            yield _records_dsd(empty,start,min(start + chunk_bins,int(first_bin)) - 1,
+                               interval_seconds,time_interval,remove_missing,stats,config)
+    yield _records_dsd(records,first_bin,last_bin,interval_seconds,time_interval,
+                       remove_missing,stats,config)
+
+
+def _chunk_files(apu,start_date,end_date,chunk,archive,catalog):
+    #yields (files, start and end of chunk as datetime64[s]) for each day or hour with files
+    if catalog is not None:
+        dates = catalog.dates(apu,start_date,end_date)
+    else:
+        dates = date_range(start_date,end_date)
+    for date in dates:
+        try:
+            infiles = pdsd.apu_files(apu,date,archive=archive,catalog=catalog)
+        except IOError:
+            continue
+        if chunk == 'day':
+            if len(infiles) > 0:
+                day = np.datetime64(date[0:4]+'-'+date[4:6]+'-'+date[6:8],'s')
+                yield infiles,day,day + np.timedelta64(1,'D')
+        else:
+            for infile in infiles:
+                stamp = os.path.basename(infile).split('_')[-1][0:10] #yyyymmddhh
+                hour = np.datetime64(stamp[0:4]+'-'+stamp[4:6]+'-'+stamp[6:8]+'T'+stamp[8:10],'s')
+                yield [infile],hour,hour + np.timedelta64(1,'h')
+
+
+def _read_records(files,remove_bins,use_cache,stats,config,qc):
+    #time, processed matrix, error code, temperature, wxcode and QC bad flag of
+    #all telegrams of the files (the bad ones still count for the interval range)
+    raw = rp.read_parsivel(files,use_cache=use_cache,stats=stats,config=config)
+    processed = pp.ProcessParsivel(raw,qc=qc)
+    t0 = time.time()
+    processed.apply_matrix(remove_bins=remove_bins)
+    if stats is not None:
+        stats.add_time('apply_matrix',time.time()-t0)
+    return [raw.time,processed.processed_matrix,np.asarray(raw.error_code),
+            np.asarray(raw.temperature),np.asarray(raw.wxcode),processed.qc_mask.bad]
+
+
+def _records_dsd(records,first_bin,last_bin,interval_seconds,time_interval,remove_missing,
+                 stats,config):
+    #ParsivelDSD of the intervals first_bin to last_bin (without the telegrams flagged bad)
+    t0 = time.time()
+    good = ~records[5]
+    if not good.all():
+        records = [r[good] for r in records]
+    sums = pp.IntervalSums.from_records(*(records[0:5]+[interval_seconds]),
+                                        first_bin=first_bin,last_bin=last_bin)
+    processed = pp.ProcessParsivel(config=config)
+    processed.set_averages(sums,time_interval,remove_missing=remove_missing)
+    if stats is not None:
+        stats.add_time('time_averaging',time.time()-t0)
+        stats.count('intervals',len(processed.num_records))
+        stats.count('intervals_nan_filled',np.count_nonzero(~processed.valid))
+    dsd = pdsd.ParsivelDSD(processed)
+    dsd.get_precip_params(stats=stats)
+    return dsd
+
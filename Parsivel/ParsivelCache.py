@@ -0,0 +1,209 @@
+'''
+On-disk cache of parsed Parsivel files
+
+Each list of APU files (normally one day) read by RawParsivel is stored as
+a directory of .npy files plus a small manifest.json that records the path,
+size and modification time of every source file. The arrays are loaded
+with np.load(mmap_mode='r'), so a cached day is a set of read-only,
+zero-copy views of the files on disk.
+
+A cache entry is only used if every source file still has the same size
+and mtime; otherwise the files are reparsed and the entry rewritten.
+When an entry is written, the other entries of the same APU-day whose
+source files have changed (e.g. the day before its last hourly file was
+added) are removed.
+
+prune(cache_dir,max_bytes,max_age_days) bounds the cache: it removes
+entries with changed or missing source files, entries not used for
+max_age_days, and then the least recently used entries until the cache
+holds at most max_bytes. Loading an entry marks it as used (the mtime of
+its manifest.json).
+
+The cache directory is $PYOLYMPEX_CACHE or ~/.cache/pyolympex/parsivel
+'''
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+CACHE_DIR = os.environ.get('PYOLYMPEX_CACHE',
+    os.path.join(os.path.expanduser('~'),'.cache','pyolympex','parsivel'))
+
+#RawParsivel arrays saved in the cache (all have time as first dimension)
+cached_arrays = ['time','error_code','temperature','ndrops','rain','dbz',
+                 'visibility','wxcode','matrix']
+
+cache_version = 1
+
+
+def cache_path(filenames,cache_dir=None):
+    '''
+    Returns the cache directory of a list of APU files
+    Named after the first file (e.g. apu06_20151208) plus a hash of all paths
+    '''
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    paths = [os.path.abspath(f) for f in filenames]
+    key = hashlib.sha1('\n'.join(paths).encode('utf-8')).hexdigest()[0:12]
+    name = os.path.splitext(os.path.basename(paths[0]))[0][0:14]
+    return os.path.join(cache_dir,name+'_'+key)
+
+
+def source_stamp(filenames):
+    #[path, size, mtime] of each source file, used to invalidate the cache
+    stamp = []
+    for f in filenames:
+        st = os.stat(f)
+        stamp.append([os.path.abspath(f),st.st_size,st.st_mtime])
+    return stamp
+
+
+def load(raw_parsivel,filenames,cache_dir=None):
+    '''
+    Fills raw_parsivel with memory-mapped arrays from the cache
+    Returns False (and leaves raw_parsivel untouched) if there is no valid
+    cache entry for filenames
+    '''
+    if len(filenames) == 0:
+        return False
+    path = cache_path(filenames,cache_dir)
+    try:
+        with open(os.path.join(path,'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != cache_version or \
+           manifest['sources'] != source_stamp(filenames):
+            return False
+        arrays = {}
+        for name in cached_arrays:
+            arrays[name] = np.load(os.path.join(path,name+'.npy'),mmap_mode='r')
+    except (IOError,OSError,ValueError,KeyError):
+        return False
+    for name in cached_arrays:
+        setattr(raw_parsivel,name,arrays[name])
+    raw_parsivel.apu = manifest['apu']
+    raw_parsivel.bad_lines = manifest['bad_lines']
+    try: #last use, for prune
+        os.utime(os.path.join(path,'manifest.json'),None)
+    except OSError:
+        pass
+    return True
+
+
+def save(raw_parsivel,filenames,cache_dir=None):
+    '''
+    Writes the arrays of raw_parsivel to the cache entry of filenames
+    The entry is written to a temporary directory and moved into place,
+    so readers never see a partial entry
+    '''
+    if len(filenames) == 0:
+        return
+    path = cache_path(filenames,cache_dir)
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmppath = tempfile.mkdtemp(dir=parent,prefix='.tmp_')
+    try:
+        for name in cached_arrays:
+            np.save(os.path.join(tmppath,name+'.npy'),
+                    np.ascontiguousarray(getattr(raw_parsivel,name)))
+        manifest = {'version':cache_version,
+                    'sources':source_stamp(filenames),
+                    'apu':raw_parsivel.apu,
+                    'bad_lines':raw_parsivel.bad_lines}
+        with open(os.path.join(tmppath,'manifest.json'),'w') as f:
+            json.dump(manifest,f)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmppath,path)
+    finally:
+        if os.path.isdir(tmppath):
+            shutil.rmtree(tmppath)
+    _remove_stale(path)
+
+
+def _read_manifest(path):
+    #manifest of a cache entry, None if it can't be read
+    try:
+        with open(os.path.join(path,'manifest.json')) as f:
+            return json.load(f)
+    except (IOError,OSError,ValueError):
+        return None
+
+
+def is_stale(manifest):
+    #True if the source files of a cache entry changed or were removed
+    if manifest is None or manifest.get('version') != cache_version:
+        return True
+    for path,size,mtime in manifest['sources']:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+        if st.st_size != size or st.st_mtime != mtime:
+            return True
+    return False
+
+
+def _remove_stale(path):
+    #removes the other entries with the same name (APU-day) as path that are stale
+    parent,entry = os.path.split(path)
+    name = entry.rsplit('_',1)[0]
+    for other in os.listdir(parent):
+        if other != entry and other.rsplit('_',1)[0] == name and \
+           is_stale(_read_manifest(os.path.join(parent,other))):
+            shutil.rmtree(os.path.join(parent,other),ignore_errors=True)
+
+
+def _entry_size(path):
+    return sum([os.path.getsize(os.path.join(path,f)) for f in os.listdir(path)])
+
+
+def prune(cache_dir=None,max_bytes=None,max_age_days=None):
+    '''
+    Removes stale cache entries (source files changed or removed), entries
+    not used for max_age_days, then the least recently used entries until
+    the cache is at most max_bytes (None: no limit)
+    Returns the number of entries removed and the bytes freed
+    '''
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return 0,0
+    now = time.time()
+    entries = []
+    removed,freed = 0,0
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir,entry)
+        if not os.path.isdir(path):
+            continue
+        try:
+            size = _entry_size(path)
+            if entry.startswith('.tmp_'):
+                #left by an interrupted save (a save in progress is younger than a day)
+                remove = now - os.path.getmtime(path) > 86400
+                used = None
+            else:
+                used = os.path.getmtime(os.path.join(path,'manifest.json'))
+                remove = is_stale(_read_manifest(path)) or \
+                         (max_age_days is not None and now - used > max_age_days*86400)
+        except OSError: #no manifest or removed meanwhile
+            remove,used,size = True,None,0
+        if remove:
+            shutil.rmtree(path,ignore_errors=True)
+            removed += 1
+            freed += size
+        elif used is not None:
+            entries.append((used,size,path))
+    if max_bytes is not None:
+        total = sum([size for used,size,path in entries])
+        for used,size,path in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path,ignore_errors=True)
+            total -= size
+            removed += 1
+            freed += size
+    return removed,freed
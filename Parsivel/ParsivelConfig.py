@@ -0,0 +1,292 @@
+'''
+Parsivel instrument configurations
+
+One ParsivelConfig holds the bin tables of a Parsivel setup as read-only
+numpy arrays, together with the constants that are derived from them:
+effective laser area and drop volume of each diameter bin, powers of the
+diameter for the moments, 1/fall speed for the drop concentration and the
+liquid/frozen conditional matrices. They are computed once when the
+configuration is created and shared by RawParsivel, ProcessParsivel and
+ParsivelDSD (all take config=).
+
+Registered configurations:
+parsivel1: bin centers and fall speeds of the Tokay et al. (2014) / IDL
+             code (default, used for all OLYMPEX processing so far)
+parsivel2: bin centers and widths from the OTT Parsivel2 manual,
+             measured velocity class centers as fall speeds
+
+The diameter and velocity bins must tile: the upper edge of each bin
+(center + spread/2) is the lower edge of the next one (ValueError otherwise).
+
+Custom setups can be created from another configuration, e.g.
+import ParsivelConfig as pcfg
+config = pcfg.get_config('parsivel1').replace('parsivel1_vclass',fall_speed=pcfg.v_parsivel)
+pcfg.register(config)
+dsd = pdsd.calc_dsd(apu,sitename,date,config='parsivel1_vclass')
+'''
+import numpy as np
+
+#bin tables (to right = larger diameter, down = faster fall velocity)
+drop_diameter = [
+      0.064, 0.193, 0.321, 0.45, 0.579, 0.708, 0.836, 0.965, 1.094, 1.223, 1.416, 1.674,
+      1.931, 2.189, 2.446, 2.832, 3.347, 3.862, 4.378, 4.892, 5.665,
+      6.695, 7.725, 8.755, 9.785, 11.330, 13.390, 15.45, 17.51, 19.57, 22.145, 25.235]
+
+drop_diameter_ott = [
+      0.062, 0.187, 0.312, 0.437, 0.562, 0.687, 0.812, 0.937, 1.062, 1.187, 1.375, 1.625,
+      1.875, 2.125, 2.375, 2.750, 3.25, 3.75, 4.25, 4.75, 5.5, 6.5, 7.5, 8.5, 9.5, 11,
+      13, 15, 17, 19, 21.5, 24.5] #diameters from the OTT Parsivel2 manual
+
+drop_spread = [
+      0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.257,
+      0.257, 0.257, 0.257, 0.257, 0.515, 0.515, 0.515, 0.515, 0.515, 1.030, 1.030,
+      1.030, 1.030, 1.030, 2.060, 2.060, 2.060, 2.060, 2.060, 3.090, 3.090]
+
+drop_spread_ott = [0.125]*10 + [0.25]*5 + [0.5]*5 + [1.]*5 + [2.]*5 + [3.]*2 #OTT class widths
+
+v_parsivel = [
+      0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95, 1.1, 1.3, 1.5, 1.7, 1.9,
+      2.2, 2.6, 3, 3.4, 3.8, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
+      17.6, 20.8]
+
+v_idlcode = [
+      0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.854, 0.962, 1.128, 1.354, 1.588, 1.828, 2.075,
+      2.398, 2.782, 3.15, 3.502, 3.838, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
+      17.6, 20.8] #corrected fall speeds (Ali Tokay)
+
+v_spread = [.1, .1, .1, .1, .1, .1, .1, .1, .1, .1, .2, .2, .2, .2, .2, .4, .4,
+              .4, .4, .4, .8, .8, .8, .8, .8, 1.6, 1.6, 1.6, 1.6, 1.6, 3.2, 3.2]
+
+v_theoretical = [
+      0.089, 0.659, 1.239, 1.803, 2.353, 2.889, 3.404, 3.892,
+      4.329, 4.705, 5.217, 5.833, 6.389, 6.886, 7.326, 7.878,
+      8.424, 8.785, 9.002, 9.117, 9.173, 9.248, 9.323, 9.398,
+      9.473, 9.586, 9.735, 9.885, 10.035, 10.185, 10.372, 10.597] #Atlas et al. (1973) terminal velocity of each diameter bin
+
+vel1 = [
+    0.045, 0.329, 0.6200, 0.901, 1.177, 1.444, 1.702, 1.946, 2.165, 2.352,
+    2.608, 2.916,  3.194, 3.443, 3.663, 3.939, 4.212,  4.392, 4.501, 4.559,
+    4.587, 4.624,  4.6620, 4.699, 4.737, 4.793, 4.868,  4.943, 5.018,  5.093,
+    5.186, 5.299] #50% > v_theoretical
+
+vel2 = [
+    0.134, 0.988, 1.859, 2.704, 3.530, 4.333, 5.106, 5.837, 6.494, 7.057,
+    7.825, 8.749, 9.583, 10.33, 10.989, 11.816, 12.635, 13.177, 13.503, 13.676,
+    13.76, 13.873, 13.985, 14.097, 14.21, 14.378, 14.603, 14.828, 15.053, 15.278,
+    15.559, 15.896] #50% < v_theoretical
+
+#conditional matrices
+liquid_matrix = [
+      1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+#frozen matrix: velocity cutoff: 6 m/s, size cutoff 12 mm (Ali Tokay, personal communication)
+frozen_matrix = [
+      1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+      0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+
+class ParsivelConfig(object):
+
+    '''
+    name: name of the configuration (key in the registry)
+    diameter, diameter_spread: center and width of the 32 diameter bins (mm)
+    velocity, velocity_spread: center and width of the 32 velocity bins (m/s)
+    fall_speed: fall speed assigned to each velocity bin for the drop
+    concentration (m/s)
+    liquid_matrix, frozen_matrix: 1024 conditional matrix values (0/1)
+    beam_length, beam_width: size of the laser beam (mm)
+
+    All tables are stored as read-only arrays, derived constants:
+    area: effective laser area of each diameter bin, subtracting off partial
+    drops on the edge (mm^2)
+    volume: volume of one drop in each diameter bin (mm^3)
+    dpow: diameter**n (32, 8) for moments 0-7
+    diameter_edges, velocity_edges: the 33 bin edges (mm, m/s)
+    inv_fall_speed: 1/fall_speed
+    masks: (2,1024) boolean liquid (row 0) and frozen (row 1) matrices
+    '''
+
+    def __init__(self,name,diameter,diameter_spread,velocity,velocity_spread,fall_speed,
+                 liquid_matrix,frozen_matrix,beam_length=180.,beam_width=30.):
+        self.name = name
+        self.beam_length = beam_length
+        self.beam_width = beam_width
+        self.diameter = _frozen_array(diameter)
+        self.diameter_spread = _frozen_array(diameter_spread)
+        self.velocity = _frozen_array(velocity)
+        self.velocity_spread = _frozen_array(velocity_spread)
+        self.fall_speed = _frozen_array(fall_speed)
+        self.masks = _frozen_array([liquid_matrix,frozen_matrix],dtype=bool)
+        if np.shape(self.masks) != (2,1024):
+            raise ValueError('conditional matrices must have 1024 elements')
+        for table in (self.diameter,self.diameter_spread,self.velocity,
+                      self.velocity_spread,self.fall_speed):
+            if len(table) != 32:
+                raise ValueError('bin tables must have 32 elements')
+        self.diameter_edges = _frozen_array(bin_edges(self.diameter,self.diameter_spread,'diameter'))
+        self.velocity_edges = _frozen_array(bin_edges(self.velocity,self.velocity_spread,'velocity'))
+        d = self.diameter
+        self.area = _frozen_array(beam_length*(beam_width-(d/2.)))
+        self.volume = _frozen_array(np.pi*d**3/6)
+        self.dpow = _frozen_array(d[:,np.newaxis]**np.arange(8))
+        self.inv_fall_speed = _frozen_array(1./self.fall_speed)
+        self._removed_masks = {}
+
+    def conditional_masks(self,remove_bins=None):
+        '''
+        Returns the (2,1024) conditional masks with the diameter bins
+        remove_bins[0] to remove_bins[1] (inclusive) also removed, for every
+        velocity (see ProcessParsivel.apply_matrix)
+        The result is cached and read-only
+        Raises ValueError if remove_bins is not two bin numbers (0-31, first <= last)
+        '''
+        if remove_bins is None:
+            return self.masks
+        try:
+            first,last = [int(b) for b in remove_bins]
+        except (TypeError,ValueError):
+            raise ValueError('remove_bins must be a 2-element list, not '+repr(remove_bins))
+        if not 0 <= first <= last < 32:
+            raise ValueError('remove_bins must be diameter bins 0-31 with first <= last, not '+
+                             repr(remove_bins))
+        key = (first,last)
+        if key not in self._removed_masks:
+            masks = self.masks.copy()
+            #the masks are (velocity, diameter) matrices: clear the diameter columns
+            masks.reshape((2,32,32))[:,:,first:last+1] = False
+            masks.flags.writeable = False
+            self._removed_masks[key] = masks
+        return self._removed_masks[key]
+
+    def replace(self,name,**tables):
+        #new configuration with some of the tables (keyword arguments of __init__) changed
+        args = {'diameter':self.diameter,'diameter_spread':self.diameter_spread,
+                'velocity':self.velocity,'velocity_spread':self.velocity_spread,
+                'fall_speed':self.fall_speed,'liquid_matrix':self.masks[0],
+                'frozen_matrix':self.masks[1],'beam_length':self.beam_length,
+                'beam_width':self.beam_width}
+        args.update(tables)
+        return ParsivelConfig(name,**args)
+
+    def __reduce__(self):
+        #pickled by name for registered configurations (e.g. for worker processes)
+        if registry.get(self.name) is self:
+            return (get_config,(self.name,))
+        return (ParsivelConfig,(self.name,self.diameter,self.diameter_spread,self.velocity,
+                                self.velocity_spread,self.fall_speed,self.masks[0],
+                                self.masks[1],self.beam_length,self.beam_width))
+
+
+def bin_edges(centers,spread,name='bin',tolerance=2.e-3):
+    '''
+    The 33 edges of 32 bins (center +- spread/2)
+    Raises ValueError if the bins overlap or leave gaps (more than tolerance,
+    the tables are rounded to 0.001)
+    '''
+    centers = np.asarray(centers,dtype=float)
+    spread = np.asarray(spread,dtype=float)
+    lower = centers - spread/2.
+    upper = centers + spread/2.
+    mismatch = np.abs(upper[:-1] - lower[1:])
+    if np.any(mismatch > tolerance):
+        i = int(np.argmax(mismatch))
+        raise ValueError(name+' bins %d and %d do not tile: %.4f != %.4f' %
+                         (i,i+1,upper[i],lower[i+1]))
+    return np.append(lower,upper[-1])
+
+
+def _frozen_array(values,dtype=float):
+    array = np.array(values,dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+registry = {}
+
+def register(config):
+    #adds a configuration to the registry (replacing one with the same name)
+    registry[config.name] = config
+    return config
+
+def get_config(config=None):
+    '''
+    Returns a ParsivelConfig
+    config: None (default configuration), name of a registered
+    configuration or a ParsivelConfig (returned as is)
+    '''
+    if config is None:
+        return registry[default_config]
+    if isinstance(config,ParsivelConfig):
+        return config
+    try:
+        return registry[config]
+    except KeyError:
+        raise ValueError('unknown Parsivel configuration: '+str(config))
+
+
+default_config = 'parsivel1'
+register(ParsivelConfig('parsivel1',drop_diameter,drop_spread,v_parsivel,v_spread,v_idlcode,
+                        liquid_matrix,frozen_matrix))
+register(ParsivelConfig('parsivel2',drop_diameter_ott,drop_spread_ott,v_parsivel,v_spread,v_parsivel,
+                        liquid_matrix,frozen_matrix))
@@ -1,32 +1,152 @@
 import numpy as np
 import pdb
+import time
 import datetime
 import scipy.stats.mstats
 import RawParsivel as rp
 import ProcessParsivel as pp
+import ParsivelConfig as pcfg
+import ParsivelGamma as pg
+import TimeIndex as ti
 import glob
 
-def calc_dsd(apu,sitename,date,time_interval=1):
+archive_dir = '/home/disk/funnel/olympex/archive2/'
+
+def apu_files(apu,date,archive=None,catalog=None):
+    '''
+    Sorted hourly files of an APU-day (yyyymmdd)
+    catalog: ArchiveCatalog to take the files from (no directory listing),
+    None lists the archive (default archive_dir)
+    Raises IOError if there are no files
+    '''
+    if catalog is not None:
+        infiles = catalog.parsivel_files(apu,date)
+        searchfor = apu+' '+date+' in the catalog'
+    else:
+        if archive is None:
+            archive = archive_dir
+        searchfor = archive+apu+'/Parsivel/'+date[0:6]+'/'+apu+'_'+date+'*'
+        infiles = sorted(glob.glob(searchfor))
+    if len(infiles) == 0:
+        raise IOError('No Parsivel files found for '+searchfor)
+    return infiles
+
+
+def calc_dsd(apu,sitename,date,time_interval=1,use_cache=True,archive=None,stats=None,
+             config=None,qc=None,catalog=None):
     '''
     Funtion that wraps all three Parsivel classes together to make the
     final DSD object
 
     Use to get the data to make plots
+    use_cache: passed to read_parsivel (False always rereads the .dat files)
+    archive: top directory of the APU archive (default archive_dir)
+    stats: PipelineStats object to fill in (optional)
+    config: ParsivelConfig or name of the bin tables (default parsivel1)
+    qc: ParsivelQC object, phase and error-code QC (default: wxcode only)
+    catalog: ArchiveCatalog with the file lists (default: glob the archive)
     '''
 
+    infiles = apu_files(apu,date,archive=archive,catalog=catalog)
 
-    indir = '/home/disk/funnel/olympex/archive2/'+apu+'/Parsivel/'+date[0:6]+'/'
-    searchfor= indir+apu+'_'+date+'*'     
-    infiles = glob.glob(searchfor)
-
-    rpdata = rp.read_parsivel(infiles)
-    ppdata = pp.process_parsivel(rpdata,time_interval=time_interval)
+    rpdata = rp.read_parsivel(infiles,use_cache=use_cache,stats=stats,config=config)
+    if len(rpdata.time) == 0:
+        raise ValueError('No valid telegrams in '+apu+' '+date)
+    ppdata = pp.process_parsivel(rpdata,time_interval=time_interval,stats=stats,qc=qc)
     dsd = ParsivelDSD(ppdata)
-    dsd.get_precip_params()
+    dsd.get_precip_params(stats=stats)
     return dsd
 
 
-class ParsivelDSD(object):
+def calc_dsd_levels(apu,sitename,date,time_intervals=[0.5,1,2,5,10,30,60],use_cache=True,
+                    archive=None,stats=None,config=None,qc=None,catalog=None):
+    '''
+    calc_dsd for several time intervals at once, the 10 s data is read and
+    filtered once and each interval is averaged from a finer one
+    (see ProcessParsivel.time_averaging_levels)
+    Returns a dict of ParsivelDSD objects keyed by time interval
+    '''
+
+    infiles = apu_files(apu,date,archive=archive,catalog=catalog)
+
+    rpdata = rp.read_parsivel(infiles,use_cache=use_cache,stats=stats,config=config)
+    if len(rpdata.time) == 0:
+        raise ValueError('No valid telegrams in '+apu+' '+date)
+    levels = pp.process_parsivel_levels(rpdata,time_intervals=time_intervals,stats=stats,qc=qc)
+    dsds = {}
+    for time_interval in levels:
+        dsds[time_interval] = ParsivelDSD(levels[time_interval])
+        dsds[time_interval].get_precip_params(stats=stats)
+    return dsds
+
+
+def save_dsd(dsd,filename):
+    '''
+    Saves the time series of a ParsivelDSD object to a .npz file
+    Tuples are saved as name (total) and name_bins (per drop size bin)
+    '''
+    out = {'time':dsd.time,'time_interval':dsd.proc_p2.time_interval,
+           'num_records':dsd.proc_p2.num_records,'error_code':dsd.proc_p2.error_code,
+           'temperature':dsd.proc_p2.temperature,'wxcode':dsd.proc_p2.wxcode,
+           'dsd':dsd.dsd,'dbz':dsd.dbz,'dmax':dsd.dmax,'dm':dsd.dm,'moments':dsd.moments,
+           'sigma_m':dsd.sigma_m,'nw':dsd.nw,'n0':dsd.gamma.n0,'mu':dsd.gamma.mu,
+           'lam':dsd.gamma.lam}
+    for name in ['ndrops','drop_conc','lwc','z','rainrate']:
+        out[name] = getattr(dsd,name)[0]
+        out[name+'_bins'] = getattr(dsd,name)[1]
+    np.savez(filename,**out)
+
+
+class _lazy(object):
+    #method computed on first access and then stored on the instance
+    def __init__(self,function):
+        self.function = function
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self,obj,cls):
+        if obj is None:
+            return self
+        value = self.function(obj)
+        obj.__dict__[self.__name__] = value
+        return value
+
+
+class BinProduct(object):
+
+    '''
+    Tuple-like product of ParsivelDSD: [0] is the total of each interval
+    (time,), [1] the value for each drop size bin (time,32). Each element is
+    computed the first time it is used, so asking for the total does not
+    build the per-bin array
+    '''
+
+    def __init__(self,total,bins):
+        self._functions = [total,bins]
+        self._values = [None,None]
+
+    def __getitem__(self,i):
+        i = range(2)[i]
+        if self._values[i] is None:
+            self._values[i] = self._functions[i]()
+        return self._values[i]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter([self[0],self[1]])
+
+    def _take(self,index):
+        #product of a subset of the intervals (see TimeIndex)
+        return BinProduct(lambda: self[0][index],lambda: self[1][index])
+
+    def __getstate__(self):
+        #computes both elements so the product can be pickled (e.g. by ParsivelBatch)
+        return {'_functions':None,'_values':[self[0],self[1]]}
+
+
+class ParsivelDSD(ti.TimeIndexed):
 
     '''
     ParsivelDSD takes a ProcessParsivel instance and computes the DSD using
@@ -42,6 +162,8 @@ class ParsivelDSD(object):
 
     In some cases, the data is saved as a tuple, with the contribution to rainrate
     from each drop bin range included as the second element in the tuple. 
+    Products are computed when first accessed (e.g. dsd.rainrate[0] only
+    computes the total rain rate), the tuples are BinProduct objects.
 
     The PlotParsivel class can be used to make plots of this data.
 
@@ -49,137 +171,227 @@ class ParsivelDSD(object):
     Currently uses the corrected fall velocities from Ali Tokay...changing the 
     assumed fall velocities will affect the drop parameters. 
 
-    Future additions:
-    Standard deviation of drop size
+    Gamma fits (method of moments or truncated moments) of all intervals
+    are done with gamma_fit (see ParsivelGamma)
+
+    time_slice cuts the DSD, the processed data and the products computed
+    so far to a time range (see TimeIndex)
     '''
 
-    def __init__(self,processed_parsivel):
+    #products that can be computed by get_precip_params
+    products = ['ndrops','drop_conc','dsd','lwc','z','dbz','rainrate','rainaccum',
+                'dmax','dm','sigma_m','nw','gamma','moments']
+
+    def __init__(self,processed_parsivel,config=None):
         #some data stored as tuples if applicable
         #first element = average or total across all 32 DSD bins
         #second element = value for each bin individually (plus time-dimension)
+        #all products are computed on first access and then kept (see BinProduct)
         self.proc_p2 = processed_parsivel
+        #bin tables and constants (default: the configuration of processed_parsivel)
+        if config is None:
+            config = getattr(processed_parsivel,'config',None)
+        self.config = pcfg.get_config(config)
         self.time = self.proc_p2.time 
-        timedim = len(self.proc_p2.matrix[:,0]) #time dimension
-        #ndrops is the number of drops (non-normalzed) in each volume of air
-        self.ndrops = (np.zeros(timedim),np.zeros((timedim,32)))
-        #DSD is the number of drops per volume of air for a given drop size interval (i.e. for the 32 bins)
-        self.dsd = np.zeros((timedim,32)) #dsd 
-        #drop_conc is the number of drops per volume of air. It is NOT normalized by drop size interval like DSD
-        self.drop_conc = (np.zeros(timedim),np.zeros((timedim,32))) #first tuple is the total drop conc
-        self.lwc = (np.zeros(timedim),np.zeros((timedim,32))) #lwc from each drop size bin
-        self.z = (np.zeros(timedim),np.zeros((timedim,32))) #reflectivity factor from each drop size bin
-        self.dbz = np.zeros(timedim)
-        self.rainrate = (np.zeros(timedim),np.zeros((timedim,32))) #rainrate from each drop size bin
-        self.rainaccum = (np.zeros(timedim),np.zeros((timedim,32))) #total rain accumulation from each bin
-        self.dmax = np.zeros(timedim) #max drop size
-        self.dm = np.zeros(timedim) #mass-weighted mean diameter
-        self.sigma_m = np.zeros(timedim) #variance of mass spectrum
-        self.moments = np.zeros((timedim,8)) #drop moments
-        #self.rainrate_old = (np.zeros(timedim),np.zeros((timedim,32))) #testing
-    
-
-    def get_precip_params(self):
-        
-        #Takes a processed_parsivel instance and calculates the precip params
-         
-        # parsivel_matrix: 1ength 1024 matrix of Parsivel diam/fspd
-        # timerain: time of period in seconds #self.proc_p2.time_interval
-        # wxcode: needed to differentiate between rain and snow
-        # Note: if frozen precipitation detected, no rain rate or LWC is returned
-        
-        #add loop here to go through each time dimension
+
+    def _aligned_names(self):
+        #products computed so far are sliced with the processed data
+        lazy = [name for name in self.__dict__ if isinstance(getattr(type(self),name,None),_lazy)]
+        return ['time','proc_p2'] + lazy
+
+    def get_precip_params(self,products=None,stats=None):
+        '''
+        Products are computed when they are first accessed, so this only
+        clears products computed earlier (e.g. after proc_p2 was changed)
+        products: list of products to compute now (e.g. ParsivelDSD.products
+        for all of them, including the per-bin values)
+        stats: PipelineStats object to fill in (optional)
+        '''
+        t0 = time.time()
+        for name in self.__dict__.keys():
+            if isinstance(getattr(type(self),name,None),_lazy):
+                del self.__dict__[name]
+        for name in products or []:
+            value = getattr(self,name)
+            if isinstance(value,BinProduct):
+                value[0],value[1]
+        if stats is not None:
+            stats.add_time('precip_params',time.time()-t0)
+
+    #Takes a processed_parsivel instance and calculates the precip params
+    # parsivel_matrix: 1ength 1024 matrix of Parsivel diam/fspd
+    # timerain: time of period in seconds #self.proc_p2.time_interval
+    # wxcode: needed to differentiate between rain and snow
+    # Note: if frozen precipitation detected, no rain rate or LWC is returned
+    #all time steps are computed at once on a (time,32 velocities,32 diameters) array
+    #Next step uses equation (6) from Tokay et al. (2014)
+    #per-bin constants (laser area, drop volume, D^n) are precomputed in the configuration
+    #totals are computed with a dot product over the bins, without building the per-bin values
+
+    @_lazy
+    def _time_mult(self):
         #timerain has to be calculated individually for each record in case data is missing 
         #what usually happens is that maybe 1 min of data per day is missing in 10-30s intervals
         timerain = self.proc_p2.time_interval
-        nrecords_exp = timerain*6
-        nrecords_actual = np.array(self.proc_p2.num_records)
-        nrecords_missing = (nrecords_exp - nrecords_actual).astype(float) #missing records
-        for td,dmax in enumerate(self.dmax):
-            #get correct time multiplier
-            time_mult = 60 * timerain - nrecords_missing[td]*10 #units: seconds
-            time_div = 60 / (timerain - (nrecords_missing[td]/6)) #units: s/min
-            #reshape to 32x32
-            matrix = np.reshape(self.proc_p2.matrix[td,:],(32,32))
-            ndrops = np.sum(matrix) #total drop count for this time step **need to output this** as self.ndrops
-            #moments: 0) concen, 1) mean diam, 2) surface area conc, 3)lwc, 6)z
-            x4 = 0.0 #for moments
-            x3 = 0.0 #for moments
-            #Process each drop bin (diameter, velocity):
-            for dind,dbin in enumerate(self.drop_diameter):
-                for vind,vbin in enumerate(self.v_idlcode):
-                    drops = matrix[vind,dind]
-                    #Next step uses equation (6) from Tokay et al. (2014)
-                    #parsivel laser area, units: mm^2 (subtracting off partial drops on edge)
-                    p2_area2 = 180.*(30.-(dbin/2.))/100. #not sure why we divide by 100
-                    p2_area = 180.*(30.-(dbin/2.))
-                    #denominators
-                    denom2 = time_mult * p2_area2 * vbin * self.drop_spread[dind] * 100 #per m^3*mmbin
-                    denom2_beard = time_mult * p2_area2 * self.v_theoretical[vind] * self.drop_spread[dind] * 100 
-                    self.dsd[td,dind] += (1.e6 * drops)/denom2 #10^6 converts to m^3*mm instead of mm^3*m
-                    if self.proc_p2.wxcode[td] < 65: #use theoretical fall speed for rain
-                        #units: s*mm^2*m/s*mm = mm^3*m
-                        denominator = time_mult * p2_area * vbin #per m^3 (not per bin)
-                    else: #no change for snow as of right now...could add in later
-                        denominator = time_mult * p2_area * vbin 
-
-                    vol = np.pi*dbin**3/6 #volume of 1 drop in this size bin
-                    if drops > 0: self.dmax[td] = dbin #make dmax for this bin nonzero if >0 drops
-                    self.drop_conc[1][td,dind] += drops*1.e6/denominator #direct evaulation of Tokay eq 6 for drop conc
-                    self.lwc[1][td,dind] += drops*vol*1.e3/denominator #units: g/m^3 per mm bin (rho=1000 g/m^3)
-                    self.z[1][td,dind] += drops * 1.e6 * dbin**6/denominator #reflectivity factor (6th power of diameter, normalized for area, time)
-                    self.rainrate[1][td,dind] += drops * vol / p2_area *time_div #rainrate
-                    #self.rainrate[1][td,dind] += drops * vol / p2_area * 60 / timerain #rainrate old
-                    #4th and 3rd moments
-                    if drops > 0:
-                        x4 += 1.e6 * drops * dbin**4 / denominator
-                        x3 += 1.e6 * drops * dbin**3 / denominator
-                        for ind,moment in enumerate(self.moments[td,:]):
-                            self.moments[td,ind] += 1.e6 * drops * dbin**ind / denominator
-                    
-            #compute total drop_conc, average lwc, etc (1st dimension of tuples)
-            self.drop_conc[0][td] = np.sum(self.drop_conc[1][td,:]) #this is good
-            self.lwc[0][td] = np.sum(self.lwc[1][td,:])
-            self.z[0][td] = np.sum(self.z[1][td,:])
-            self.rainrate[0][td] = np.sum(self.rainrate[1][td,:])
-            #mass-weighted mean diameter = ratio of 4th to 3rd moments
-            self.dm[td] = self.moments[td,4] / self.moments[td,3] 
-            if self.z[0][td] > 0:
-                self.dbz[td] = 10 * np.log10(self.z[0][td]) #z to dbz
-            else:
-                self.dbz[td] = float('nan')
+        nrecords_missing = (timerain*6 - np.array(self.proc_p2.num_records)).astype(float)
+        return 60 * timerain - nrecords_missing*10 #units: seconds
+
+    @_lazy
+    def _time_div(self):
+        timerain = self.proc_p2.time_interval
+        nrecords_missing = (timerain*6 - np.array(self.proc_p2.num_records)).astype(float)
+        with np.errstate(divide='ignore'): #intervals without telegrams
+            return 60 / (timerain - (nrecords_missing/6)) #units: s/min
+
+    @_lazy
+    def _drops(self):
+        #drops in each diameter bin, NaN for invalid (missing) intervals
+        counts = np.reshape(self.proc_p2.counts,(-1,32,32)) #velocity bins down, diameter across
+        drops = np.sum(counts,axis=1,dtype=float)
+        drops[~np.asarray(self.proc_p2.valid),:] = float('nan')
+        return drops
 
-            #eventually need to add sigma_m here
+    @_lazy
+    def _drops_v(self):
+        #drops/fall speed in each diameter bin, NaN for invalid intervals
+        counts = np.reshape(self.proc_p2.counts,(-1,32,32))
+        drops_v = np.einsum('tvd,v->td',counts,self.config.inv_fall_speed)
+        drops_v[~np.asarray(self.proc_p2.valid),:] = float('nan')
+        return drops_v
 
+    def _per_volume(self,weights):
+        #sum over bins of drops_v*weights per m^3 (drop_conc*weights)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return self._drops_v.dot(1.e6*weights/self.config.area) / self._time_mult
 
-    drop_diameter = [
-        0.064, 0.193, 0.321, 0.45, 0.579, 0.708, 0.836, 0.965, 1.094, 1.223, 1.416, 1.674,
-        1.931, 2.189, 2.446, 2.832, 3.347, 3.862, 4.378, 4.892, 5.665,
-        6.695, 7.725, 8.755, 9.785, 11.330, 13.390, 15.45, 17.51, 19.57, 22.145, 25.235] #also dmm
+    def _drop_conc_bins(self):
+        #denominator = time_mult * p2_area * fall_speed, units: s*mm^2*m/s = mm^2*m
+        #no change for snow as of right now...could add in later
+        with np.errstate(divide='ignore',invalid='ignore'):
+            norm = 1.e6/(self._time_mult[:,np.newaxis]*self.config.area) #10^6 converts to per m^3
+            return self._drops_v*norm #direct evaulation of Tokay eq 6 for drop conc
 
-    drop_diameter_ott = [
-        0.062, 0.187, 0.312, 0.437, 0.562, 0.687, 0.812, 0.937, 1.062, 1.187, 1.375, 1.625,
-        1.875, 2.125, 2.375, 2.750, 3.25, 3.75, 4.25, 4.75, 5.5, 6.5, 7.5, 8.5, 9.5, 11, 
-        13, 15, 17, 19, 21.5, 24.5] #diameters from the OTT Parsivel2 manual
+    @_lazy
+    def ndrops(self):
+        #number of drops (non-normalzed) in each volume of air
+        return BinProduct(lambda: np.sum(self._drops,axis=1),lambda: self._drops)
 
-    drop_spread = [
-        0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.257,
-        0.257, 0.257, 0.257, 0.257, 0.515, 0.515, 0.515, 0.515, 0.515, 1.030, 1.030,
-        1.030, 1.030, 1.030, 2.060, 2.060, 2.060, 2.060, 2.060, 3.090, 3.090] #also delta
+    @_lazy
+    def drop_conc(self):
+        #number of drops per volume of air. It is NOT normalized by drop size interval like DSD
+        return BinProduct(lambda: self._per_volume(1.),self._drop_conc_bins)
 
-    #note: drop concentrations are affected by which velocity table is used
-    v_theoretical = [
-        0.089, 0.659, 1.239, 1.803, 2.353, 2.889, 3.404, 3.892,
-        4.329, 4.705, 5.217, 5.833, 6.389, 6.886, 7.326, 7.878,
-        8.424, 8.785, 9.002, 9.117, 9.173, 9.248, 9.323, 9.398,
-        9.473, 9.586, 9.735, 9.885, 10.035, 10.185, 10.372, 10.597] #also velt
+    @_lazy
+    def dsd(self):
+        #number of drops per volume of air for each drop size interval, per m^3*mm
+        return self.drop_conc[1]/self.config.diameter_spread
+
+    @_lazy
+    def lwc(self):
+        #units: g/m^3 per mm bin (rho=1000 g/m^3)
+        vol = self.config.volume
+        return BinProduct(lambda: self._per_volume(vol*1.e-3),
+                          lambda: self.drop_conc[1]*vol*1.e-3)
+
+    @_lazy
+    def z(self):
+        #reflectivity factor (6th power of diameter, normalized for area, time)
+        d6 = self.config.dpow[:,6]
+        return BinProduct(lambda: self._per_volume(d6),lambda: self.drop_conc[1]*d6)
+
+    @_lazy
+    def dbz(self):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.where(self.z[0] > 0,10 * np.log10(self.z[0]),float('nan')) #z to dbz
+
+    @_lazy
+    def rainrate(self):
+        #rainrate from each drop size bin (mm/h)
+        vol,p2_area = self.config.volume,self.config.area
+        return BinProduct(lambda: self._drops.dot(vol/p2_area)*self._time_div,
+                          lambda: self._drops*vol/p2_area*self._time_div[:,np.newaxis])
+
+    @_lazy
+    def rainaccum(self):
+        #rain accumulation in each interval from each drop size bin (mm)
+        vol,p2_area = self.config.volume,self.config.area
+        return BinProduct(lambda: self._drops.dot(vol/p2_area),lambda: self._drops*vol/p2_area)
+
+    @_lazy
+    def dmax(self):
+        #max drop size: largest diameter bin with >0 drops
+        dbin = self.config.diameter
+        with np.errstate(invalid='ignore'):
+            has_drops = self._drops > 0
+        last = len(dbin) - 1 - np.argmax(has_drops[:,::-1],axis=1)
+        return np.where(np.any(has_drops,axis=1),dbin[last],0.)
+
+    @_lazy
+    def moments(self):
+        #moments: 0) concen, 1) mean diam, 2) surface area conc, 3)lwc, 6)z
+        #only bins with drops > 0 contribute
+        with np.errstate(divide='ignore',invalid='ignore'):
+            drops_v = self._drops_v
+            positive = np.where(drops_v > 0,drops_v/self._time_mult[:,np.newaxis],0.)
+        return positive.dot(1.e6/self.config.area[:,np.newaxis]*self.config.dpow)
+
+    @_lazy
+    def dm(self):
+        #mass-weighted mean diameter = ratio of 4th to 3rd moments
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return self.moments[:,4] / self.moments[:,3]
+
+    @_lazy
+    def sigma_m(self):
+        #standard deviation of the mass spectrum, sqrt(M5/M3 - Dm^2)
+        return pg.mass_spectrum_std(self.moments)
+
+    @_lazy
+    def nw(self):
+        #normalized intercept parameter (m^-3 mm^-1), NaN for frozen precip
+        return pg.normalized_intercept(self.moments,mask=self._frozen)
+
+    @_lazy
+    def gamma(self):
+        #gamma fit with the M3/M4/M6 method (see gamma_fit)
+        return self.gamma_fit()
+
+    def gamma_fit(self,method='m346',truncated=False):
+        '''
+        Gamma DSD fit of all intervals, returns a ParsivelGamma.GammaParams
+        object (n0, mu, lam, dm, nw)
+        method: 'm346' (M3, M4, M6) or 'm246' (M2, M4, M6)
+        truncated = True: truncated moment fit between the edges of the
+        smallest and largest diameter bins with drops
+        NaN for intervals without drops and for frozen precip (wxcode >= 66)
+        Fits are kept, asking for the same fit again costs nothing
+        '''
+        key = (method,truncated)
+        if key not in self._gamma_fits:
+            if truncated:
+                dmin,dmax = self._observed_range
+                fit = pg.fit_truncated(self.moments,dmin,dmax,method=method,mask=self._frozen)
+            else:
+                fit = pg.fit_moments(self.moments,method=method,mask=self._frozen)
+            self._gamma_fits[key] = fit
+        return self._gamma_fits[key]
 
-    v_parsivel = [
-        0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95, 1.1, 1.3, 1.5, 1.7, 1.9,
-        2.2, 2.6, 3, 3.4, 3.8, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
-        17.6, 20.8]
+    @_lazy
+    def _gamma_fits(self):
+        return {}
 
-    v_idlcode = [
-        0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.854, 0.962, 1.128, 1.354, 1.588, 1.828, 2.075,
-        2.398, 2.782, 3.15, 3.502, 3.838, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
-        17.6, 20.8] #also velo
+    @_lazy
+    def _frozen(self):
+        #frozen precip: no gamma fit (rain rate and LWC assume liquid drops)
+        with np.errstate(invalid='ignore'):
+            return np.asarray(self.proc_p2.wxcode,dtype=float) >= 66
 
+    @_lazy
+    def _observed_range(self):
+        #lower edge of the smallest and upper edge of the largest bin with drops
+        d,spread = self.config.diameter,self.config.diameter_spread
+        with np.errstate(invalid='ignore'):
+            has_drops = self._drops > 0
+        first = np.argmax(has_drops,axis=1)
+        last = len(d) - 1 - np.argmax(has_drops[:,::-1],axis=1)
+        return np.maximum(d[first] - spread[first]/2.,0.),d[last] + spread[last]/2.
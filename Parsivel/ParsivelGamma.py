@@ -0,0 +1,173 @@
+'''
+Gamma DSD fits for all intervals at once
+
+N(D) = N0 * D^mu * exp(-lam*D)  (N0: m^-3 mm^-1-mu, lam: mm^-1)
+
+The fits work on whole arrays of moments (one row per interval, as in
+ParsivelDSD.moments), every step is an array operation over the time
+dimension, so there is no loop or optimizer call per interval.
+
+fit_moments: method of moments from 3 moments
+m346: M3, M4, M6 (Zhang et al. 2001, Cao and Zhang 2009)
+m246: M2, M4, M6 (Vivekanandan et al. 2004)
+fit_truncated: truncated moment fit. The observed moments only include
+drops between dmin and dmax, the fit is repeated with the moments corrected
+by the fraction of each moment inside (dmin, dmax) (regularized incomplete
+gamma function) until mu converges
+normalized_intercept, mass_spectrum_std: Nw and sigma_m from the moments
+
+Intervals without drops, with moments that can't come from a gamma DSD or
+that are masked (e.g. frozen precipitation) give NaN.
+'''
+import numpy as np
+import scipy.special
+
+#moment orders used by each method
+methods = {'m346':(3,4,6),'m246':(2,4,6)}
+
+
+class GammaParams(object):
+
+    '''
+    Gamma fit of each interval
+    n0, mu, lam: gamma parameters
+    dm: mass-weighted mean diameter of the fit (mm), (4+mu)/lam
+    nw: normalized intercept of the fit (m^-3 mm^-1)
+    converged: False where the truncated fit did not converge
+    '''
+
+    def __init__(self,n0,mu,lam,converged=None):
+        self.n0 = n0
+        self.mu = mu
+        self.lam = lam
+        if converged is None:
+            converged = np.isfinite(mu)
+        self.converged = converged
+
+    def _take(self,index):
+        #fit of a subset of the intervals (see TimeIndex)
+        return GammaParams(self.n0[index],self.mu[index],self.lam[index],self.converged[index])
+
+    @property
+    def dm(self):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return (4 + self.mu) / self.lam
+
+    @property
+    def nw(self):
+        #N0 = Nw * f(mu) * Dm^-mu, f(mu) = 6/4^4 * (4+mu)^(mu+4) / gamma(mu+4)
+        with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+            mu = self.mu
+            log_f = np.log(6./4**4) + (mu + 4)*np.log(mu + 4) - scipy.special.gammaln(mu + 4)
+            return np.exp(np.log(self.n0) + mu*np.log(self.dm) - log_f)
+
+
+def fit_moments(moments,method='m346',mask=None):
+    '''
+    Method of moments gamma fit
+    moments: (time, orders) array, column n = M_n (e.g. ParsivelDSD.moments)
+    method: 'm346' or 'm246'
+    mask: boolean (time,) array, True intervals are set to NaN (e.g. frozen)
+    Returns a GammaParams object
+    '''
+    i,j,k = _orders(method)
+    return _fit(moments[:,i],moments[:,j],moments[:,k],method,mask)
+
+
+def fit_truncated(moments,dmin,dmax,method='m346',mask=None,iterations=100,tol=1e-8):
+    '''
+    Truncated moment gamma fit
+    moments: (time, orders) observed moments
+    dmin, dmax: (time,) smallest and largest diameter that was observed
+    (e.g. edges of the first and last bin with drops, mm)
+    iterations, tol: each interval is refitted until mu changes by less than
+    tol*(1+|mu|), for at most iterations steps (converged is False where it
+    didn't). Only the intervals that haven't converged are refitted
+    Returns a GammaParams object
+    '''
+    orders = _orders(method)
+    observed = [moments[:,n] for n in orders]
+    fit = _fit(observed[0],observed[1],observed[2],method,mask)
+    n0,mu,lam = fit.n0.copy(),fit.mu.copy(),fit.lam.copy()
+    dmin = np.zeros(len(mu)) + dmin
+    dmax = np.zeros(len(mu)) + dmax
+    converged = np.zeros(len(mu),dtype=bool)
+    active = np.flatnonzero(np.isfinite(mu))
+    with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+        for step in range(iterations):
+            if len(active) == 0:
+                break
+            a_mu,a_lam = mu[active],lam[active]
+            full = []
+            for n,m in zip(orders,observed):
+                #fraction of moment n between dmin and dmax
+                fraction = scipy.special.gammainc(a_mu + n + 1,a_lam*dmax[active]) - \
+                           scipy.special.gammainc(a_mu + n + 1,a_lam*dmin[active])
+                full.append(m[active] / fraction)
+            fit = _fit(full[0],full[1],full[2],method,None)
+            n0[active],mu[active],lam[active] = fit.n0,fit.mu,fit.lam
+            done = np.abs(fit.mu - a_mu) <= tol*(1 + np.abs(a_mu))
+            converged[active[done]] = True
+            active = active[~done & np.isfinite(fit.mu)]
+    return GammaParams(n0,mu,lam,converged & np.isfinite(mu))
+
+
+def normalized_intercept(moments,mask=None):
+    '''
+    Nw = 4^4/(pi*rho_w) * W/Dm^4 = 4^4/6 * M3^5/M4^4 (m^-3 mm^-1)
+    for each row of moments, NaN where M3 or M4 is 0 or mask is True
+    '''
+    m3,m4 = moments[:,3],moments[:,4]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        nw = np.where((m3 > 0) & (m4 > 0),4.**4/6*m3**5/m4**4,np.nan)
+    return _apply_mask(nw,mask)
+
+
+def mass_spectrum_std(moments,mask=None):
+    '''
+    sigma_m = sqrt(M5/M3 - Dm^2), standard deviation of the mass spectrum (mm)
+    '''
+    m3,m4,m5 = moments[:,3],moments[:,4],moments[:,5]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        variance = m5/m3 - (m4/m3)**2
+        #rounding can give tiny negative variances for single-bin spectra
+        sigma_m = np.sqrt(np.where(variance > 0,variance,0.))
+        sigma_m[~(m3 > 0)] = np.nan
+    return _apply_mask(sigma_m,mask)
+
+
+def _orders(method):
+    try:
+        return methods[method]
+    except KeyError:
+        raise ValueError('unknown gamma fit method: '+str(method))
+
+
+def _apply_mask(values,mask):
+    if mask is not None:
+        values = np.where(mask,np.nan,values)
+    return values
+
+
+def _fit(mi,mj,mk,method,mask):
+    #gamma parameters from 3 moments, all array operations
+    with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+        if method == 'm346':
+            #G = M4^3/(M3^2 M6) = (mu+4)^2/((mu+5)(mu+6))
+            g = mj**3/(mi**2*mk)
+            mu = ((11*g - 8) + np.sqrt(g*(g + 8)))/(2*(1 - g))
+            lam = (mu + 4)*mi/mj
+            log_n0 = np.log(mi) + (mu + 4)*np.log(lam) - scipy.special.gammaln(mu + 4)
+        else:
+            #eta = M4^2/(M2 M6) = ((mu+3)(mu+4))/((mu+5)(mu+6))
+            eta = mj**2/(mi*mk)
+            mu = ((7 - 11*eta) - np.sqrt(eta**2 + 14*eta + 1))/(2*(eta - 1))
+            lam = np.sqrt((mu + 3)*(mu + 4)*mi/mj)
+            log_n0 = np.log(mi) + (mu + 3)*np.log(lam) - scipy.special.gammaln(mu + 3)
+        n0 = np.exp(log_n0)
+        #no drops, or moments that no gamma DSD can have
+        bad = ~((mi > 0) & (mj > 0) & (mk > 0) & np.isfinite(mu) & (lam > 0) & np.isfinite(n0))
+        if mask is not None:
+            bad |= mask
+    mu,lam,n0 = [np.where(bad,np.nan,x) for x in (mu,lam,n0)]
+    return GammaParams(n0,mu,lam)
@@ -0,0 +1,252 @@
+'''
+Phase and error-code quality control of the 10 s Parsivel telegrams
+
+ParsivelQC works on the whole wxcode, temperature and error_code arrays at
+once and returns a QCMask with one value per telegram:
+frozen: True where the frozen conditional matrix is used (see
+ProcessParsivel.apply_matrix), False for the liquid matrix
+bad: telegrams left out of the time averages (see time_averaging), so the
+intervals they are in count as missing
+
+Phase of each telegram:
+1) wxcode >= frozen_wxcode (66) is frozen or mixed precip
+2) temperature thresholds (optional): telegrams at or above
+rain_temperature are liquid, at or below snow_temperature frozen
+(the Parsivel temperature is the sensor temperature, deg C)
+3) hysteresis (optional): the phase only changes when the new phase lasts
+min_duration seconds. Runs of one phase (run-length encoding of the
+telegrams) that are shorter take the phase of the last long run before
+them, or of the next long run at the start of the data. Runs don't cross
+gaps longer than max_gap seconds
+
+Error codes: telegrams with error_code > max_error_code are bad (optional)
+
+The defaults (ParsivelQC()) reproduce the plain wxcode >= 66 split and
+keep every telegram.
+
+QCStream applies the same QC to telegrams that arrive one at a time (see
+ParsivelRealtime). With hysteresis a telegram is held back until the phase
+of its run is known (the run reaches min_duration, or a long run follows
+the short runs at the start of a segment, or the segment ends).
+
+Example:
+import ParsivelQC as pqc
+qc = pqc.ParsivelQC(min_duration=120,rain_temperature=5,max_error_code=0)
+dsd = pdsd.calc_dsd(apu,sitename,date,qc=qc)
+dsd.proc_p2.qc_mask.frozen
+'''
+import numpy as np
+
+frozen_wxcode = 66 #wxcode >= 66: frozen (or mixed) precip
+
+
+def run_lengths(values,breaks=None):
+    '''
+    Run-length encoding of a 1-d array
+    breaks: optional boolean array, True where a new run has to start
+    (e.g. after a gap in time) even if the value is the same
+    Returns starts, lengths and values of the runs
+    '''
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.zeros(0,dtype=int),np.zeros(0,dtype=int),values
+    change = np.r_[True,values[1:] != values[:-1]]
+    if breaks is not None:
+        change |= np.asarray(breaks,dtype=bool)
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.r_[starts,len(values)])
+    return starts,lengths,values[starts]
+
+
+def persistent(flags,min_length,breaks=None):
+    '''
+    flags with runs shorter than min_length values replaced by the value
+    of the last run of at least min_length before them in the same segment
+    (segments are separated by breaks), or of the first long run after them
+    at the start of a segment. Segments without a long run are unchanged
+    '''
+    flags = np.asarray(flags,dtype=bool)
+    if min_length <= 1 or len(flags) == 0:
+        return flags.copy()
+    starts,lengths,values = run_lengths(flags,breaks)
+    nruns = len(starts)
+    if breaks is None:
+        segment = np.zeros(nruns,dtype=int)
+    else:
+        segment = np.cumsum(np.asarray(breaks,dtype=bool)[starts])
+    runs = np.arange(nruns)
+    long_run = lengths >= min_length
+    #last long run at or before each run, first long run at or after it
+    before = np.maximum.accumulate(np.where(long_run,runs,-1))
+    after = np.minimum.accumulate(np.where(long_run,runs,nruns)[::-1])[::-1]
+    use_before = (before >= 0) & (segment[np.maximum(before,0)] == segment)
+    use_after = ~use_before & (after < nruns) & \
+                (segment[np.minimum(after,nruns-1)] == segment)
+    smoothed = values.copy()
+    smoothed[use_before] = values[before[use_before]]
+    smoothed[use_after] = values[after[use_after]]
+    return np.repeat(smoothed,lengths)
+
+
+class QCMask(object):
+
+    '''
+    Result of ParsivelQC for each telegram
+    frozen: frozen conditional matrix is used
+    bad: telegram is left out of the time averages
+    phase_changed: telegrams whose phase differs from the wxcode alone
+    '''
+
+    def __init__(self,frozen,bad,phase_changed):
+        self.frozen = frozen
+        self.bad = bad
+        self.phase_changed = phase_changed
+
+    def _take(self,index):
+        #mask of a subset of the telegrams (see TimeIndex)
+        return QCMask(self.frozen[index],self.bad[index],self.phase_changed[index])
+
+
+class ParsivelQC(object):
+
+    '''
+    QC settings, see the module documentation
+    min_duration: shortest phase run (seconds) that changes the phase
+    (0: no hysteresis)
+    rain_temperature, snow_temperature: temperature thresholds (deg C, None: not used)
+    max_error_code: highest error code that is kept (None: all are kept)
+    max_gap: gap between telegrams (seconds) that ends a run
+    '''
+
+    def __init__(self,min_duration=0,rain_temperature=None,snow_temperature=None,
+                 max_error_code=None,max_gap=60):
+        self.min_duration = min_duration
+        self.rain_temperature = rain_temperature
+        self.snow_temperature = snow_temperature
+        self.max_error_code = max_error_code
+        self.max_gap = max_gap
+
+    def mask(self,raw_parsivel):
+        #QCMask of the telegrams of a RawParsivel object
+        return self.apply(raw_parsivel.time,raw_parsivel.wxcode,raw_parsivel.temperature,
+                          raw_parsivel.error_code)
+
+    def apply(self,time,wxcode,temperature,error_code):
+        '''
+        QCMask from the arrays of 10 s telegrams (time as datetime64)
+        '''
+        wxcode = np.asarray(wxcode)
+        wx_frozen = wxcode >= frozen_wxcode
+        frozen = self.phase(wxcode,temperature)
+        if self.min_length() > 1:
+            seconds = np.asarray(time,dtype='datetime64[s]').astype(np.int64)
+            breaks = np.r_[False,np.diff(seconds) > self.max_gap]
+            frozen = persistent(frozen,self.min_length(),breaks)
+        return QCMask(frozen,self.bad(error_code),frozen != wx_frozen)
+
+    def phase(self,wxcode,temperature):
+        #frozen from the wxcode and temperature thresholds (before the hysteresis)
+        frozen = np.asarray(wxcode) >= frozen_wxcode
+        temperature = np.asarray(temperature,dtype=float)
+        if self.rain_temperature is not None:
+            frozen &= ~(temperature >= self.rain_temperature)
+        if self.snow_temperature is not None:
+            frozen |= temperature <= self.snow_temperature
+        return frozen
+
+    def bad(self,error_code):
+        #telegrams left out of the averages
+        if self.max_error_code is None:
+            return np.zeros(np.shape(error_code),dtype=bool)
+        return np.asarray(error_code) > self.max_error_code
+
+    def min_length(self):
+        #shortest run (telegrams) that changes the phase
+        return int(np.ceil(self.min_duration / 10.))
+
+
+class QCStream(object):
+
+    '''
+    ParsivelQC for telegrams that arrive one at a time, in time order
+    add() returns the telegrams whose phase is decided, as (item, frozen, bad)
+    in the order they were added, flush() decides the held ones when the
+    data ends. The result is the same as ParsivelQC.apply on the whole series
+    '''
+
+    def __init__(self,qc=None):
+        self.qc = get_qc(qc)
+        self.last_time = None #seconds since 1970 of the last telegram
+        self.run_phase = None #phase of the current run (None: no run)
+        self.run_length = 0
+        self.run = [] #held telegrams of the current run (while it is short)
+        self.long_phase = None #phase of the last long run of the segment
+        self.head = [] #held telegrams of the short runs before the first long run
+
+    def pending(self):
+        #number of telegrams held back
+        return len(self.run) + len(self.head)
+
+    def add(self,time,wxcode,temperature,error_code,item):
+        '''
+        Adds one telegram (time as datetime64), item is returned with its phase
+        Returns the list of (item, frozen, bad) that are decided
+        '''
+        frozen = bool(self.qc.phase(wxcode,temperature))
+        bad = bool(self.qc.bad(error_code))
+        min_length = self.qc.min_length()
+        if min_length <= 1:
+            return [(item,frozen,bad)]
+        seconds = int(np.datetime64(time,'s').astype(np.int64))
+        decided = []
+        if self.last_time is not None and seconds - self.last_time > self.qc.max_gap:
+            decided.extend(self.flush())
+        elif self.run_phase is not None and frozen != self.run_phase:
+            decided.extend(self._end_run())
+        self.last_time = seconds
+        if self.run_phase is None:
+            self.run_phase = frozen
+        self.run_length += 1
+        if self.run_length > min_length:
+            decided.append((item,self.run_phase,bad))
+            return decided
+        self.run.append((item,frozen,bad))
+        if self.run_length == min_length:
+            #a long run: its phase is kept, the short runs before it take it
+            self.long_phase = self.run_phase
+            decided.extend([(i,self.run_phase,b) for i,f,b in self.head + self.run])
+            self.head = []
+            self.run = []
+        return decided
+
+    def flush(self):
+        #end of the data (or a gap): decides the held telegrams
+        decided = self._end_run()
+        #segment without a long run, unchanged
+        decided.extend(self.head)
+        self.head = []
+        self.long_phase = None
+        return decided
+
+    def _end_run(self):
+        decided = []
+        if self.run_length < self.qc.min_length():
+            if self.long_phase is not None:
+                decided = [(i,self.long_phase,b) for i,f,b in self.run]
+            else:
+                self.head.extend(self.run)
+        self.run = []
+        self.run_phase = None
+        self.run_length = 0
+        return decided
+
+
+#default QC: phase from wxcode only, no telegrams removed
+default_qc = ParsivelQC()
+
+
+def get_qc(qc=None):
+    #ParsivelQC object (default_qc if None)
+    if qc is None:
+        return default_qc
+    return qc
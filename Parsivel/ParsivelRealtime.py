@@ -0,0 +1,227 @@
+'''
+Real-time Parsivel processing
+
+ParsivelStream follows the hourly APU file that is currently being written
+(apuxx_yyyymmddhh.dat), reads only the lines appended since the last poll
+and applies the conditional matrix to each new telegram. The telegrams of
+the open averaging interval are kept as running sums, so memory and CPU
+per telegram stay the same however long the stream has been running.
+
+As soon as an interval is complete (all of its telegrams have arrived, or
+a telegram of a later interval arrives) it is returned as a ParsivelDSD
+object holding that one interval.
+
+The phase and error-code QC (see ParsivelQC) is applied as the telegrams
+arrive. With hysteresis (min_duration) telegrams are held back until their
+phase is known, so intervals close up to min_duration later, but the
+intervals are the same as time_averaging of the whole series.
+
+Example:
+import ParsivelRealtime as prt
+def show(dsd):
+    print dsd.time[0], dsd.rainrate[0][0], dsd.dbz[0]
+stream = prt.ParsivelStream('apu06',time_interval=1)
+stream.run(show)
+'''
+import os
+import time
+import datetime
+import numpy as np
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelDSD as pdsd
+import ParsivelConfig as pcfg
+import ParsivelQC as pqc
+
+
+class ParsivelStream(object):
+
+    '''
+    apu: apuxx
+    time_interval: averaging interval in minutes (multiple of 10 s)
+    archive: top directory of the APU archive (default ParsivelDSD.archive_dir),
+    files are read from archive/apuxx/Parsivel/yyyymm/
+    start: datetime (UTC) of the first hour to read (default: current hour)
+    remove_bins, remove_missing: see ProcessParsivel
+    latency: seconds after the end of an interval before it is closed even
+    if telegrams are missing
+    config: ParsivelConfig or name (see ParsivelConfig)
+    qc: ParsivelQC object (default: phase from wxcode, all telegrams kept)
+    '''
+
+    def __init__(self,apu,time_interval=1,archive=None,start=None,remove_bins=None,
+                 remove_missing=True,latency=30,config=None,qc=None):
+        self.apu = apu
+        self.archive = archive if archive is not None else pdsd.archive_dir
+        self.time_interval = time_interval
+        self.interval_seconds = int(round(time_interval*60))
+        if self.interval_seconds <= 0 or self.interval_seconds % 10 != 0:
+            raise ValueError('time interval must be a positive multiple of 10 s')
+        self.expected = self.interval_seconds // 10 #telegrams per interval
+        self.remove_missing = remove_missing
+        self.latency = latency
+        self.config = pcfg.get_config(config)
+        self.masks = self.config.conditional_masks(remove_bins)
+        self.qc = pqc.get_qc(qc)
+        self.qc_stream = pqc.QCStream(self.qc) #telegrams waiting for their phase
+        if start is None:
+            start = datetime.datetime.utcnow()
+        self.hour = start.replace(minute=0,second=0,microsecond=0) #hour of the file being read
+        self.offset = 0 #bytes of the current file already read
+        self.buffer = '' #incomplete last line of the current file
+        self.bad_lines = 0
+        self.late_telegrams = 0 #telegrams for an interval that was already closed
+        self.open_bin = None #interval_index of the open interval
+        self._reset_sums()
+
+    def filename(self,hour=None):
+        #hourly APU file for hour (datetime)
+        if hour is None:
+            hour = self.hour
+        return self.archive+self.apu+'/Parsivel/'+hour.strftime('%Y%m')+'/'+\
+               self.apu+'_'+hour.strftime('%Y%m%d%H')+'.dat'
+
+    def poll(self):
+        '''
+        Reads everything appended since the last poll (moving on to the next
+        hourly file when it appears) and returns the finished intervals as a
+        list of ParsivelDSD objects
+        '''
+        records = []
+        while True:
+            for line in self._read_new_lines():
+                records.extend(self.add_telegram(line))
+            next_hour = self.hour + datetime.timedelta(hours=1)
+            now = datetime.datetime.utcnow()
+            if os.path.exists(self.filename(next_hour)) or \
+               (not os.path.exists(self.filename()) and now >= next_hour + datetime.timedelta(hours=1)):
+                if self.buffer.strip(): #last line without newline
+                    records.extend(self.add_telegram(self.buffer))
+                self.hour = next_hour
+                self.offset = 0
+                self.buffer = ''
+            else:
+                break
+        now = (datetime.datetime.utcnow() - datetime.datetime(1970,1,1)).total_seconds()
+        #the next telegram would start a new QC run after a gap, so the held ones are decided
+        if self.qc_stream.pending() and \
+           now > self.qc_stream.last_time + self.qc.max_gap + self.latency:
+            for (stamp,header,counts),frozen,bad in self.qc_stream.flush():
+                records.extend(self._add(stamp,header,counts,frozen,bad))
+        #close the open interval if its telegrams are overdue
+        #(intervals without any telegram are NaN-filled once data resumes)
+        if self.open_bin is not None and self.telegrams > 0 and not self.qc_stream.pending():
+            end = (self.open_bin + 1) * self.interval_seconds + self.latency
+            if now > end:
+                records.extend(self._close(self.open_bin + 1))
+        return records
+
+    def run(self,callback,poll_interval=2.0):
+        #polls forever, calling callback(dsd) for every finished interval
+        while True:
+            for record in self.poll():
+                callback(record)
+            time.sleep(poll_interval)
+
+    def add_telegram(self,line):
+        '''
+        Adds one telegram (line of an APU file) to the running sums
+        Returns the intervals finished by this telegram (list of ParsivelDSD)
+        '''
+        try:
+            stamp,apu,header,counts = rp.parse_telegram(line)
+        except ValueError:
+            self.bad_lines += 1
+            return []
+        if counts is None: #leaves bad line all zeros, like RawParsivel
+            self.bad_lines += 1
+            counts = np.zeros(1024,dtype=np.uint16)
+        records = []
+        for (stamp,header,counts),frozen,bad in self.qc_stream.add(stamp,int(header[7]),header[1],
+                                                                   int(header[0]),(stamp,header,counts)):
+            records.extend(self._add(stamp,header,counts,frozen,bad))
+        return records
+
+    def _add(self,stamp,header,counts,frozen,bad):
+        #adds a telegram with its QC phase to the open interval, returns the finished intervals
+        tbin = pp.interval_index(np.array([stamp]),self.interval_seconds)[0]
+        if self.open_bin is None:
+            self.open_bin = tbin
+        if tbin < self.open_bin:
+            self.late_telegrams += 1
+            return []
+        records = []
+        if tbin > self.open_bin:
+            records.extend(self._close(tbin))
+
+        self.telegrams += 1
+        if not bad: #telegrams flagged bad by the QC leave the interval incomplete
+            error_code,temperature,wxcode = int(header[0]),header[1],int(header[7])
+            self.num_records += 1
+            self.matrix += counts * self.masks[int(frozen)]
+            self.error_code = max(self.error_code,error_code)
+            self.temperature += temperature
+            if wxcode >= len(self.wxcode_hist):
+                self.wxcode_hist = np.concatenate((self.wxcode_hist,
+                                                   np.zeros(wxcode + 1 - len(self.wxcode_hist),dtype=int)))
+            self.wxcode_hist[wxcode] += 1
+
+        if self.telegrams == self.expected:
+            records.extend(self._close(tbin + 1))
+        return records
+
+    def _reset_sums(self):
+        self.telegrams = 0 #telegrams of the open interval, with those flagged bad
+        self.num_records = 0
+        self.matrix = np.zeros(1024,dtype=np.uint32)
+        self.error_code = -1
+        self.temperature = 0.0
+        self.wxcode_hist = np.zeros(100,dtype=int)
+
+    def _close(self,next_bin):
+        #finishes the open interval (and empty intervals up to next_bin)
+        records = []
+        if self.num_records > 0 or self.remove_missing:
+            sums = pp.IntervalSums(self.open_bin,self.interval_seconds,
+                                   np.array([self.num_records]),self.matrix[np.newaxis,:],
+                                   np.array([self.error_code]),np.array([self.temperature]),
+                                   self.wxcode_hist[np.newaxis,:])
+            records.append(self._record(sums))
+        if self.remove_missing and next_bin > self.open_bin + 1:
+            #missing intervals are NaN-filled, as in time_averaging
+            for empty_bin in range(int(self.open_bin) + 1,int(next_bin)):
+                sums = pp.IntervalSums(empty_bin,self.interval_seconds,np.zeros(1,dtype=int),
+                                       np.zeros((1,1024),dtype=np.uint32),np.zeros(1,dtype=int) - 1,
+                                       np.zeros(1),np.zeros((1,1),dtype=int))
+                records.append(self._record(sums))
+        self.open_bin = next_bin
+        self._reset_sums()
+        return records
+
+    def _record(self,sums):
+        #one-interval ParsivelDSD object
+        processed = pp.ProcessParsivel(config=self.config,qc=self.qc)
+        processed.set_averages(sums,self.time_interval,remove_missing=self.remove_missing)
+        dsd = pdsd.ParsivelDSD(processed)
+        dsd.get_precip_params()
+        return dsd
+
+    def _read_new_lines(self):
+        #complete lines appended to the current file since the last read
+        filename = self.filename()
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return []
+        if size < self.offset: #file was replaced, read it again
+            self.offset = 0
+            self.buffer = ''
+        if size == self.offset:
+            return []
+        with open(filename) as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        lines = (self.buffer + data).split('\n')
+        self.buffer = lines.pop()
+        return [line for line in lines if line.strip()]
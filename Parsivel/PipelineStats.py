@@ -0,0 +1,62 @@
+'''
+Timing and data-quality counters for the Parsivel and gauge pipelines
+
+A PipelineStats object can be passed as stats= to read_parsivel,
+process_parsivel, ParsivelDSD.get_precip_params, calc_dsd and
+IowaGaugeRaw.save_iowa_gauge. Each stage adds its wall time and counters
+to it. With stats=None (the default) nothing is measured or counted.
+
+Stages (seconds): read, cache_load, cache_save, apply_matrix,
+time_averaging, precip_params, gauge_fetch, gauge_parse, gauge_clean,
+gauge_write
+
+Counters: files_read, records_read, bad_lines, cache_hits, cache_misses,
+intervals, intervals_nan_filled, drops_raw, drops_removed_liquid,
+drops_removed_frozen, qc_phase_changed, qc_records_removed, packets_read,
+tips_read, duplicate_tips, other_day_tips
+
+Example:
+import PipelineStats as ps
+stats = ps.PipelineStats()
+dsd = pdsd.calc_dsd('apu06','apu06','20151208',stats=stats)
+stats.report()
+'''
+
+
+class PipelineStats(object):
+
+    '''
+    times: seconds spent in each stage (summed over calls)
+    calls: number of calls of each stage
+    counts: value of each counter
+    '''
+
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self.counts = {}
+
+    def add_time(self,stage,seconds):
+        self.times[stage] = self.times.get(stage,0.0) + seconds
+        self.calls[stage] = self.calls.get(stage,0) + 1
+
+    def count(self,name,n=1):
+        self.counts[name] = self.counts.get(name,0) + int(n)
+
+    def merge(self,other):
+        #adds the times and counts of another PipelineStats (e.g. from a worker)
+        for stage in other.times:
+            self.times[stage] = self.times.get(stage,0.0) + other.times[stage]
+            self.calls[stage] = self.calls.get(stage,0) + other.calls[stage]
+        for name in other.counts:
+            self.count(name,other.counts[name])
+
+    def as_dict(self):
+        return {'times':dict(self.times),'calls':dict(self.calls),'counts':dict(self.counts)}
+
+    def report(self):
+        print 'Pipeline stats: '
+        for stage in sorted(self.times):
+            print '  %-20s %9.3f s (%d calls)' % (stage,self.times[stage],self.calls[stage])
+        for name in sorted(self.counts):
+            print '  %-20s %9d' % (name,self.counts[name])
@@ -1,21 +1,230 @@
 import numpy as np
 import pdb
+import time
 import datetime
-import scipy.stats.mstats
+import fractions
+import ParsivelConfig as pcfg
+import ParsivelQC as pqc
+import TimeIndex as ti
 
-def process_parsivel(raw_parsivel_object,time_interval=1,remove_bins=None):
+def process_parsivel(raw_parsivel_object,time_interval=1,remove_bins=None,stats=None,qc=None):
+    '''
+    stats: PipelineStats object to fill in (optional)
+    qc: ParsivelQC object (phase and error-code QC, default: wxcode only)
+    '''
 
-    processed_object = ProcessParsivel(raw_parsivel_object)
+    processed_object = ProcessParsivel(raw_parsivel_object,qc=qc)
 
+    t0 = time.time()
     processed_object.apply_matrix(remove_bins=remove_bins)
+    if stats is not None:
+        stats.add_time('apply_matrix',time.time()-t0)
+        _count_removed_drops(processed_object,stats)
 
     #processed_object.plot_diam_fspd()
 
+    t0 = time.time()
     processed_object.time_averaging(time_interval=time_interval)
+    if stats is not None:
+        stats.add_time('time_averaging',time.time()-t0)
+        stats.count('intervals',len(processed_object.num_records))
+        stats.count('intervals_nan_filled',np.count_nonzero(
+            np.asarray(processed_object.num_records) != int(round(time_interval*6))))
 
     return processed_object
 
-class ProcessParsivel(object):
+def _count_removed_drops(processed_object,stats):
+    #drops removed by the liquid and frozen conditional matrices
+    removed = processed_object.ndrops_10s - processed_object.processed_matrix.sum(axis=1)
+    qc_mask = processed_object.qc_mask
+    frozen = qc_mask.frozen
+    stats.count('drops_raw',processed_object.ndrops_10s.sum())
+    stats.count('drops_removed_liquid',removed[~frozen].sum())
+    stats.count('drops_removed_frozen',removed[frozen].sum())
+    stats.count('qc_phase_changed',np.count_nonzero(qc_mask.phase_changed))
+    stats.count('qc_records_removed',np.count_nonzero(qc_mask.bad))
+
+def process_parsivel_levels(raw_parsivel_object,time_intervals=[0.5,1,2,5,10,30,60],
+                            remove_bins=None,stats=None,qc=None):
+    '''
+    Like process_parsivel for several time intervals at once
+    apply_matrix is run once, returns a dict of ProcessParsivel objects
+    keyed by time interval (see ProcessParsivel.time_averaging_levels)
+    '''
+    processed_object = ProcessParsivel(raw_parsivel_object,qc=qc)
+
+    t0 = time.time()
+    processed_object.apply_matrix(remove_bins=remove_bins)
+    if stats is not None:
+        stats.add_time('apply_matrix',time.time()-t0)
+        _count_removed_drops(processed_object,stats)
+
+    t0 = time.time()
+    levels = processed_object.time_averaging_levels(time_intervals)
+    if stats is not None:
+        stats.add_time('time_averaging',time.time()-t0)
+        for level in levels.values():
+            stats.count('intervals',len(level.num_records))
+            stats.count('intervals_nan_filled',np.count_nonzero(~level.valid))
+
+    return levels
+
+def interval_index(time,interval_seconds):
+    '''
+    Returns the integer index of the averaging interval of each time
+    (datetime64 array). Intervals are counted from 1970-01-01 00:00 so every
+    interval that divides a day is aligned to midnight
+    '''
+    return time.astype('datetime64[s]').astype(np.int64) // int(interval_seconds)
+
+
+def conditional_masks(remove_bins=None,config=None):
+    '''
+    Returns the conditional matrices as a (2,1024) read-only boolean array
+    row 0: liquid matrix, row 1: frozen matrix
+    remove_bins: see ProcessParsivel.apply_matrix
+    config: ParsivelConfig or name (default configuration if None)
+    '''
+    return pcfg.get_config(config).conditional_masks(remove_bins)
+
+
+class IntervalSums(object):
+
+    '''
+    IntervalSums holds the running sums of 10 s Parsivel telegrams over a
+    run of consecutive averaging intervals (bins):
+    number of telegrams, summed matrix, maximum error code, summed temperature
+    and a histogram of wxcodes (so that the mode can be taken exactly)
+
+    first_bin: interval_index of the first bin
+    interval_seconds: length of each bin (multiple of 10 s)
+    '''
+
+    def __init__(self,first_bin,interval_seconds,num_records,matrix,error_code,
+                 temperature,wxcode_hist):
+        self.first_bin = first_bin
+        self.interval_seconds = interval_seconds
+        self.num_records = num_records #number of telegrams per bin
+        self.matrix = matrix #summed matrix per bin
+        self.error_code = error_code #max error code per bin (-1 if empty)
+        self.temperature = temperature #summed temperature per bin
+        self.wxcode_hist = wxcode_hist #(bins, wxcodes) count of each wxcode
+
+    @classmethod
+    def from_records(cls,time,matrix,error_code,temperature,wxcode,interval_seconds,
+                     first_bin=None,last_bin=None):
+        '''
+        Sums 10 s records into bins in one vectorized pass
+        Records are grouped by interval_index, the matrix and error code are
+        reduced with reduceat over the groups and the rest with bincount
+
+        first_bin, last_bin: optional range of bins to return (default: the
+        range spanned by time). Records outside of the range are ignored
+        '''
+        interval_seconds = int(round(interval_seconds))
+        if interval_seconds <= 0 or interval_seconds % 10 != 0:
+            raise ValueError('time interval must be a positive multiple of 10 s')
+        bins = interval_index(time,interval_seconds)
+        if first_bin is None:
+            first_bin = bins.min() if len(bins) > 0 else 0
+        if last_bin is None:
+            last_bin = bins.max() if len(bins) > 0 else first_bin - 1
+        nbins = int(last_bin - first_bin + 1)
+        idx = bins - first_bin
+        inside = (idx >= 0) & (idx < nbins)
+        if not inside.all():
+            idx = idx[inside]
+            time,matrix,error_code,temperature,wxcode = [np.asarray(x)[inside] for x in
+                (time,matrix,error_code,temperature,wxcode)]
+        if len(idx) > 1 and (idx[1:] < idx[:-1]).any():
+            #records out of time order, group them
+            order = np.argsort(idx,kind='mergesort')
+            idx = idx[order]
+            matrix,error_code,temperature,wxcode = [np.asarray(x)[order] for x in
+                (matrix,error_code,temperature,wxcode)]
+
+        num_records = np.bincount(idx,minlength=nbins)
+        #integer counts are summed as integers (uint16 telegrams -> uint32 sums)
+        dtype = np.promote_types(np.asarray(matrix).dtype,np.uint32)
+        sums_matrix = np.zeros((nbins,np.shape(matrix)[1]),dtype=dtype)
+        sums_error = np.zeros(nbins,dtype=int) - 1
+        ncodes = int(np.max(wxcode)) + 1 if len(idx) > 0 else 1
+        if len(idx) > 0:
+            starts = np.flatnonzero(np.r_[True,idx[1:] != idx[:-1]])
+            present = idx[starts]
+            sums_matrix[present,:] = np.add.reduceat(matrix,starts,axis=0,dtype=dtype)
+            sums_error[present] = np.maximum.reduceat(error_code,starts)
+        sums_temperature = np.bincount(idx,weights=temperature,minlength=nbins)
+        wxcode_hist = np.bincount(idx*ncodes + np.asarray(wxcode,dtype=int),
+                                  minlength=nbins*ncodes).reshape((nbins,ncodes))
+        return cls(first_bin,interval_seconds,num_records,sums_matrix,sums_error,
+                   sums_temperature,wxcode_hist)
+
+    def coarsen(self,interval_seconds):
+        '''
+        Returns the sums over longer bins of interval_seconds (a multiple of
+        self.interval_seconds), aligned to midnight like from_records
+        Counts, matrices, temperatures and wxcode histograms are added and
+        the error code is the maximum, so coarsening the sums gives the same
+        result as summing the records at the longer interval
+        '''
+        interval_seconds = int(round(interval_seconds))
+        if interval_seconds <= 0 or interval_seconds % self.interval_seconds != 0:
+            raise ValueError('time interval must be a multiple of '+
+                             str(self.interval_seconds)+' s')
+        factor = interval_seconds // self.interval_seconds
+        bins = (self.first_bin + np.arange(len(self.num_records))) // factor
+        if len(bins) == 0:
+            return IntervalSums(self.first_bin // factor,interval_seconds,self.num_records,
+                                self.matrix,self.error_code,self.temperature,self.wxcode_hist)
+        #bins are consecutive, so each longer bin is one run of bins
+        starts = np.flatnonzero(np.r_[True,bins[1:] != bins[:-1]])
+        return IntervalSums(bins[0],interval_seconds,
+                            np.add.reduceat(self.num_records,starts),
+                            np.add.reduceat(self.matrix,starts,axis=0),
+                            np.maximum.reduceat(self.error_code,starts),
+                            np.add.reduceat(self.temperature,starts),
+                            np.add.reduceat(self.wxcode_hist,starts,axis=0))
+
+    def times(self):
+        #start time of each bin (datetime64[s])
+        bins = self.first_bin + np.arange(len(self.num_records))
+        return (bins * self.interval_seconds).astype('datetime64[s]')
+
+    def averages(self,remove_missing=True):
+        '''
+        Returns time, num_records, error_code, temperature, wxcode, counts, valid
+        error code is the maximum, temperature the mean, wxcode the mode
+        (smallest code on ties) and counts the summed matrix of each interval
+        (integer, rows of invalid intervals are zero)
+
+        remove_missing = True: bins without exactly interval/10s telegrams
+        are invalid (NaN-filled)
+        remove_missing = False: partial bins are kept, empty bins are dropped
+        '''
+        expected = self.interval_seconds // 10
+        time = self.times()
+        num_records = self.num_records
+        if remove_missing:
+            good = num_records == expected
+            keep = np.arange(len(num_records))
+        else:
+            keep = np.flatnonzero(num_records > 0)
+            good = np.ones(len(keep),dtype=bool)
+        n = len(keep)
+        error_code = np.zeros(n) + float('nan')
+        temperature = np.zeros(n) + float('nan')
+        wxcode = np.zeros(n) + float('nan')
+        counts = np.zeros((n,np.shape(self.matrix)[1]),dtype=self.matrix.dtype)
+        rows = keep[good]
+        error_code[good] = self.error_code[rows]
+        temperature[good] = self.temperature[rows] / num_records[rows]
+        wxcode[good] = np.argmax(self.wxcode_hist[rows,:],axis=1)
+        counts[good,:] = self.matrix[rows,:]
+        return time[keep],num_records[keep],error_code,temperature,wxcode,counts,good
+
+
+class ProcessParsivel(ti.TimeIndexed):
 
     '''
     ProcessParsivel takes a RawParsivel object and applies various processing
@@ -31,16 +240,35 @@ class ProcessParsivel(object):
     matrix, or a "frozen" matrix that uses a flat 6 m/s cutoff while still
     including the possibility of mixed rain. I use 6 m/s instead of 4 m/s because
     2 DVD observations indicate fall velocities > 4 m/s in periods of mixed precip
+    The phase of each telegram and the telegrams left out of the averages
+    (error codes) come from the QC stage (see ParsivelQC)
+
+    The averaged data can be cut to a time range with time_slice (see TimeIndex)
     '''
 
-    def __init__(self,raw_parsivel):
+    #arrays with one row per averaged interval (see TimeIndex)
+    _aligned = ['num_records','error_code','temperature','wxcode','counts','valid']
+
+    def __init__(self,raw_parsivel=None,config=None,qc=None):
+        #raw_parsivel can be None when the averages are filled from IntervalSums (set_averages)
+        #config: ParsivelConfig or name (default: the configuration of raw_parsivel)
+        #qc: ParsivelQC object (default: phase from wxcode, all telegrams kept)
         self.raw_parsivel = raw_parsivel #raw parsivel object (input)
-        self.processed_matrix = np.zeros(np.shape(self.raw_parsivel.matrix)) #raw matrix with conditional matrix applied
+        if config is None:
+            config = getattr(raw_parsivel,'config',None)
+        self.config = pcfg.get_config(config)
+        self.qc = pqc.get_qc(qc)
+        self.qc_mask = None #QCMask of the 10 s telegrams (set by apply_matrix)
+        self.processed_matrix = None #raw matrix with conditional matrix applied (uint16)
+        if raw_parsivel is not None:
+            self.processed_matrix = np.zeros(np.shape(self.raw_parsivel.matrix),dtype=np.uint16)
         self.time = []
         self.error_code = []
         self.temperature = []
         self.wxcode = []
-        self.matrix = [] #time-averaged matrix
+        self.counts = np.zeros((0,1024),dtype=np.uint32) #time-summed matrix (drop counts)
+        self.valid = np.zeros(0,dtype=bool) #intervals with data (False = NaN-filled)
+        self.num_records = [] #number of 10s telegrams in each interval
         self.time_interval = 0.0 #time in minutes that we are averaging by (specified by user)
         
         self.ndrops_10s = [] # processed numbers of drops (10s)
@@ -51,46 +279,22 @@ class ProcessParsivel(object):
         Assumes data has correct number of elements
 
         remove_bins
-        2-element array of first and last bin to remove
+        2-element array of first and last diameter bin (0-31) to remove, at all
+        velocities (ValueError otherwise)
         None: Remove the 2-smallest (0.064, 0.193 mm) bin per Parsivel default
         [0,2]: Removes the 3rd bin as well (useful if error codes are present)
         [3,5]: Remove bins 3-5 (as well as the 0,1 bin)
         Might be useful for looking at the contribution to rainrate from
         small, medium, or large drops
         '''      
-        dmm  = self.drop_diameter # drop size bin (parsivel_diameter)
-        delta = self.drop_spread # width of drop size bin
-        velt = self.v_theoretical # theoretical terminal velocity
-        velo =  self.v # measured velocity (corrected)
-        vel1 =  self.vel1 # 50% > Velt
-        vel2 = self.vel2 # 50% < Velt
-
-        for i,wx in enumerate(self.raw_parsivel.wxcode):
-
-            # apply conditional matrix to filter out questionable drops
-            # rain if wxcode < 66, frozen if wxcode > 65
-            if wx < 66:  #66
-                matrix_tmp = np.array(self.liquid_matrix)
-            else:
-                matrix_tmp = np.array(self.frozen_matrix)
-
-            #get array removal elemants using the remove_bins parameter
-            if remove_bins != None:
-                try:
-                    ri = np.array(remove_bins)*32
-                    ri[1] +=1 
-                    matrix_tmp[ri[0]:ri[1]] = 0 
-                except InputError:
-                    print('remove_bins must be a 2-element list')
-        
-            #apply conditional matrix with remove_bins
-            matrix_corrected = self.raw_parsivel.matrix[i,:] * matrix_tmp
-            self.processed_matrix[i,:] = matrix_corrected
-            #if len(self.processed_matrix) == 0:
-            #    self.processed_matrix.append(matrix_corrected)
-            #else:
-            #    self.processed_matrix = np.vstack((self.processed_matrix,matrix_corrected))
-            self.ndrops_10s.append((np.sum(self.raw_parsivel.matrix[i,:])))
+        masks = self.config.conditional_masks(remove_bins)
+
+        # apply conditional matrix to filter out questionable drops
+        # rain if wxcode < 66, frozen if wxcode > 65 (after the QC, see ParsivelQC)
+        self.qc_mask = self.qc.mask(self.raw_parsivel)
+        frozen = self.qc_mask.frozen.astype(int)
+        np.multiply(self.raw_parsivel.matrix,masks[frozen],out=self.processed_matrix)
+        self.ndrops_10s = np.sum(self.raw_parsivel.matrix,axis=1)
    
     def time_averaging(self, time_interval=1, remove_missing=True):
         '''
@@ -101,59 +305,123 @@ class ProcessParsivel(object):
         Float that represents the time (in minutes) to average the data
         Note that the data interval is skipped if there is any missing data within
         the time interval--for instance, 1-min averaging requires six 10-s telegrams
-        Allowed values are 0.5 (30s) and any integer (1=1 min, 2= 2 min, etc)
-        Recommended values are 1,2,5,10,20,30 in order to ensure even time bins
+        Any multiple of 10 s is allowed (0.5 = 30 s, 1 = 1 min, 7 = 7 min, etc)
+        Intervals are aligned to midnight, so values that divide 60 (or 1440)
+        minutes start on the hour (or day)
 
         remove_missing = True
         Flag to remove time periods with missing data
         False will leave time intervals with partial data and ignore empty intervals
         True will fill in missing periods with float('nan')
+
+        Telegrams flagged bad by the QC are left out, so their intervals
+        count as missing
         '''
 
-        pt = self.raw_parsivel.pytime
+        sums = self._interval_sums(time_interval*60)
+        self.set_averages(sums,time_interval,remove_missing=remove_missing)
+
+    def records(self):
+        '''
+        time, processed matrix, error code, temperature and wxcode of the
+        10 s telegrams that are averaged (without those flagged bad by the QC)
+        '''
+        raw = self.raw_parsivel
+        records = [raw.time,self.processed_matrix,np.asarray(raw.error_code),
+                   np.asarray(raw.temperature),np.asarray(raw.wxcode)]
+        if self.qc_mask is not None and self.qc_mask.bad.any():
+            records = [r[~self.qc_mask.bad] for r in records]
+        return records
+
+    def _interval_sums(self,interval_seconds):
+        #IntervalSums of the telegrams kept by the QC, over the intervals of all telegrams
+        records = self.records()
+        if len(records[0]) == len(self.raw_parsivel.time):
+            return IntervalSums.from_records(*(records+[interval_seconds]))
+        bins = interval_index(self.raw_parsivel.time,int(round(interval_seconds)))
+        return IntervalSums.from_records(*(records+[interval_seconds]),
+                                         first_bin=bins.min(),last_bin=bins.max())
+
+    def time_averaging_levels(self, time_intervals, remove_missing=True):
+        '''
+        Time-averages the processed data to several intervals at once
+        (e.g. [0.5,1,2,5,10,30,60]) and returns a dict of ProcessParsivel
+        objects keyed by time interval, see time_averaging
+
+        The 10 s records are summed once, at the greatest common divisor of
+        the intervals, and every other interval is summed from the longest
+        interval already done that divides it (e.g. 10 from 5, 30 from 10).
+        Missing data is handled for each interval as in time_averaging
+        '''
+        seconds = [int(round(t*60)) for t in time_intervals]
+        for sec in seconds:
+            if sec <= 0 or sec % 10 != 0:
+                raise ValueError('time interval must be a positive multiple of 10 s')
+        base = reduce(fractions.gcd,seconds)
+        done = {base:self._interval_sums(base)}
+        for sec in sorted(set(seconds)):
+            if sec not in done:
+                finer = max([d for d in done if sec % d == 0])
+                done[sec] = done[finer].coarsen(sec)
+        levels = {}
+        for time_interval,sec in zip(time_intervals,seconds):
+            level = ProcessParsivel(config=self.config,qc=self.qc)
+            level.raw_parsivel = self.raw_parsivel
+            level.qc_mask = self.qc_mask
+            level.processed_matrix = self.processed_matrix
+            level.ndrops_10s = self.ndrops_10s
+            level.set_averages(done[sec],time_interval,remove_missing=remove_missing)
+            levels[time_interval] = level
+        return levels
+
+    def set_averages(self,sums,time_interval,remove_missing=True):
+        #fills the time-averaged data from an IntervalSums object
         self.time_interval = time_interval
-        if time_interval >= 1: #averaging to minutes
-            for k,t in enumerate(pt):
-                #seconds always 0, for minute, subtract off modulus of time interval
-                pt[k] = t.replace(second=0)
-                min_diff = datetime.timedelta(minutes=t.minute % time_interval)
-                pt[k] -= min_diff
-        if time_interval < 1: #averaging to 30 seconds
-            for k,t in enumerate(pt):
-                #subtract off modulus of seconds
-                sec_diff = datetime.timedelta(seconds=t.second % (time_interval*60))
-                pt[k] -= sec_diff
-                        
-        #iterate through averaged data, calculate new parameters
-        nowtime = pt[0]
-        dt = datetime.timedelta(minutes=time_interval)
-        while nowtime <= pt[-1]:
-            ind = np.where((pt == nowtime))[0]
-            matrix_temp = np.zeros((1024)) 
-            if len(ind) == time_interval*6: #need exact # of 10s data, otherwise assumptions will be wrong
-                self.time.append(nowtime)
-                #error code is the maximum value in each data chunk
-                self.error_code.append(max(self.raw_parsivel.error_code[ind]))
-                self.temperature.append(np.mean(self.raw_parsivel.temperature[ind]))
-                #wxcode is the mode in each data chunk
-                wxcode_tmp = scipy.stats.mstats.mode(self.raw_parsivel.wxcode[ind])[0][0]
-                self.wxcode.append(wxcode_tmp)
-                for index in ind:
-                    #matrix_temp += self.raw_parsivel.matrix[index,:]
-                    matrix_temp += self.processed_matrix[index,:]
-            else: #if missing data
-                self.time.append(nowtime)
-                self.error_code.append(float('nan'))
-		self.wxcode.append(float('nan'))
-		self.temperature.append(float('nan'))
-                matrix_temp[:] = float('nan')
-            if len(self.matrix) == 0:
-                self.matrix.append(matrix_temp)
+        self.time,self.num_records,self.error_code,self.temperature,self.wxcode,\
+            self.counts,self.valid = sums.averages(remove_missing=remove_missing)
+
+    def _take(self,index):
+        #the 10 s data is cut to the time covered by the selected intervals
+        new = ti.TimeIndexed._take(self,index)
+        if self.raw_parsivel is not None and self.time_interval > 0:
+            times = new.time_index()
+            if len(times) > 0:
+                end = times.max() + np.timedelta64(int(round(self.time_interval*60)),'s')
+                first,last = self.raw_parsivel.time_range(times.min(),end)
             else:
-                self.matrix = np.vstack((self.matrix,matrix_temp))
-          
-                
-            nowtime += dt  #jump to next time step   
+                first,last = 0,0
+            new.raw_parsivel = self.raw_parsivel._take(slice(first,last))
+            new.processed_matrix = ti.take(self.processed_matrix,slice(first,last))
+            new.ndrops_10s = ti.take(self.ndrops_10s,slice(first,last))
+            new.qc_mask = ti.take(self.qc_mask,slice(first,last))
+        return new
+
+    def as_float(self):
+        '''
+        Time-summed matrix as float with NaN rows for invalid intervals,
+        built from counts and valid. Returns a new array (a copy), writing
+        to it does not change counts
+        '''
+        matrix = self.counts.astype(float)
+        matrix[~self.valid,:] = float('nan')
+        return matrix
+
+    @property
+    def matrix(self):
+        #as_float() as a read-only array, built once for the current counts and valid
+        cached = self.__dict__.get('_matrix')
+        if cached is None or cached[0] is not self.counts or cached[1] is not self.valid:
+            matrix = self.as_float()
+            matrix.flags.writeable = False
+            cached = (self.counts,self.valid,matrix)
+            self._matrix = cached
+        return cached[2]
+
+    def __getstate__(self):
+        #the float matrix is rebuilt on request, not pickled
+        state = self.__dict__.copy()
+        state.pop('_matrix',None)
+        return state
 
     def plot_diam_fspd(self):
         # Make a 2D histogram of D vs V comparing raw and processed data
@@ -186,7 +454,7 @@ class ProcessParsivel(object):
         fig, ax = plt.subplots()
         fig.suptitle('Heavy Snow/aggregates, processed data', fontsize=15)
         fig.set_size_inches(11,6) #x,y size, default is 8,6
-        plt.pcolor(self.drop_diameter,self.v,dsd_arr,vmin = 0, vmax = 600)#vmax=np.max(dsd_arr))
+        plt.pcolor(self.config.diameter,self.config.velocity,dsd_arr,vmin = 0, vmax = 600)#vmax=np.max(dsd_arr))
         plt.plot(eqdiam_arr,fspd_arr,'-',lw=2.5,color="black")
              
         plt.xlabel('Diameter (mm)')
@@ -203,118 +471,3 @@ class ProcessParsivel(object):
     def info(self):
         print 'Raw Parsivel: '
         print 'Pytime length: '+str(len(self.pytime))
-       
-
-    drop_diameter = [
-        0.064, 0.193, 0.321, 0.45, 0.579, 0.708, 0.836, 0.965, 1.094, 1.223, 1.416, 1.674,
-        1.931, 2.189, 2.446, 2.832, 3.347, 3.862, 4.378, 4.892, 5.665,
-        6.695, 7.725, 8.755, 9.785, 11.330, 13.390, 15.45, 17.51, 19.57, 22.145, 25.235] #also dmm
-
-    drop_diameter_ott = [
-        0.062, 0.187, 0.312, 0.437, 0.562, 0.687, 0.812, 0.937, 1.062, 1.187, 1.375, 1.625,
-        1.875, 2.125, 2.375, 2.750, 3.25, 3.75, 4.25, 4.75, 5.5, 6.5, 7.5, 8.5, 9.5, 11, 
-        13, 15, 17, 19, 21.5, 24.5] #diameters from the OTT Parsivel2 manual
-
-    drop_spread = [
-        0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.257,
-        0.257, 0.257, 0.257, 0.257, 0.515, 0.515, 0.515, 0.515, 0.515, 1.030, 1.030,
-        1.030, 1.030, 1.030, 2.060, 2.060, 2.060, 2.060, 2.060, 3.090, 3.090] #also delta
-
-    v_theoretical = [
-        0.089, 0.659, 1.239, 1.803, 2.353, 2.889, 3.404, 3.892,
-        4.329, 4.705, 5.217, 5.833, 6.389, 6.886, 7.326, 7.878,
-        8.424, 8.785, 9.002, 9.117, 9.173, 9.248, 9.323, 9.398,
-        9.473, 9.586, 9.735, 9.885, 10.035, 10.185, 10.372, 10.597] #also velt
-
-    v = [
-        0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95, 1.1, 1.3, 1.5, 1.7, 1.9,
-        2.2, 2.6, 3, 3.4, 3.8, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
-        17.6, 20.8] #also velo
-
-    v_spread = [.1, .1, .1, .1, .1, .1, .1, .1, .1, .1, .2, .2, .2, .2, .2, .4,.4, 
-                .4, .4, .4, .8, .8, .8, .8, .8, 1.6, 1.6, 1.6, 1.6, 1.6, 3.2, 3.2] #gets vel1, vel2
-
-    vel1 = [
-      0.045, 0.329, 0.6200, 0.901, 1.177, 1.444, 1.702, 1.946, 2.165, 2.352,
-      2.608, 2.916,  3.194, 3.443, 3.663, 3.939, 4.212,  4.392, 4.501, 4.559,
-      4.587, 4.624,  4.6620, 4.699, 4.737, 4.793, 4.868,  4.943, 5.018,  5.093,
-      5.186, 5.299]
-
-    vel2 = [
-      0.134, 0.988, 1.859, 2.704, 3.530, 4.333, 5.106, 5.837, 6.494, 7.057,
-      7.825, 8.749, 9.583, 10.33, 10.989, 11.816, 12.635, 13.177, 13.503, 13.676,
-      13.76, 13.873, 13.985, 14.097, 14.21, 14.378, 14.603, 14.828, 15.053, 15.278,
-      15.559, 15.896]
-
-    #matrices (to right = larger diameter, down = faster fall velocity)
-    zero_matrix = np.zeros(1024)
-
-    liquid_matrix = [
-        1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-
-    #frozen matrix: velocity cutoff: 6 m/s, size cutoff 12 mm (Ali Tokay, personal communication)
-    frozen_matrix = [
-        1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
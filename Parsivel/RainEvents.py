@@ -0,0 +1,171 @@
+'''
+Rain events of a rain rate time series (Parsivel or Iowa gauge)
+
+An interval is raining when its rain rate is >= threshold (mm/h), NaN
+intervals are dry. Raining intervals separated by less than max_gap minutes
+of dry or missing data are merged into one event, events shorter than
+min_duration minutes or with less than min_accum mm are dropped.
+
+Everything is done with array operations on the whole series: the events
+are found from the differences between the raining intervals and the
+statistics of all events are taken at once with np.add.reduceat /
+np.maximum.reduceat over the rows of each event.
+
+find_events: events of any rain rate series (time, rain rate, interval)
+dsd_events: events of a ParsivelDSD, with dBZ and Dm statistics
+gauge_events: events of an IowaGaugeRaw.rain_rates result (GaugeRainRate)
+
+Example:
+import RainEvents as rev
+events = rev.dsd_events(dsd,threshold=0.1,max_gap=30,min_duration=10)
+events.start, events.accum, events.peak_rate, events.mean_dm
+events = rev.gauge_events(gauge.rain_rates(5),bucket='a')
+'''
+import numpy as np
+import TimeIndex as ti
+
+
+class RainEvents(ti.TimeIndexed):
+
+    '''
+    One row per event
+    start, end: start of the first and end of the last interval (datetime64[s])
+    first, last: index of the first and last interval of the event in the series
+    duration: end - start (minutes)
+    wet_duration: time with rain rate >= threshold (minutes)
+    accum: rain accumulation (mm)
+    peak_rate: largest rain rate (mm/h)
+    mean_rate: accum / duration (mm/h)
+    missing: number of NaN intervals in the event
+    mean_<name>, max_<name>: statistics of other variables over the raining
+    intervals (see add_stat), e.g. mean_dbz, max_dm
+    '''
+
+    _time_attr = 'start'
+    _aligned = ['end','first','last','duration','wet_duration','accum','peak_rate',
+                'mean_rate','missing']
+
+    def __init__(self,time,rainrate,interval,first,last,threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.stats = [] #names of the variables added with add_stat
+        self.first = first
+        self.last = last
+        self.start = time[first]
+        self.end = time[last] + np.timedelta64(int(round(interval*60)),'s')
+        self.duration = (self.end - self.start).astype(np.int64) / 60.
+        with np.errstate(invalid='ignore'):
+            raining = rainrate >= threshold
+        finite = np.isfinite(rainrate)
+        self._raining = raining
+        self.wet_duration = event_sum(raining.astype(float),first,last) * interval
+        self.accum = event_sum(np.where(finite,rainrate,0.),first,last) * interval / 60.
+        self.peak_rate = event_max(rainrate,first,last)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            self.mean_rate = self.accum / (self.duration / 60.)
+        self.missing = event_sum((~finite).astype(float),first,last).astype(int)
+
+    def __len__(self):
+        return len(self.first)
+
+    def _aligned_names(self):
+        return [self._time_attr] + self._aligned + \
+               ['mean_'+name for name in self.stats] + ['max_'+name for name in self.stats]
+
+    def add_stat(self,name,values):
+        '''
+        Adds mean_<name> and max_<name>: mean and maximum of values (one per
+        interval of the series, NaN skipped) over the raining intervals of
+        each event
+        '''
+        values = np.asarray(values,dtype=float)
+        if len(values) != len(self._raining):
+            raise ValueError(name+' does not have one value per interval')
+        use = self._raining & np.isfinite(values)
+        count = event_sum(use.astype(float),self.first,self.last)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            mean = event_sum(np.where(use,values,0.),self.first,self.last) / count
+        setattr(self,'mean_'+name,mean)
+        setattr(self,'max_'+name,event_max(np.where(use,values,np.nan),self.first,self.last))
+        if name not in self.stats:
+            self.stats = self.stats + [name]
+
+    def as_dict(self):
+        #arrays of all event columns keyed by name (e.g. for np.savez)
+        return dict([(name,getattr(self,name)) for name in self._aligned_names()])
+
+    def save(self,filename):
+        #saves the event table to a .npz file
+        np.savez(filename,interval=self.interval,threshold=self.threshold,**self.as_dict())
+
+
+def find_events(time,rainrate,interval,threshold=0.1,max_gap=30,min_duration=0,min_accum=0.):
+    '''
+    Events of a rain rate series
+    time: start of each interval (sorted datetime64 or datetime)
+    rainrate: rain rate of each interval (mm/h, NaN for missing)
+    interval: length of the intervals (minutes)
+    threshold: smallest raining rain rate (mm/h)
+    max_gap: longest dry or missing time inside an event (minutes)
+    min_duration, min_accum: shortest event (minutes) and smallest accumulation (mm)
+    Returns a RainEvents object
+    '''
+    time = ti.to_datetime64(time)
+    rainrate = np.asarray(rainrate,dtype=float)
+    if len(time) != len(rainrate):
+        raise ValueError('time and rainrate must have the same length')
+    with np.errstate(invalid='ignore'):
+        wet = np.flatnonzero(rainrate >= threshold)
+    seconds = time[wet].astype(np.int64)
+    length = int(round(interval*60))
+    #a new event starts when the dry time since the last raining interval is > max_gap
+    new = np.r_[True,seconds[1:] - (seconds[:-1] + length) > max_gap*60.][0:len(wet)]
+    first = wet[new]
+    last = wet[np.r_[new[1:],True][0:len(wet)]]
+    events = RainEvents(time,rainrate,interval,first,last,threshold)
+    keep = (events.duration >= min_duration) & (events.accum >= min_accum)
+    if not keep.all():
+        events = events._take(np.flatnonzero(keep))
+    return events
+
+
+def dsd_events(dsd,threshold=0.1,max_gap=30,min_duration=0,min_accum=0.):
+    #events of a ParsivelDSD with mean/max dbz and dm (see find_events)
+    events = find_events(dsd.time,dsd.rainrate[0],dsd.proc_p2.time_interval,threshold=threshold,
+                         max_gap=max_gap,min_duration=min_duration,min_accum=min_accum)
+    events.add_stat('dbz',dsd.dbz)
+    events.add_stat('dm',dsd.dm)
+    return events
+
+
+def gauge_events(rates,bucket='a',threshold=0.1,max_gap=30,min_duration=0,min_accum=0.):
+    '''
+    Events of a GaugeRainRate (IowaGaugeRaw.rain_rates or align_to)
+    bucket: 'a', 'b' or 'mean' of both buckets
+    '''
+    if bucket == 'mean':
+        rainrate = (rates.rate_a + rates.rate_b) / 2.
+    else:
+        rainrate = getattr(rates,'rate_'+bucket)
+    return find_events(rates.time,rainrate,rates.interval,threshold=threshold,max_gap=max_gap,
+                       min_duration=min_duration,min_accum=min_accum)
+
+
+def _event_reduce(ufunc,values,first,last,pad):
+    #ufunc.reduceat over values[first:last+1] of each event
+    #(bounds are [first, last+1) pairs, values are padded so last+1 is a valid index)
+    if len(first) == 0:
+        return np.zeros(0)
+    bounds = np.ravel(np.column_stack((first,last + 1)))
+    return ufunc.reduceat(np.r_[values,pad],bounds)[::2]
+
+
+def event_sum(values,first,last):
+    #sum of values[first:last+1] of each event (or any other groups of rows)
+    return _event_reduce(np.add,values,first,last,0.)
+
+
+def event_max(values,first,last):
+    #maximum of values[first:last+1] of each event, NaN skipped (NaN if all are)
+    peak = _event_reduce(np.maximum,np.where(np.isnan(values),-np.inf,values),first,last,-np.inf)
+    return np.where(peak == -np.inf,np.nan,peak)
@@ -1,20 +1,55 @@
 import numpy as np
 import pdb
+import time
 import datetime
+import ParsivelCache as pc
+import ParsivelConfig as pcfg
+import TimeIndex as ti
 
 
-def read_parsivel(filenames):
+def read_parsivel(filenames,use_cache=True,cache_dir=None,stats=None,config=None):
     '''
     Takes an APU Parsivel file, returns a RawParsivel object
+
+    use_cache = True
+    Load the parsed files from the memory-mapped cache (see ParsivelCache)
+    if the source files are unchanged, otherwise parse and write the cache
+    False reads the text files and leaves the cache alone
+    cache_dir: cache location (default ParsivelCache.CACHE_DIR)
+    stats: PipelineStats object to fill in (optional)
+    config: ParsivelConfig or name, passed on to the processing (see ParsivelConfig)
     '''
     # initialize class:
-    raw_parsivel = RawParsivel() 
+    raw_parsivel = RawParsivel(config=config)
+
+    if use_cache:
+        t0 = time.time()
+        loaded = pc.load(raw_parsivel,filenames,cache_dir)
+        if stats is not None:
+            stats.add_time('cache_load',time.time()-t0)
+            stats.count('cache_hits' if loaded else 'cache_misses')
+        if loaded:
+            _count_records(raw_parsivel,filenames,stats)
+            return raw_parsivel
  
     # read parsivel file
     # takes array of filenames
+    t0 = time.time()
     raw_parsivel.read_parsivel_file(filenames)
 
     raw_parsivel.convert_to_arrays()
+    if stats is not None:
+        stats.add_time('read',time.time()-t0)
+    _count_records(raw_parsivel,filenames,stats)
+
+    if use_cache:
+        t0 = time.time()
+        try:
+            pc.save(raw_parsivel,filenames,cache_dir)
+        except (IOError,OSError) as e:
+            print 'could not write Parsivel cache: '+str(e)
+        if stats is not None:
+            stats.add_time('cache_save',time.time()-t0)
 
     # this creates an object called "raw_parsivel" that contains the disdrometer
     # data for 1 hr at 10 s intervals (length 360 or 360x1024 for matrix
@@ -24,7 +59,53 @@ def read_parsivel(filenames):
     return raw_parsivel
     
 
-class RawParsivel(object):
+def _count_records(raw_parsivel,filenames,stats):
+    if stats is not None:
+        stats.count('files_read',len(filenames))
+        stats.count('records_read',len(raw_parsivel.time))
+        stats.count('bad_lines',raw_parsivel.bad_lines)
+
+
+def parse_telegram(line):
+    '''
+    Parses a single telegram (one line of an APU file)
+    Returns time (datetime64[s]), apu, header, counts
+    header: error_code, temperature, ndrops, rain, dbz, visibility, (unused), wxcode
+    counts: the 1024 drop counts (uint16), None if the matrix can't be read
+    Raises ValueError if the time or header can't be read
+    '''
+    data = line.split(',',9)
+    stamp,apu = data[0].split(';')
+    telegram_time = _stamps_to_datetime64(np.array([int(stamp)],dtype=np.int64))[0]
+    header = np.array([float(i) for i in data[1:9]])
+    if len(header) != 8:
+        raise ValueError('short telegram header')
+    counts = None
+    if len(data) == 10 and data[9].count(',') == 1024:
+        try:
+            counts = np.array([int(i) for i in data[9].split(',')[0:1024]])
+        except ValueError:
+            pass
+        if counts is not None:
+            if counts.min() < 0 or counts.max() > 65535:
+                counts = None
+            else:
+                counts = counts.astype(np.uint16)
+    return telegram_time,apu,header,counts
+
+
+def _stamps_to_datetime64(stamps):
+    '''
+    Converts an array of yyyymmddhhmmss integers to datetime64[s]
+    '''
+    months = (stamps // 10**10 - 1970) * 12 + stamps // 10**8 % 100 - 1
+    seconds = (stamps // 10**6 % 100 - 1) * 86400 + stamps // 10**4 % 100 * 3600 + \
+              stamps // 100 % 100 * 60 + stamps % 100
+    return months.astype('datetime64[M]').astype('datetime64[s]') + \
+           seconds.astype('timedelta64[s]')
+
+
+class RawParsivel(ti.TimeIndexed):
 
     '''
     read_parsivel class takes a list of APU files (.dat) generated by the
@@ -41,10 +122,14 @@ class RawParsivel(object):
     Filenames must be in correct order (use glob.glob)    
     '''
 
-    def __init__(self):
+    #arrays with one row per telegram (see TimeIndex)
+    _aligned = ['error_code','temperature','dbz','rain','ndrops','visibility','wxcode','matrix']
+
+    def __init__(self,config=None):
         #self.filename = filename #filename
+        self.config = pcfg.get_config(config) #bin tables (see ParsivelConfig)
         self.apu = [] #apu number
-        self.pytime = [] #time in datatime
+        self.time = np.array([],dtype='datetime64[s]') #time in datetime64[s]
         self.error_code = [] #error code (0,1,2,3)
         self.temperature = [] #Parsivel temperature
         self.dbz = [] #Parsivel dBZ
@@ -52,109 +137,110 @@ class RawParsivel(object):
         self.ndrops = [] #Parsivel # particles (use this one)
         self.visibility = [] #Parsivel visibility
         self.wxcode = [] #Parsivel wx code
-        self.matrix = [] #Parsivel drop matrix
+        self.matrix = np.zeros((0,1024),dtype=np.uint16) #Parsivel drop matrix
+        self.bad_lines = 0 #number of telegrams that could not be read
+
+    @property
+    def pytime(self):
+        #time as datetime objects (built on request from self.time)
+        return self.time.astype(object)
 
     def read_parsivel_file(self,filenames):
-        #Figure out length of files (needed for np.matrix)
-        #8640 lines = full day
-        matrixdim = 0
-        x = []
+        '''
+        Reads all telegrams in a single pass over the files
+        The header of each telegram is parsed line by line, the 1024 drop
+        counts of each file are parsed in one bulk call into a preallocated
+        uint16 matrix. Timestamps are decoded column-wise into datetime64.
+
+        A telegram with an unreadable drop matrix is kept as a row of zeros,
+        a telegram with an unreadable header is dropped. Both are counted
+        in self.bad_lines
+        '''
+        blocks = []
         for filename in filenames:
             with open(filename) as f:
-                for line in f:
-                    matrixdim += 1
-        self.matrix = np.zeros((matrixdim,1024))
+                blocks.append(f.read().splitlines())
+        #8640 lines = full day
+        matrixdim = sum([len(lines) for lines in blocks])
+        stamps = np.zeros(matrixdim,dtype=np.int64)
+        header = np.zeros((matrixdim,8))
+        self.matrix = np.zeros((matrixdim,1024),dtype=np.uint16)
+        bad_rows = []
         dim = 0
-        #read through files again, this time filling lists and matrix
-        for filename in filenames:
-            with open(filename) as f:
-                for line in f:
-                    data = line.split(',')
-                    time = data[0].split(';')[0]
-                    apu = str(data[0].split(';')[1])
-                    self.pytime.append(datetime.datetime(int(time[0:4]),int(time[4:6]),\
-                              int(time[6:8]),int(time[8:10]),int(time[10:12]),\
-                              int(time[12:14])))
-                    self.error_code.append(int(data[1]))
-                    self.temperature.append(int(data[2]))
-                    self.ndrops.append(int(data[3]))
-                    self.visibility.append(int(data[6]))
-                    self.rain.append(float(data[4]))
-                    self.dbz.append(float(data[5]))
-                    self.wxcode.append(int(data[8]))
-                    try:
-                        matrix_temp = np.array([int(i) for i in data[9:-1]])
-                        self.matrix[dim,:] = matrix_temp
-                        dim += 1
-                    except:
-                        #leaves bad line all zeros...
-                        print 'bad line at: '+str(self.pytime[-1])
-                        dim += 1
+        for lines in blocks:
+            rows = []
+            payloads = []
+            for line in lines:
+                data = line.split(',',9)
+                try:
+                    stamp,apu = data[0].split(';')
+                    stamps[dim] = int(stamp)
+                    header[dim,:] = [float(i) for i in data[1:9]]
+                except ValueError:
+                    if line.strip():
+                        print 'bad line at: '+line[0:14]
+                        self.bad_lines += 1
+                    continue
+                self.apu = apu
+                #matrix is data[9:-1] of the full line: 1024 counts + trailing field
+                if len(data) == 10 and data[9].count(',') == 1024:
+                    rows.append(dim)
+                    payloads.append(data[9][0:data[9].rfind(',')])
+                else:
+                    bad_rows.append(dim)
+                dim += 1
+            if len(rows) > 0:
+                bad_rows.extend(self._fill_matrix(rows,payloads))
+
+        stamps = stamps[0:dim]
+        header = header[0:dim,:]
+        self.matrix = self.matrix[0:dim,:]
+        self.time = _stamps_to_datetime64(stamps)
+        self.error_code = header[:,0].astype(int)
+        self.temperature = header[:,1].astype(int)
+        self.ndrops = header[:,2].astype(int)
+        self.rain = header[:,3]
+        self.dbz = header[:,4]
+        self.visibility = header[:,5].astype(int)
+        self.wxcode = header[:,7].astype(int)
+
+        #leaves bad lines all zeros...
+        for row in sorted(bad_rows):
+            print 'bad line at: '+str(self.time[row])
+        self.bad_lines += len(bad_rows)
+
+    def _fill_matrix(self,rows,payloads):
+        #bulk parse the drop counts of one file into self.matrix
+        #falls back to line-by-line parsing if any telegram is malformed
+        #returns the rows that could not be read
+        counts = np.fromstring(','.join(payloads),dtype=np.int64,sep=',')
+        if len(counts) == 1024*len(rows) and counts.min() >= 0 and counts.max() < 65536:
+            self.matrix[rows,:] = counts.reshape((len(rows),1024))
+            return []
+        bad_rows = []
+        for row,payload in zip(rows,payloads):
+            try:
+                counts = np.array([int(i) for i in payload.split(',')])
+            except ValueError:
+                bad_rows.append(row)
+                continue
+            if counts.min() < 0 or counts.max() > 65535:
+                bad_rows.append(row)
+                continue
+            self.matrix[row,:] = counts
+        return bad_rows
 
     def convert_to_arrays(self):
-        self.pytime= np.array(self.pytime)
-        self.error_code = np.array(self.error_code)
-        self.temperature = np.array(self.temperature)
-        self.ndrops = np.array(self.ndrops)
-        self.visibility = np.array(self.visibility)
-        self.rain = np.array(self.rain)
-        self.dbz = np.array(self.dbz)
-        self.wxcode = np.array(self.wxcode)
+        #read_parsivel_file already fills arrays, kept for older scripts
+        self.error_code = np.asarray(self.error_code)
+        self.temperature = np.asarray(self.temperature)
+        self.ndrops = np.asarray(self.ndrops)
+        self.visibility = np.asarray(self.visibility)
+        self.rain = np.asarray(self.rain)
+        self.dbz = np.asarray(self.dbz)
+        self.wxcode = np.asarray(self.wxcode)
 
     def info(self):
         print 'Raw Parsivel: '
-        print 'Pytime length: '+str(len(self.pytime))
-       
-
-    diameter = [
-        0.06, 0.19, 0.32, 0.45, 0.58, 0.71, 0.84, 0.96, 1.09, 1.22, 1.42, 1.67,
-        1.93, 2.19, 2.45, 2.83, 3.35, 3.86, 4.38, 4.89, 5.66,
-        6.7, 7.72, 8.76, 9.78, 11.33, 13.39, 15.45, 17.51, 19.57, 22.15, 25.24]
-
-    spread = [
-        0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.129, 0.257,
-        0.257, 0.257, 0.257, 0.257, 0.515, 0.515, 0.515, 0.515, 0.515, 1.030, 1.030,
-        1.030, 1.030, 1.030, 2.060, 2.060, 2.060, 2.060, 2.060, 3.090, 3.090]
-
-    v = [
-        0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95, 1.1, 1.3, 1.5, 1.7, 1.9,
-        2.2, 2.6, 3, 3.4, 3.8, 4.4, 5.2, 6.0, 6.8, 7.6, 8.8, 10.4, 12.0, 13.6, 15.2,
-        17.6, 20.8]
-
-    v_spread = [.1, .1, .1, .1, .1, .1, .1, .1, .1, .1, .2, .2, .2, .2, .2, .4,
-                .4, .4, .4, .4, .8, .8, .8, .8, .8, 1.6, 1.6, 1.6, 1.6, 1.6, 3.2, 3.2]
-
-
-    liquid_matrix = [
-        1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+        print 'Time length: '+str(len(self.time))
+        print 'Bad lines: '+str(self.bad_lines)
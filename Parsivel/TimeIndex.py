@@ -0,0 +1,196 @@
+'''
+Time index for ProcessParsivel, ParsivelDSD and RawParsivel
+
+The time arrays are sorted datetime64[s] arrays, so time ranges and
+nearest times are found with np.searchsorted instead of comparing datetimes
+one by one.
+
+time_slice: object with all arrays aligned with time cut to [start, end).
+The arrays of the new object are views of the original ones (no copy),
+products that were already computed (e.g. dsd.rainrate, BinProduct tuples)
+are sliced too, others are computed from the sliced data when accessed.
+Metadata (config, time_interval, ...) is shared.
+nearest: index of the time closest to each requested time
+align: values of one series summed/averaged onto the intervals of another
+(e.g. a 1 min rain rate onto 5 min gauge intervals)
+The functions time_range, nearest and grid_index work on any datetime64
+array (e.g. the tip times of IowaGaugeRaw), the TimeIndexed methods call
+them with the time of the object.
+
+Example:
+afternoon = dsd.time_slice('2015-12-08T14:00','2015-12-08T18:00')
+afternoon.rainrate[0], afternoon.proc_p2.matrix
+i = dsd.nearest(datetime.datetime(2015,12,8,14,3))
+rate_5min = dsd.align(dsd.rainrate[0],gauge_rates.time,5,how='mean')
+'''
+import copy
+import numpy as np
+
+
+def to_datetime64(times):
+    #datetime, string, datetime64 or a list of them to datetime64[s]
+    if isinstance(times,np.ndarray) and times.dtype.kind == 'M':
+        return times.astype('datetime64[s]',copy=False)
+    if isinstance(times,(list,tuple,np.ndarray)):
+        return np.array([np.datetime64(t,'s') for t in times],dtype='datetime64[s]')
+    return np.datetime64(times,'s')
+
+
+def take(value,index):
+    '''
+    Rows index (slice or integer array) of one aligned value: arrays and
+    lists are indexed along their first axis, tuples and dicts element by
+    element, objects with a _take method (BinProduct, GammaParams,
+    TimeIndexed objects) are asked to take the rows themselves
+    '''
+    if value is None:
+        return None
+    if hasattr(value,'_take'):
+        return value._take(index)
+    if isinstance(value,np.ndarray):
+        return value[index] if value.ndim > 0 else value
+    if isinstance(value,tuple):
+        return tuple([take(v,index) for v in value])
+    if isinstance(value,dict):
+        return dict([(k,take(v,index)) for k,v in value.items()])
+    if isinstance(value,list):
+        if isinstance(index,slice):
+            return value[index]
+        return [value[i] for i in index]
+    return value
+
+
+def time_range(times,start=None,end=None):
+    '''
+    First and last+1 index of the times (sorted datetime64) in [start, end)
+    start, end: datetime, datetime64 or string (None = open)
+    '''
+    first,last = 0,len(times)
+    if start is not None:
+        first = np.searchsorted(times,to_datetime64(start),side='left')
+    if end is not None:
+        last = np.searchsorted(times,to_datetime64(end),side='left')
+    return int(first),int(max(first,last))
+
+
+def nearest(index,times,tolerance=None):
+    '''
+    Position in index (sorted datetime64) of the time closest to each of
+    times (an int for one time)
+    tolerance: maximum distance (seconds), farther times get -1
+    '''
+    targets = to_datetime64(times)
+    scalar = np.ndim(targets) == 0
+    targets = np.atleast_1d(targets)
+    if len(index) == 0:
+        closest = np.zeros(len(targets),dtype=int) - 1
+        return int(closest[0]) if scalar else closest
+    right = np.minimum(np.searchsorted(index,targets),len(index)-1)
+    left = np.maximum(right - 1,0)
+    dist_left = np.abs((targets - index[left]).astype(np.int64))
+    dist_right = np.abs((index[right] - targets).astype(np.int64))
+    closest = np.where(dist_right < dist_left,right,left)
+    if tolerance is not None:
+        closest[np.minimum(dist_left,dist_right) > tolerance] = -1
+    return int(closest[0]) if scalar else closest
+
+
+def grid_index(times,grid_time,interval):
+    '''
+    Interval of another grid that each of times (datetime64) falls in (-1 for none)
+    grid_time: sorted start times of the intervals (e.g. GaugeRainRate.time)
+    interval: length of the intervals (minutes)
+    '''
+    times = to_datetime64(times)
+    grid_time = to_datetime64(grid_time)
+    length = np.timedelta64(int(round(interval*60)),'s')
+    cell = np.searchsorted(grid_time,times,side='right') - 1
+    inside = cell >= 0
+    inside[inside] = times[inside] < grid_time[cell[inside]] + length
+    return np.where(inside,cell,-1)
+
+
+class TimeIndexed(object):
+
+    '''
+    Mixin for classes with a sorted datetime64 time array
+    _time_attr: name of the time array
+    _aligned: names of the other attributes with one row per time
+    (subclasses can add more with _aligned_names)
+    '''
+
+    _time_attr = 'time'
+    _aligned = []
+
+    def _aligned_names(self):
+        return [self._time_attr] + list(self._aligned)
+
+    def time_index(self):
+        #time as a sorted datetime64[s] array
+        times = to_datetime64(getattr(self,self._time_attr))
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            raise ValueError('time is not sorted, can not be indexed')
+        return times
+
+    def time_range(self,start=None,end=None):
+        '''
+        First and last+1 index of the times in [start, end)
+        start, end: datetime, datetime64 or string (None = open)
+        '''
+        return time_range(self.time_index(),start,end)
+
+    def time_slice(self,start=None,end=None):
+        #copy with every aligned array cut to [start, end) (views)
+        first,last = self.time_range(start,end)
+        return self._take(slice(first,last))
+
+    def _take(self,index):
+        #shallow copy with the aligned attributes indexed by index
+        new = copy.copy(self)
+        for name in self._aligned_names():
+            if name in self.__dict__:
+                setattr(new,name,take(self.__dict__[name],index))
+        return new
+
+    def nearest(self,times,tolerance=None):
+        '''
+        Index of the time closest to each of times (an int for one time)
+        tolerance: maximum distance (seconds), farther times get -1
+        '''
+        return nearest(self.time_index(),times,tolerance)
+
+    def grid_index(self,grid_time,interval):
+        '''
+        Interval of another grid that each time falls in (-1 for none)
+        grid_time: sorted start times of the intervals (e.g. GaugeRainRate.time)
+        interval: length of the intervals (minutes)
+        '''
+        return grid_index(self.time_index(),grid_time,interval)
+
+    def align(self,values,grid_time,interval,how='mean'):
+        '''
+        values (one per time, or the name of an aligned attribute) on the
+        intervals of another grid, see grid_index
+        how: 'sum', 'mean' or 'max' of the values in each interval,
+        NaN values are skipped, intervals without values are NaN
+        '''
+        if isinstance(values,str):
+            values = getattr(self,values)
+        values = np.asarray(values,dtype=float)
+        ngrid = len(to_datetime64(grid_time))
+        cell = self.grid_index(grid_time,interval)
+        good = (cell >= 0) & np.isfinite(values)
+        cell,values = cell[good],values[good]
+        count = np.bincount(cell,minlength=ngrid)
+        if how == 'max':
+            out = np.zeros(ngrid) + float('nan')
+            np.fmax.at(out,cell,values)
+            return out
+        if how not in ('sum','mean'):
+            raise ValueError('how must be sum, mean or max')
+        out = np.bincount(cell,weights=values,minlength=ngrid).astype(float)
+        with np.errstate(invalid='ignore'):
+            if how == 'mean':
+                out = out / count
+        out[count == 0] = float('nan')
+        return out
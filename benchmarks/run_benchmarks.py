@@ -0,0 +1,198 @@
+'''
+Benchmarks of the Parsivel and Iowa gauge pipelines on synthetic data
+
+Generates synthetic APU days and Iowa gauge packets (see synthetic.py) and
+times each stage separately:
+read_parsivel_file, apply_matrix, time_averaging, get_precip_params (all products),
+read_packets, clean_data
+
+Each stage is run --repeat times on fresh inputs and the fastest run is
+reported with its throughput (telegrams/s or tips/s). Memory of each stage
+(kB, of the run that needed the most):
+rss_before_kb: resident memory when the stage starts
+rss_delta_kb: resident memory after the stage minus before (memory kept)
+peak_rss_kb, peak_increase_kb: peak resident memory during the stage and
+its increase over rss_before_kb (memory the stage needs)
+The peak is made stage-local by resetting the process high-water mark
+before each stage (/proc/self/clear_refs, Linux). Where that is not
+possible the peak values are null and only the process peak is reported
+(peak_rss_kb, generate_peak_rss_kb: peak while writing the synthetic data).
+Results are written as JSON to stdout or to --output.
+
+Usage:
+python benchmarks/run_benchmarks.py --days 2 --tips 5000 --output bench.json
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','Gauge'))
+import synthetic
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelDSD as pdsd
+import IowaGaugeRaw as igr
+
+
+def peak_rss_kb():
+    #peak resident memory of the process (since the last reset_peak_rss)
+    #VmHWM where available, ru_maxrss is only updated now and then
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError,OSError,ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def rss_kb():
+    #current resident memory, None where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError,OSError,IndexError,ValueError):
+        return None
+    return pages * resource.getpagesize() // 1024
+
+
+def reset_peak_rss():
+    #resets the high-water mark of the process to the current RSS (Linux >= 4.0)
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+    except (IOError,OSError):
+        return False
+    return True
+
+
+class StageTimer(object):
+
+    '''
+    Collects the best time of each stage over several runs
+    '''
+
+    def __init__(self):
+        self.stages = {}
+
+    def time(self,stage,items,unit,function,*args):
+        before = rss_kb()
+        local_peak = reset_peak_rss() and before is not None
+        t0 = time.time()
+        result = function(*args)
+        seconds = time.time() - t0
+        after = rss_kb()
+        memory = {'rss_before_kb':before,'rss_delta_kb':None,'peak_rss_kb':None,
+                  'peak_increase_kb':None}
+        if before is not None and after is not None:
+            memory['rss_delta_kb'] = after - before
+        if local_peak:
+            memory['peak_rss_kb'] = peak_rss_kb()
+            memory['peak_increase_kb'] = memory['peak_rss_kb'] - before
+        best = self.stages.setdefault(stage,{})
+        if 'seconds' not in best or seconds < best['seconds']:
+            best.update({'seconds':seconds,'items':items,'unit':unit,
+                         'throughput':items/seconds if seconds > 0 else float('inf')})
+        #memory of the run that needed the most
+        if 'peak_increase_kb' not in best or _memory_key(memory) > _memory_key(best):
+            best.update(memory)
+        return result
+
+
+def _memory_key(memory):
+    return (memory['peak_increase_kb'],memory['rss_delta_kb'])
+
+
+def run_parsivel(timer,files,ntelegrams,time_interval):
+    devnull = open(os.devnull,'w')
+    stdout = sys.stdout
+    sys.stdout = devnull #bad lines are printed
+    try:
+        raw = rp.RawParsivel()
+        timer.time('read_parsivel_file',ntelegrams,'telegrams/s',raw.read_parsivel_file,files)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+    raw.convert_to_arrays()
+    ntelegrams = len(raw.time)
+    processed = pp.ProcessParsivel(raw)
+    timer.time('apply_matrix',ntelegrams,'telegrams/s',processed.apply_matrix)
+    timer.time('time_averaging',ntelegrams,'telegrams/s',processed.time_averaging,time_interval)
+    dsd = pdsd.ParsivelDSD(processed)
+    timer.time('get_precip_params',ntelegrams,'telegrams/s',dsd.get_precip_params,dsd.products)
+
+
+def run_gauge(timer,packetdir,ntips,date):
+    gauge = igr.IowaGaugeRaw('NASA0043',date)
+    timer.time('read_packets',ntips,'tips/s',gauge.read_packets,packetdir)
+    timer.time('clean_data',ntips,'tips/s',gauge.clean_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days',type=int,default=1,help='synthetic APU days')
+    parser.add_argument('--tips',type=int,default=2000,help='gauge tips per day')
+    parser.add_argument('--time-interval',type=float,default=1.,help='averaging interval (min)')
+    parser.add_argument('--repeat',type=int,default=3,help='runs per stage (best is kept)')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--workdir',default=None,help='where to write synthetic data (default: temporary)')
+    parser.add_argument('--output',default=None,help='JSON output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pyolympex_bench_')
+    try:
+        t0 = time.time()
+        files = []
+        ntelegrams = 0
+        for d in range(args.days):
+            date = '201512%02d' % (d + 1)
+            day_files,n = synthetic.write_parsivel_day(os.path.join(workdir,'apu'),date=date,
+                                                       seed=args.seed + d)
+            files.extend(day_files)
+            ntelegrams += n
+        packetdir = os.path.join(workdir,'packets')+'/'
+        packet_files,ntips = synthetic.write_iowa_packets(packetdir,date='20151101',seed=args.seed,
+                                                          tips_per_day=args.tips)
+        generate_seconds = time.time() - t0
+        generate_peak = peak_rss_kb()
+
+        timer = StageTimer()
+        for i in range(args.repeat):
+            run_parsivel(timer,files,ntelegrams,args.time_interval)
+            run_gauge(timer,packetdir,ntips,'20151101')
+
+        results = {'config':{'days':args.days,'telegrams':ntelegrams,'tips':ntips,
+                             'time_interval':args.time_interval,'repeat':args.repeat,
+                             'seed':args.seed},
+                   'environment':{'python':platform.python_version(),'numpy':np.__version__,
+                                  'machine':platform.machine()},
+                   'generate_seconds':generate_seconds,
+                   'generate_peak_rss_kb':generate_peak,
+                   'peak_rss_kb':max([generate_peak,peak_rss_kb()] +
+                                     [stage['peak_rss_kb'] for stage in timer.stages.values()]),
+                   'stages':timer.stages}
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir)
+
+    text = json.dumps(results,indent=2,sort_keys=True)
+    if args.output is None:
+        print text
+    else:
+        with open(args.output,'w') as f:
+            f.write(text+'\n')
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+'''
+Synthetic OLYMPEX data for benchmarks
+
+write_parsivel_day writes a day of hourly APU files (apuxx_yyyymmddhh.dat)
+in the NASA telegram layout:
+yyyymmddhhmmss;apuxx,error_code,temperature,ndrops,rain,dbz,visibility,0,wxcode,<1024 counts>,
+The day is built from 10-minute periods of rain, snow and dry weather.
+Drop sizes follow an exponential distribution and fall speeds the Atlas et
+al. (1973) curve (slower and more scattered for snow). Periods with error
+codes, missing telegrams, missing hours and truncated lines are included.
+
+write_iowa_packets writes the packets of one gauge-day (plus the first
+packet of the next day, which repeats the last tips of the day) as
+NASAxxxx_nnn.txt files, in the layout read by IowaGaugeRaw.parse_packet:
+line 0 gauge, line 1 packet time, line 2 lat,lon, line 3 metadata,
+line 4 header, then one 'yyyy-mm-dd hh:mm:ss,81' (or 82) line per tip.
+Some tips are duplicated, as in the real packets.
+'''
+import os
+import sys
+import datetime
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Parsivel'))
+import ParsivelConfig as pcfg
+
+#drops are binned on the OTT Parsivel2 size and velocity classes (see ParsivelConfig)
+config = pcfg.get_config('parsivel2')
+diameter_edges = config.diameter_edges
+velocity_edges = config.velocity_edges
+
+
+def weather_periods(ntelegrams,rng,rain_fraction=0.4,snow_fraction=0.15):
+    #weather type of each telegram (0 dry, 1 rain, 2 snow), in 10-minute blocks
+    nblocks = -(-ntelegrams // 60)
+    kind = rng.choice([0,1,2],size=nblocks,
+                      p=[1.-rain_fraction-snow_fraction,rain_fraction,snow_fraction])
+    return np.repeat(kind,60)[0:ntelegrams]
+
+
+def parsivel_matrices(kind,rng):
+    '''
+    Drop matrices (N,1024) for a sequence of weather types
+    Rain: exponential sizes (mean 1 mm), Atlas fall speeds +-10%
+    Snow: exponential sizes (mean 2 mm), fall speeds 0.5-2 m/s
+    '''
+    n = len(kind)
+    intensity = rng.gamma(1.5,1.,size=n) #varies rain/snow rate between telegrams
+    ndrops = rng.poisson(np.where(kind == 1,150.,np.where(kind == 2,80.,0.)) * intensity)
+    telegram = np.repeat(np.arange(n),ndrops)
+    kind_drop = kind[telegram]
+    size = np.where(kind_drop == 1,rng.exponential(1.,len(telegram)),
+                    rng.exponential(2.,len(telegram))) + 0.2
+    fall = np.where(kind_drop == 1,
+                    (9.65 - 10.3*np.exp(-0.6*size)) * rng.normal(1.,0.1,len(telegram)),
+                    rng.uniform(0.5,2.,len(telegram)))
+    dbin = np.clip(np.searchsorted(diameter_edges,size) - 1,0,31)
+    vbin = np.clip(np.searchsorted(velocity_edges,fall) - 1,0,31)
+    index = telegram*1024 + vbin*32 + dbin
+    return np.bincount(index,minlength=n*1024).reshape((n,1024))
+
+
+def write_parsivel_day(outdir,apu='apu06',date='20151208',seed=0,rain_fraction=0.4,
+                       snow_fraction=0.15,error_fraction=0.05,gap_fraction=0.01,
+                       bad_fraction=0.001,missing_hours=1):
+    '''
+    Writes the hourly files of one synthetic APU day to outdir
+    error_fraction: fraction of the day (in 10-minute blocks) with error codes
+    gap_fraction: fraction of telegrams that are missing
+    bad_fraction: fraction of telegrams that are truncated
+    missing_hours: number of hours without a file
+    Returns the list of files written and the number of telegrams
+    '''
+    rng = np.random.RandomState(seed)
+    day = datetime.datetime.strptime(date,'%Y%m%d')
+    kind = weather_periods(8640,rng,rain_fraction,snow_fraction)
+    matrix = parsivel_matrices(kind,rng)
+    error_code = np.where(np.repeat(rng.rand(144) < error_fraction,60),
+                          rng.choice([1,2,3],size=8640),0)
+    temperature = np.where(kind == 2,rng.randint(-3,2,8640),rng.randint(3,12,8640))
+    wxcode = np.where(kind == 1,rng.choice([61,63,65],size=8640),
+                      np.where(kind == 2,rng.choice([71,73,75],size=8640),0))
+    #single-telegram wxcode flicker during mixed precip
+    flicker = (kind > 0) & (rng.rand(8640) < 0.02)
+    wxcode[flicker] = np.where(kind[flicker] == 1,71,61)
+    ndrops = matrix.sum(axis=1)
+    rain = ndrops * 0.001
+    dbz = np.where(ndrops > 0,10*np.log10(ndrops + 1.) + 10,-9.999)
+    keep = rng.rand(8640) >= gap_fraction
+    bad = rng.rand(8640) < bad_fraction
+    skip_hours = set(rng.choice(24,size=missing_hours,replace=False)) if missing_hours else set()
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    files = []
+    ntelegrams = 0
+    for hour in range(24):
+        if hour in skip_hours:
+            continue
+        filename = os.path.join(outdir,apu+'_'+date+'%02d' % hour+'.dat')
+        with open(filename,'w') as f:
+            for i in range(hour*360,(hour+1)*360):
+                if not keep[i]:
+                    continue
+                stamp = (day + datetime.timedelta(seconds=10*i)).strftime('%Y%m%d%H%M%S')
+                line = '%s;%s,%d,%d,%d,%.3f,%.3f,%d,0,%d,%s,\n' % (
+                    stamp,apu,error_code[i],temperature[i],ndrops[i],rain[i],dbz[i],
+                    20000,wxcode[i],','.join(map(str,matrix[i])))
+                if bad[i]:
+                    line = line[0:len(line)//2]+'\n'
+                f.write(line)
+                ntelegrams += 1
+        files.append(filename)
+    return files,ntelegrams
+
+
+def write_iowa_packets(outdir,gauge='NASA0043',date='20151101',seed=0,tips_per_day=2000,
+                       duplicate_fraction=0.2,packet_minutes=15):
+    '''
+    Writes the packets of one synthetic gauge-day (and the first packet of
+    the next day) to outdir as gauge_nnn.txt
+    Returns the list of files written and the number of tip lines
+    '''
+    rng = np.random.RandomState(seed)
+    day = datetime.datetime.strptime(date,'%Y%m%d')
+    npackets = 1440 // packet_minutes
+    #tips cluster in showers: the tip rate varies between 15-minute periods
+    rate = np.repeat(rng.gamma(0.7,1.,size=96),15*60)
+    weights = rate / rate.sum()
+    seconds = np.sort(rng.choice(86400,size=tips_per_day,p=weights))
+    channel = rng.choice([81,82],size=tips_per_day)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    files = []
+    ntips = 0
+    for k in range(npackets+1):
+        #packet k holds the tips of the 15 minutes before its time
+        t1 = (k+1)*packet_minutes*60
+        t0 = t1 - packet_minutes*60
+        if k == npackets: #first packet of the next day repeats the last tips
+            t0 = t0 - packet_minutes*60
+        sel = np.flatnonzero((seconds >= t0) & (seconds < t1))
+        dup = sel[rng.rand(len(sel)) < duplicate_fraction]
+        sel = np.sort(np.concatenate((sel,dup)))
+        lines = [gauge,(day + datetime.timedelta(seconds=t1)).strftime('%Y-%m-%d %H:%M:%S'),
+                 '47.51,-123.86','12.6,8.5,1,200,-70','time,channel']
+        for i in sel:
+            lines.append((day + datetime.timedelta(seconds=int(seconds[i]))).strftime(
+                '%Y-%m-%d %H:%M:%S')+','+str(channel[i]))
+        if k == npackets: #plus tips of the next day, removed by clean_data
+            for sec in np.sort(rng.randint(86400,t1,size=3)):
+                lines.append((day + datetime.timedelta(seconds=int(sec))).strftime(
+                    '%Y-%m-%d %H:%M:%S')+','+str(rng.choice([81,82])))
+        filename = os.path.join(outdir,gauge+'_%03d.txt' % k)
+        with open(filename,'w') as f:
+            f.write('\n'.join(lines)+'\n')
+        files.append(filename)
+        ntips += len(lines) - 5
+    return files,ntips
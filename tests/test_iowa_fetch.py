@@ -0,0 +1,154 @@
+'''
+Tests of IowaFetch.PacketFetcher and save_iowa_gauge against a local web
+server (SimpleHTTPServer) serving a fake sensors tree of synthetic packets
+(see benchmarks/synthetic.py)
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import SocketServer
+import BaseHTTPServer
+import SimpleHTTPServer
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Gauge'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import IowaFetch
+import IowaGaugeRaw as igr
+
+gauge = 'NASA0043'
+dates = ['20151101','20151102']
+
+
+class ThreadingServer(SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(root,log):
+    #request handler serving root, (method, path) of each request is appended to log
+    class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' #keep-alive
+        wbufsize = -1 #headers and body in one write
+        disable_nagle_algorithm = True
+
+        def translate_path(self,path):
+            local = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(self,path)
+            return os.path.join(root,os.path.relpath(local,os.getcwd()))
+
+        def send_head(self):
+            log.append((self.command,self.path))
+            return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+
+        def log_message(self,*args):
+            pass
+    return Handler
+
+
+class TestPacketFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='pyolympex_test_')
+        root = os.path.join(self.workdir,'server')
+        self.packets = {}
+        for seed,date in enumerate(dates):
+            daydir = os.path.join(root,'sensors',gauge,date[0:4],date[4:6],date[6:8])
+            files,ntips = synthetic.write_iowa_packets(daydir,gauge=gauge,date=date,seed=seed,
+                                                       tips_per_day=300)
+            self.packets[date] = files
+        self.log = []
+        self.server = ThreadingServer(('127.0.0.1',0),make_handler(root,self.log))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/sensors/' % self.server.server_address[1]
+        self.fetcher = IowaFetch.PacketFetcher(server=self.url,max_workers=3,timeout=5,
+                                               retries=1,backoff=0.01)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.workdir)
+
+    def packet_gets(self):
+        #packet downloads (GET of a file, not of a listing) in the log
+        return [path for method,path in self.log if method == 'GET' and not path.endswith('/')]
+
+    def test_fetch_bodies(self):
+        bodies = self.fetcher.fetch_bodies(gauge,dates)
+        expected = sorted([(os.path.basename(f),open(f).read())
+                           for date in dates for f in self.packets[date]])
+        self.assertEqual(bodies,expected)
+
+    def test_fetch_skips_local_packets(self):
+        localdir = os.path.join(self.workdir,'local')
+        files = self.fetcher.fetch(gauge,dates,localdir)
+        npackets = sum([len(self.packets[date]) for date in dates])
+        self.assertEqual(len(files),npackets)
+        self.assertEqual(len(self.packet_gets()),npackets)
+        for date in dates:
+            for f in self.packets[date]:
+                local = os.path.join(localdir,gauge,date,os.path.basename(f)+'.txt')
+                self.assertEqual(open(local).read(),open(f).read())
+
+        #a rerun only checks the sizes
+        del self.log[:]
+        self.assertEqual(self.fetcher.fetch(gauge,dates,localdir),files)
+        self.assertEqual(self.packet_gets(),[])
+        self.assertEqual(len([m for m,p in self.log if m == 'HEAD']),npackets)
+
+        #a packet that changed on the server is downloaded again
+        with open(self.packets[dates[0]][3],'a') as f:
+            f.write('2015-11-01 23:59:59,81\n')
+        del self.log[:]
+        self.fetcher.fetch(gauge,dates[0:1],localdir)
+        self.assertEqual(len(self.packet_gets()),1)
+        self.assertEqual([name for name in os.listdir(os.path.join(localdir,gauge,dates[0]))
+                          if name.endswith('.part')],[])
+
+    def test_connections_reused_and_closed(self):
+        self.fetcher.fetch_bodies(gauge,dates[0:1])
+        pool = self.fetcher._pool
+        self.fetcher.fetch_bodies(gauge,dates[1:2])
+        self.assertTrue(self.fetcher._pool is pool)
+        conns = list(self.fetcher._conns)
+        #one connection per download thread, plus the one used for the listings
+        self.assertTrue(0 < len(conns) <= self.fetcher.max_workers + 1)
+        self.fetcher.close()
+        self.assertTrue(self.fetcher._pool is None)
+        self.assertEqual(self.fetcher._conns,[])
+        self.assertTrue(all([conn.sock is None for conn in conns]))
+        #a closed fetcher can be used again
+        with IowaFetch.PacketFetcher(server=self.url,max_workers=2) as fetcher:
+            self.assertEqual(len(fetcher.fetch_bodies(gauge,dates[0:1])),len(self.packets[dates[0]]))
+        self.assertTrue(fetcher._pool is None)
+
+    def test_missing_day(self):
+        self.assertRaises(IOError,self.fetcher.fetch_bodies,gauge,['20151103'])
+
+    def test_save_iowa_gauge(self):
+        #packets in memory and in a local directory give the same daily files
+        outputs = []
+        for name,tmpdir in [('memory',None),('disk',os.path.join(self.workdir,'local'))]:
+            outdir = os.path.join(self.workdir,name)+'/'
+            igr.save_iowa_gauge(dates[0],gauge,outdir,outdir+'meta/',nextdate=dates[1],
+                                tmpdir=tmpdir,fetcher=self.fetcher)
+            files = [igr.gauge_filename(gauge,dates[0],bucket,outdir) for bucket in 'AB']
+            outputs.append([open(f).read() for f in files])
+        self.assertEqual(outputs[0],outputs[1])
+        self.assertTrue(len(outputs[0][0].splitlines()) > 1)
+        #the rerun takes the packets from the local directory
+        del self.log[:]
+        igr.save_iowa_gauge(dates[0],gauge,outdir,outdir+'meta/',nextdate=dates[1],
+                            tmpdir=os.path.join(self.workdir,'local'),fetcher=self.fetcher)
+        self.assertEqual(self.packet_gets(),[])
+
+
+if __name__ == '__main__':
+    unittest.main()
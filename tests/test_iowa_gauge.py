@@ -0,0 +1,122 @@
+'''
+Tests of the Iowa gauge rain rates against a direct count of the tips in
+each interval, and of the time slicing and alignment of the tips
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Gauge'))
+import IowaGaugeRaw as igr
+
+
+def synthetic_gauge(ntips=1000,seed=0):
+    #IowaGaugeRaw for 20151101 with random tips (a few outside the day)
+    rng = np.random.RandomState(seed)
+    rawgauge = igr.IowaGaugeRaw('NASA0043','20151101')
+    day = np.datetime64('2015-11-01T00:00:00')
+    for bucket in 'ab':
+        seconds = np.sort(rng.randint(-600,86400+600,ntips))
+        setattr(rawgauge,'time_'+bucket,day + seconds.astype('timedelta64[s]'))
+    return rawgauge
+
+
+def loop_accum(tips,start,end,interval,nbins):
+    #rain in each interval from the tips between its start and end (the last one ends at end)
+    accum = np.zeros(nbins)
+    length = np.timedelta64(int(round(interval*60)),'s')
+    for i in range(nbins):
+        first = start + i*length
+        last = min(first + length,end)
+        accum[i] = np.count_nonzero((tips >= first) & (tips < last)) * igr.tip_depth
+    return accum
+
+
+class TestRainRates(unittest.TestCase):
+
+    def setUp(self):
+        self.rawgauge = synthetic_gauge()
+
+    def check(self,rates,interval,start,end):
+        length = np.timedelta64(int(round(interval*60)),'s')
+        nbins = int(-(-(end - start).astype(np.int64) // length.astype(np.int64)))
+        self.assertEqual(len(rates.time),nbins)
+        self.assertEqual(rates.time[0],start)
+        np.testing.assert_array_equal(np.diff(rates.time),length)
+        for bucket in 'ab':
+            expected = loop_accum(getattr(self.rawgauge,'time_'+bucket),start,end,interval,nbins)
+            np.testing.assert_allclose(getattr(rates,'accum_'+bucket),expected)
+            np.testing.assert_allclose(getattr(rates,'rate_'+bucket),expected*60./interval)
+
+    def test_intervals(self):
+        #default range: the days with tips, 7 and 0.75 min leave a partial last interval
+        intervals = [0.75,5,7,30,60,1440]
+        rates = self.rawgauge.rain_rates(intervals)
+        self.assertEqual(sorted(rates.keys()),intervals)
+        start = np.datetime64('2015-10-31T00:00:00')
+        end = np.datetime64('2015-11-03T00:00:00')
+        for interval in intervals:
+            self.check(rates[interval],interval,start,end)
+
+    def test_range(self):
+        start = np.datetime64('2015-11-01T06:10:00')
+        end = np.datetime64('2015-11-01T09:00:00')
+        rates = self.rawgauge.rain_rates(45,start=start,end=end)
+        self.check(rates,45,start,end)
+
+    def test_bad_interval(self):
+        self.assertRaises(ValueError,self.rawgauge.rain_rates,[0,5])
+        self.assertRaises(ValueError,self.rawgauge.rain_rates,1.e-3)
+
+
+
+class TestTimeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.rawgauge = synthetic_gauge(ntips=200)
+
+    def test_time_slice(self):
+        start,end = '2015-11-01T06:00','2015-11-01T12:00'
+        part = self.rawgauge.time_slice(start,end)
+        times = self.rawgauge.time_a
+        inside = (times >= np.datetime64(start)) & (times < np.datetime64(end))
+        np.testing.assert_array_equal(part.time_a,times[inside])
+        self.assertTrue(part.time_a.base is not None) #a view
+        #unsorted tips (packet order) keep their order
+        self.rawgauge.tip_time = self.rawgauge.time_b[::-1]
+        self.rawgauge.tip_channel = np.arange(len(self.rawgauge.tip_time))
+        part = self.rawgauge.time_slice(start,end)
+        inside = (self.rawgauge.tip_time >= np.datetime64(start)) & \
+                 (self.rawgauge.tip_time < np.datetime64(end))
+        np.testing.assert_array_equal(part.tip_time,self.rawgauge.tip_time[inside])
+        np.testing.assert_array_equal(part.tip_channel,self.rawgauge.tip_channel[inside])
+
+    def test_nearest_tip(self):
+        tips = self.rawgauge.time_b
+        targets = np.datetime64('2015-11-01T00:00:00') + \
+                  np.arange(0,86400,977).astype('timedelta64[s]')
+        nearest = self.rawgauge.nearest_tip(targets,bucket='b')
+        distance = np.abs((tips[np.newaxis,:] - targets[:,np.newaxis]).astype(np.int64))
+        np.testing.assert_array_equal(distance[np.arange(len(targets)),nearest],distance.min(axis=1))
+        self.assertEqual(self.rawgauge.nearest_tip(targets[3],bucket='b'),nearest[3])
+        far = self.rawgauge.nearest_tip(targets,bucket='b',tolerance=60)
+        np.testing.assert_array_equal(far == -1,distance.min(axis=1) > 60)
+
+    def test_align_to(self):
+        #on a regular grid, the same as rain_rates
+        rates = self.rawgauge.rain_rates(30)
+        aligned = self.rawgauge.align_to(rates.time,30)
+        np.testing.assert_allclose(aligned.accum_a,rates.accum_a)
+        np.testing.assert_allclose(aligned.accum_b,rates.accum_b)
+        #a grid with gaps only counts the tips inside its intervals
+        grid = rates.time[::3]
+        aligned = self.rawgauge.align_to(grid,30)
+        np.testing.assert_allclose(aligned.accum_a,rates.accum_a[::3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+'''
+Test that the compressed archive (ParsivelArchive) gives back exactly the
+arrays read_parsivel reads from the .dat files (synthetic APU files, see
+benchmarks/synthetic.py)
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import RawParsivel as rp
+import ParsivelCache as pc
+import ParsivelArchive as pa
+
+dates = ['20151208','20151209']
+
+
+class TestParsivelArchive(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp(prefix='pyolympex_test_')
+        cls.archive = os.path.join(cls.workdir,'archive')+'/'
+        cls.outdir = os.path.join(cls.workdir,'telegrams')
+        daydir = os.path.join(cls.archive,'apu06','Parsivel','201512')
+        cls.files = {}
+        for seed,date in enumerate(dates):
+            files,ntelegrams = synthetic.write_parsivel_day(daydir,date=date,seed=seed,
+                                                            bad_fraction=0.01)
+            cls.files[date] = files
+        cls.results,cls.errors = pa.convert_archive(cls.archive,cls.outdir,processes=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workdir)
+
+    def assertSameArrays(self,raw,expected):
+        for name in pc.cached_arrays:
+            self.assertEqual(getattr(raw,name).dtype,getattr(expected,name).dtype,msg=name)
+            np.testing.assert_array_equal(getattr(raw,name),getattr(expected,name),err_msg=name)
+        self.assertEqual(raw.apu,expected.apu)
+        self.assertEqual(raw.bad_lines,expected.bad_lines)
+
+    def test_convert(self):
+        self.assertEqual(self.errors,{})
+        self.assertEqual(sorted(self.results.keys()),[('apu06',date) for date in dates])
+        #unchanged days are skipped
+        results,errors = pa.convert_archive(self.archive,self.outdir,processes=1)
+        self.assertEqual((results,errors),({},{}))
+
+    def test_read_day(self):
+        for date in dates:
+            expected = rp.read_parsivel(self.files[date],use_cache=False)
+            self.assertTrue(expected.bad_lines > 0)
+            self.assertSameArrays(pa.read_day('apu06',date,self.outdir),expected)
+        self.assertRaises(IOError,pa.read_day,'apu06','20151210',self.outdir)
+
+    def test_read_archive(self):
+        #sub-day slice inside a chunk boundary, and a range across midnight
+        for start,end in [('2015-12-08T03:20','2015-12-08T05:40'),
+                          ('2015-12-08T22:30','2015-12-09T01:10')]:
+            files = [f for date in dates for f in self.files[date]]
+            expected = rp.read_parsivel(files,use_cache=False)
+            inside = (expected.time >= np.datetime64(start)) & (expected.time < np.datetime64(end))
+            raw = pa.read_archive('apu06',start,end,self.outdir)
+            for name in pc.cached_arrays:
+                self.assertEqual(getattr(raw,name).dtype,getattr(expected,name).dtype)
+                np.testing.assert_array_equal(getattr(raw,name),getattr(expected,name)[inside],
+                                              err_msg=name)
+            self.assertTrue(len(raw.time) > 0)
+            self.assertEqual(raw.apu,expected.apu)
+            #bad lines of the chunks that were read: the hourly files of the range
+            hours = [f for f in files if start.replace('-','').replace('T','')[0:10] <=
+                     os.path.basename(f)[-14:-4] <= end.replace('-','').replace('T','')[0:10]]
+            self.assertEqual(raw.bad_lines,rp.read_parsivel(hours,use_cache=False).bad_lines)
+        self.assertRaises(IOError,pa.read_archive,'apu06','2015-12-10','2015-12-11',self.outdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
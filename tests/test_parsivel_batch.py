@@ -0,0 +1,99 @@
+'''
+Test that iter_dsd, which averages one chunk of files at a time and carries
+the open interval over to the next chunk, gives the same intervals as
+averaging the whole range at once (synthetic APU files, see
+benchmarks/synthetic.py)
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelCache as pc
+import ParsivelDSD as pdsd
+import ParsivelQC as pqc
+import ParsivelBatch as pb
+
+dates = ['20151208','20151209']
+
+
+class TestIterDSD(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.archive = tempfile.mkdtemp(prefix='pyolympex_test_')+'/'
+        cls.cache_dir = pc.CACHE_DIR
+        pc.CACHE_DIR = os.path.join(cls.archive,'cache')
+        daydir = os.path.join(cls.archive,'apu06','Parsivel','201512')
+        for seed,date in enumerate(dates):
+            files,ntelegrams = synthetic.write_parsivel_day(daydir,date=date,seed=seed,
+                                                            bad_fraction=0.)
+        #error codes in the last 10 minutes of the range
+        with open(files[-1]) as f:
+            lines = f.readlines()
+        for i in range(len(lines)-60,len(lines)):
+            head,rest = lines[i].split(',',1)
+            lines[i] = head+',3,'+rest.split(',',1)[1]
+        with open(files[-1],'w') as f:
+            f.writelines(lines)
+
+    @classmethod
+    def tearDownClass(cls):
+        pc.CACHE_DIR = cls.cache_dir
+        shutil.rmtree(cls.archive)
+
+    def whole_range(self,time_interval,qc):
+        files = []
+        for date in dates:
+            files.extend(pdsd.apu_files('apu06',date,archive=self.archive))
+        raw = rp.read_parsivel(files)
+        dsd = pdsd.ParsivelDSD(pp.process_parsivel(raw,time_interval=time_interval,qc=qc))
+        dsd.get_precip_params()
+        return dsd
+
+    def check(self,time_interval,chunk,qc=None):
+        expected = self.whole_range(time_interval,qc)
+        dsds = list(pb.iter_dsd('apu06',dates[0],dates[-1],time_interval=time_interval,
+                                chunk=chunk,archive=self.archive,qc=qc))
+        self.assertTrue(len(dsds) > 1)
+        proc = expected.proc_p2
+        np.testing.assert_array_equal(np.concatenate([dsd.time for dsd in dsds]),proc.time)
+        for name in ['num_records','valid','counts']:
+            np.testing.assert_array_equal(np.concatenate([getattr(dsd.proc_p2,name) for dsd in dsds]),
+                                          getattr(proc,name),err_msg=name)
+        for name in ['error_code','temperature','wxcode']:
+            np.testing.assert_allclose(np.concatenate([getattr(dsd.proc_p2,name) for dsd in dsds]),
+                                       getattr(proc,name),rtol=1.e-12,err_msg=name)
+        np.testing.assert_allclose(np.concatenate([dsd.rainrate[0] for dsd in dsds]),
+                                   expected.rainrate[0],rtol=1.e-10)
+        return proc
+
+    def test_carry(self):
+        #7 min intervals cross midnight (and hours)
+        for chunk in ['day','hour']:
+            proc = self.check(7,chunk)
+            self.assertTrue(proc.valid[-1])
+
+    def test_carry_qc(self):
+        qc = pqc.ParsivelQC(rain_temperature=5,snow_temperature=-2,max_error_code=0)
+        for chunk in ['day','hour']:
+            proc = self.check(7,chunk,qc=qc)
+            self.assertFalse(proc.valid[-1])
+        #trailing intervals with only bad telegrams
+        proc = self.check(0.5,'day',qc=qc)
+        self.assertEqual(proc.time[-1],np.datetime64('2015-12-09T23:59:30'))
+        self.assertTrue((proc.num_records[-20:] == 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+Tests of the memory-mapped Parsivel cache (ParsivelCache) on synthetic APU
+files (see benchmarks/synthetic.py)
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import RawParsivel as rp
+import ParsivelCache as pc
+import PipelineStats as ps
+
+
+class TestParsivelCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp(prefix='pyolympex_test_')
+        files,ntelegrams = synthetic.write_parsivel_day(cls.datadir,bad_fraction=0.01,
+                                                        missing_hours=0)
+        cls.sources = files[0:2]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.datadir)
+
+    def setUp(self):
+        #fresh copies of the APU files, the tests change them
+        self.workdir = tempfile.mkdtemp(prefix='pyolympex_test_')
+        self.cache_dir = os.path.join(self.workdir,'cache')
+        self.files = []
+        for source in self.sources:
+            self.files.append(os.path.join(self.workdir,os.path.basename(source)))
+            shutil.copy2(source,self.files[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read(self,files=None):
+        #RawParsivel through the cache, and whether it was a cache hit
+        stats = ps.PipelineStats()
+        raw = rp.read_parsivel(files or self.files,cache_dir=self.cache_dir,stats=stats)
+        return raw,stats.counts.get('cache_hits',0) == 1
+
+    def assertSameArrays(self,raw,expected):
+        for name in pc.cached_arrays:
+            self.assertEqual(getattr(raw,name).dtype,getattr(expected,name).dtype)
+            np.testing.assert_array_equal(getattr(raw,name),getattr(expected,name))
+        self.assertEqual(raw.apu,expected.apu)
+        self.assertEqual(raw.bad_lines,expected.bad_lines)
+
+    def touch(self,filename,seconds=10):
+        st = os.stat(filename)
+        os.utime(filename,(st.st_atime,st.st_mtime+seconds))
+
+    def test_hit(self):
+        expected = rp.read_parsivel(self.files,use_cache=False)
+        self.assertTrue(expected.bad_lines > 0)
+        raw,hit = self.read()
+        self.assertFalse(hit)
+        self.assertSameArrays(raw,expected)
+        raw,hit = self.read()
+        self.assertTrue(hit)
+        self.assertSameArrays(raw,expected)
+        for name in pc.cached_arrays:
+            self.assertTrue(isinstance(getattr(raw,name),np.memmap))
+            self.assertFalse(getattr(raw,name).flags.writeable)
+
+    def test_invalidated_by_mtime(self):
+        self.read()
+        self.touch(self.files[1])
+        raw,hit = self.read()
+        self.assertFalse(hit)
+        self.assertTrue(self.read()[1])
+
+    def test_invalidated_by_size(self):
+        raw,hit = self.read()
+        with open(self.files[1]) as f:
+            line = f.readline()
+        #the same telegram 10 minutes after the end of the file
+        stamp = str(int(raw.time.max().astype(object).strftime('%Y%m%d%H%M%S')) + 1000)
+        with open(self.files[1],'a') as f:
+            f.write(stamp+line[14:])
+        raw,hit = self.read()
+        self.assertFalse(hit)
+        self.assertSameArrays(raw,rp.read_parsivel(self.files,use_cache=False))
+
+    def test_stale_entry_removed_on_save(self):
+        self.read()
+        self.read(self.files[0:1]) #another entry of the same APU-day
+        self.assertEqual(len(os.listdir(self.cache_dir)),2)
+        #both hours changed: rewriting the first hour removes the stale entry of both
+        self.touch(self.files[1])
+        self.touch(self.files[0])
+        self.read(self.files[0:1])
+        self.assertEqual(os.listdir(self.cache_dir),
+                         [os.path.basename(pc.cache_path(self.files[0:1],self.cache_dir))])
+
+    def test_prune(self):
+        entries = [self.files[0:1],self.files[1:2],self.files]
+        for files in entries:
+            self.read(files)
+        paths = [pc.cache_path(files,self.cache_dir) for files in entries]
+        #oldest use first
+        now = time.time()
+        for age,path in zip([3,2,1],paths):
+            os.utime(os.path.join(path,'manifest.json'),(now-age*86400,now-age*86400))
+        self.assertEqual(pc.prune(self.cache_dir),(0,0))
+
+        #entries not used for 2.5 days
+        size = pc._entry_size(paths[0])
+        self.assertEqual(pc.prune(self.cache_dir,max_age_days=2.5),(1,size))
+        self.assertFalse(os.path.exists(paths[0]))
+
+        #least recently used until the cache fits
+        size = pc._entry_size(paths[1])
+        self.assertEqual(pc.prune(self.cache_dir,max_bytes=pc._entry_size(paths[2])),(1,size))
+        self.assertEqual(os.listdir(self.cache_dir),[os.path.basename(paths[2])])
+
+        #stale entries, the day loads from the .dat files again
+        self.touch(self.files[0])
+        self.assertEqual(pc.prune(self.cache_dir)[0],1)
+        self.assertEqual(os.listdir(self.cache_dir),[])
+        self.assertEqual(pc.prune(os.path.join(self.workdir,'none')),(0,0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+'''
+Tests of the ParsivelConfig bin tables and conditional masks
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+import ParsivelConfig as pcfg
+
+
+class TestBins(unittest.TestCase):
+
+    def test_bins_tile(self):
+        for name in ['parsivel1','parsivel2']:
+            config = pcfg.get_config(name)
+            for edges,centers in [(config.diameter_edges,config.diameter),
+                                  (config.velocity_edges,config.velocity)]:
+                self.assertEqual(len(edges),33)
+                self.assertTrue(np.all(np.diff(edges) > 0))
+                self.assertTrue(np.all((centers > edges[:-1]) & (centers < edges[1:])))
+
+    def test_ott_widths(self):
+        config = pcfg.get_config('parsivel2')
+        np.testing.assert_allclose(config.diameter_edges[[0,10,15,20,25,30,32]],
+                                   [0,1.25,2.5,5,10,20,26],atol=1.e-3)
+
+    def test_gap_raises(self):
+        config = pcfg.get_config('parsivel2')
+        self.assertRaises(ValueError,config.replace,'gaps',diameter_spread=pcfg.drop_spread)
+
+
+class TestConditionalMasks(unittest.TestCase):
+
+    def setUp(self):
+        self.config = pcfg.get_config('parsivel1')
+
+    def test_remove_diameter_columns(self):
+        masks = self.config.conditional_masks([3,5])
+        full = self.config.masks.reshape((2,32,32))
+        removed = masks.reshape((2,32,32))
+        self.assertFalse(removed[:,:,3:6].any())
+        self.assertTrue(full[:,:,3:6].any())
+        np.testing.assert_array_equal(removed[:,:,:3],full[:,:,:3])
+        np.testing.assert_array_equal(removed[:,:,6:],full[:,:,6:])
+        self.assertTrue(self.config.conditional_masks((3,5)) is masks)
+        self.assertFalse(masks.flags.writeable)
+
+    def test_bad_remove_bins(self):
+        for remove_bins in [[3],5,[5,3],[0,32],[-1,2],['a',1]]:
+            self.assertRaises(ValueError,self.config.conditional_masks,remove_bins)
+        self.assertTrue(all([isinstance(key,tuple) and len(key) == 2
+                             for key in self.config._removed_masks]))
+
+
+if __name__ == '__main__':
+    unittest.main()
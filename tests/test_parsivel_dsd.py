@@ -0,0 +1,153 @@
+'''
+Regression test of ParsivelDSD.get_precip_params against the original
+time x diameter x velocity loop, on synthetic telegrams (see
+benchmarks/synthetic.py), and of the float matrix of ProcessParsivel
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelDSD as pdsd
+
+
+def synthetic_raw(ntelegrams=360,seed=0,gap_fraction=0.,missing_block=None):
+    '''
+    RawParsivel object with ntelegrams synthetic 10 s telegrams from midnight
+    gap_fraction: fraction of telegrams removed at random
+    missing_block: (first,last) telegrams removed (whole intervals missing)
+    '''
+    rng = np.random.RandomState(seed)
+    kind = synthetic.weather_periods(ntelegrams,rng,rain_fraction=0.6,snow_fraction=0.2)
+    keep = rng.rand(ntelegrams) >= gap_fraction
+    if missing_block is not None:
+        keep[missing_block[0]:missing_block[1]] = False
+    raw = rp.RawParsivel()
+    raw.apu = 'apu06'
+    raw.time = (np.datetime64('2015-12-08T00:00:00') +
+                (10*np.arange(ntelegrams)).astype('timedelta64[s]'))[keep]
+    raw.matrix = synthetic.parsivel_matrices(kind,rng).astype(np.uint16)[keep]
+    raw.wxcode = np.where(kind == 1,63,np.where(kind == 2,73,0))[keep]
+    raw.temperature = np.where(kind == 2,-1,5)[keep]
+    raw.error_code = np.zeros(len(raw.time),dtype=int)
+    raw.ndrops = raw.matrix.sum(axis=1).astype(int)
+    raw.rain = np.zeros(len(raw.time))
+    raw.dbz = np.zeros(len(raw.time))
+    raw.visibility = np.zeros(len(raw.time),dtype=int)
+    return raw
+
+
+def loop_params(processed):
+    '''
+    DSD parameters with the per-record, per-bin loop that get_precip_params
+    used before it was vectorized (Tokay et al. 2014, equation 6)
+    '''
+    config = processed.config
+    ntime = len(processed.time)
+    out = dict([(name,np.zeros((ntime,32))) for name in ['dsd','drop_conc','lwc','z','rainrate']])
+    out['dmax'] = np.zeros(ntime)
+    out['dm'] = np.zeros(ntime)
+    out['dbz'] = np.zeros(ntime)
+    out['moments'] = np.zeros((ntime,8))
+    timerain = processed.time_interval
+    nrecords_exp = timerain*6
+    nrecords_missing = (nrecords_exp - np.array(processed.num_records)).astype(float)
+    for td in range(ntime):
+        time_mult = 60 * timerain - nrecords_missing[td]*10 #units: seconds
+        time_div = 60 / (timerain - (nrecords_missing[td]/6)) #units: s/min
+        matrix = np.reshape(processed.matrix[td,:],(32,32))
+        for dind,dbin in enumerate(config.diameter):
+            for vind,vbin in enumerate(config.fall_speed):
+                drops = matrix[vind,dind]
+                p2_area = 180.*(30.-(dbin/2.))
+                denom2 = time_mult * p2_area * vbin * config.diameter_spread[dind]
+                out['dsd'][td,dind] += (1.e6 * drops)/denom2
+                denominator = time_mult * p2_area * vbin
+                vol = np.pi*dbin**3/6
+                if drops > 0: out['dmax'][td] = dbin
+                out['drop_conc'][td,dind] += drops*1.e6/denominator
+                out['lwc'][td,dind] += drops*vol*1.e3/denominator
+                out['z'][td,dind] += drops * 1.e6 * dbin**6/denominator
+                out['rainrate'][td,dind] += drops * vol / p2_area *time_div
+                if drops > 0:
+                    for ind in range(8):
+                        out['moments'][td,ind] += 1.e6 * drops * dbin**ind / denominator
+        out['dm'][td] = out['moments'][td,4] / out['moments'][td,3]
+        z = np.sum(out['z'][td,:])
+        out['dbz'][td] = 10 * np.log10(z) if z > 0 else float('nan')
+    return out
+
+
+class TestPrecipParams(unittest.TestCase):
+
+    def check(self,raw,time_interval,remove_missing=True):
+        processed = pp.ProcessParsivel(raw)
+        processed.apply_matrix()
+        processed.time_averaging(time_interval,remove_missing=remove_missing)
+        dsd = pdsd.ParsivelDSD(processed)
+        dsd.get_precip_params(pdsd.ParsivelDSD.products)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            expected = loop_params(processed)
+        self.assertTrue(len(dsd.time) > 0)
+        for name in ['drop_conc','lwc','z','rainrate']:
+            np.testing.assert_allclose(getattr(dsd,name)[1],expected[name],rtol=1e-10,err_msg=name)
+            np.testing.assert_allclose(getattr(dsd,name)[0],np.sum(expected[name],axis=1),
+                                       rtol=1e-10,err_msg=name+' total')
+        for name in ['dsd','dbz','dmax','dm','moments']:
+            np.testing.assert_allclose(getattr(dsd,name),expected[name],rtol=1e-10,err_msg=name)
+        return processed
+
+    def test_complete(self):
+        raw = synthetic_raw()
+        for time_interval in [0.5,1,2]:
+            processed = self.check(raw,time_interval)
+            self.assertTrue(processed.valid.all())
+
+    def test_missing_intervals(self):
+        #missing telegrams make their intervals NaN
+        raw = synthetic_raw(seed=1,gap_fraction=0.05,missing_block=(100,160))
+        for time_interval in [0.5,1,2]:
+            processed = self.check(raw,time_interval)
+            self.assertFalse(processed.valid.all())
+
+    def test_partial_intervals(self):
+        #remove_missing = False keeps intervals with fewer telegrams
+        raw = synthetic_raw(seed=2,gap_fraction=0.1,missing_block=(100,160))
+        for time_interval in [0.5,1,2]:
+            processed = self.check(raw,time_interval,remove_missing=False)
+            self.assertTrue(np.any(np.asarray(processed.num_records) < time_interval*6))
+
+
+class TestFloatMatrix(unittest.TestCase):
+
+    def test_matrix(self):
+        raw = synthetic_raw(seed=1,missing_block=(100,160))
+        processed = pp.process_parsivel(raw,time_interval=1)
+        matrix = processed.matrix
+        self.assertTrue(processed.matrix is matrix)
+        self.assertFalse(matrix.flags.writeable)
+        self.assertTrue(np.isnan(matrix[~processed.valid]).all())
+        np.testing.assert_array_equal(matrix[processed.valid],processed.counts[processed.valid])
+        #as_float is a new writable copy every time
+        copy = processed.as_float()
+        np.testing.assert_array_equal(copy,matrix)
+        copy[:] = 0
+        self.assertFalse(processed.as_float() is copy)
+        np.testing.assert_array_equal(processed.as_float(),matrix)
+        #new averages give a new matrix
+        processed.time_averaging(2)
+        self.assertEqual(len(processed.matrix),len(processed.time))
+        part = processed.time_slice(processed.time[5],processed.time[10])
+        np.testing.assert_array_equal(part.matrix,processed.matrix[5:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+'''
+Test that ParsivelStream gives the same intervals as the batch processing
+of the same APU files, with and without QC (synthetic files, see
+benchmarks/synthetic.py)
+
+python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(here,'..','Parsivel'))
+sys.path.insert(0,os.path.join(here,'..','benchmarks'))
+import synthetic
+import RawParsivel as rp
+import ProcessParsivel as pp
+import ParsivelDSD as pdsd
+import ParsivelQC as pqc
+import ParsivelRealtime as prt
+
+
+class TestParsivelStream(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.archive = tempfile.mkdtemp(prefix='pyolympex_test_')+'/'
+        daydir = os.path.join(cls.archive,'apu06','Parsivel','201512')
+        files,ntelegrams = synthetic.write_parsivel_day(daydir,seed=3,error_fraction=0.2,
+                                                        missing_hours=0)
+        #three hours, with a gap in the middle one
+        for f in files[3:]:
+            os.remove(f)
+        with open(files[1]) as f:
+            lines = f.readlines()
+        with open(files[1],'w') as f:
+            f.writelines(lines[0:100] + lines[160:])
+        cls.files = files[0:3]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.archive)
+
+    def check(self,time_interval,qc=None):
+        raw = rp.read_parsivel(self.files,use_cache=False)
+        batch = pdsd.ParsivelDSD(pp.process_parsivel(raw,time_interval=time_interval,qc=qc))
+        batch.get_precip_params()
+
+        stream = prt.ParsivelStream('apu06',time_interval=time_interval,archive=self.archive,
+                                    start=datetime.datetime(2015,12,8),qc=qc)
+        streamed = stream.poll()
+        self.assertEqual(stream.bad_lines,raw.bad_lines)
+        self.assertEqual(len(streamed),len(batch.time))
+        proc = batch.proc_p2
+        np.testing.assert_array_equal([dsd.time[0] for dsd in streamed],proc.time)
+        for name in ['num_records','valid','counts']:
+            np.testing.assert_array_equal([getattr(dsd.proc_p2,name)[0] for dsd in streamed],
+                                          getattr(proc,name))
+        for name in ['error_code','temperature','wxcode']:
+            np.testing.assert_allclose([getattr(dsd.proc_p2,name)[0] for dsd in streamed],
+                                       getattr(proc,name),rtol=1.e-12)
+        np.testing.assert_allclose([dsd.rainrate[0][0] for dsd in streamed],batch.rainrate[0],
+                                   rtol=1.e-10)
+        np.testing.assert_allclose([dsd.dbz[0] for dsd in streamed],batch.dbz,rtol=1.e-10)
+        return proc
+
+    def test_no_qc(self):
+        for time_interval in [1,7]:
+            self.check(time_interval)
+
+    def test_qc(self):
+        qc = pqc.ParsivelQC(min_duration=120,rain_temperature=5,snow_temperature=-2,
+                            max_error_code=0)
+        for time_interval in [1,7]:
+            proc = self.check(time_interval,qc=qc)
+            self.assertTrue(proc.qc_mask.bad.any())
+            self.assertTrue(proc.qc_mask.phase_changed.any())
+
+
+class TestQCStream(unittest.TestCase):
+
+    def test_same_as_apply(self):
+        #random series with gaps and phase flips, telegram by telegram
+        rng = np.random.RandomState(1)
+        for trial in range(100):
+            n = rng.randint(1,200)
+            steps = np.where(rng.rand(n) < 0.05,rng.randint(11,200,n),10)
+            time = np.datetime64('2015-12-08T00:00:00') + np.cumsum(steps).astype('timedelta64[s]')
+            wxcode = np.repeat(rng.choice([0,63,73],size=n),rng.randint(1,8,n))[0:n]
+            temperature = rng.randint(-4,8,n)
+            error_code = rng.choice([0,0,0,1],n)
+            qc = pqc.ParsivelQC(min_duration=rng.choice([0,30,60,120]),
+                                rain_temperature=rng.choice([None,5]),
+                                snow_temperature=rng.choice([None,-2]),
+                                max_error_code=rng.choice([None,0]))
+            mask = qc.apply(time,wxcode,temperature,error_code)
+            stream = pqc.QCStream(qc)
+            decided = []
+            for i in range(n):
+                decided.extend(stream.add(time[i],wxcode[i],temperature[i],error_code[i],i))
+            decided.extend(stream.flush())
+            self.assertEqual(stream.pending(),0)
+            self.assertEqual([d[0] for d in decided],range(n))
+            np.testing.assert_array_equal([d[1] for d in decided],mask.frozen)
+            np.testing.assert_array_equal([d[2] for d in decided],mask.bad)
+
+
+if __name__ == '__main__':
+    unittest.main()